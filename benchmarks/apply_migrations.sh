@@ -0,0 +1,8 @@
+#!/bin/sh
+# Runs in the db container on its first start, after schema.sql (see docker-compose.yml).
+# psql sends statements one at a time, so CREATE INDEX CONCURRENTLY works.
+set -e
+for migration in /migrations/*.sql; do
+    echo "Applying $migration"
+    psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" -f "$migration"
+done
@@ -0,0 +1,34 @@
+"""
+    Concurrent requests per worker on the endpoints moved to the async database layer.
+
+    Start a single worker (`uvicorn main:app --workers 1`) on the commit you want to
+    measure, then run:
+
+        python benchmarks/async_db.py --token <user token> --concurrency 64
+
+    Run it once on the commit before the async layer and once after to compare.
+"""
+import asyncio
+
+from common import auth_headers, make_parser, print_results, run_load
+
+
+async def main(args):
+    headers = auth_headers(args.token)
+    location = {"latitude": 34.0522, "longitude": -118.2437, "radius_in_meters": 5000}
+
+    scenarios = {
+        "POST /getNearbyGyms": lambda client, i: client.post("/getNearbyGyms", json=location),
+        "GET /users/favorites": lambda client, i: client.get("/users/favorites", headers=headers),
+        "GET /guest-passes/user_id": lambda client, i: client.get("/guest-passes/user_id", headers=headers),
+        "GET /users/pass-usage": lambda client, i: client.get("/users/pass-usage", headers=headers),
+    }
+
+    results = []
+    for name, send in scenarios.items():
+        results.append(await run_load(name, args.base_url, send, args.requests, args.concurrency))
+    print_results(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(make_parser(__doc__).parse_args()))
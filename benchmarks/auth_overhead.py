@@ -0,0 +1,57 @@
+"""
+    Per-request cost of authenticating a bearer token.
+
+    In-process: times `get_current_user` with the verified-token cache cleared
+    before every call (a full `jwt.decode`, as before the cache) against warm
+    cache hits. With `--token` it also drives a hot authenticated endpoint over
+    HTTP, to run against servers before and after the change.
+
+        SECRET_KEY=... ALGORITHM=HS256 ACCESS_TOKEN_EXPIRE_MINUTES=60 python benchmarks/auth_overhead.py --calls 20000
+        python benchmarks/auth_overhead.py --token $TOKEN --base-url http://localhost:8000
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common import auth_headers, make_parser, print_results, run_load  # noqa: E402
+
+
+async def in_process(calls):
+    from routes.auth import create_access_token, get_current_user, token_cache
+
+    token = await create_access_token({"sub": "1", "firstName": "Bench", "lastName": "User", "role": "user"})
+
+    async def timed(clear):
+        start = time.perf_counter()
+        for _ in range(calls):
+            if clear:
+                token_cache.clear()
+            await get_current_user(token)
+        return (time.perf_counter() - start) / calls * 1e6
+
+    cold = await timed(clear=True)
+    warm = await timed(clear=False)
+    return {"calls": calls, "jwt_decode_us": round(cold, 2), "cached_us": round(warm, 2),
+            "speedup": round(cold / warm, 1) if warm else None}
+
+
+async def main(args):
+    print(json.dumps(await in_process(args.calls), indent=2))
+
+    if args.token:
+        headers = auth_headers(args.token)
+
+        async def favorites(client, i):
+            return await client.get("/users/favorites", headers=headers)
+
+        print_results([await run_load("GET /users/favorites", args.base_url, favorites, args.requests, args.concurrency)])
+
+
+if __name__ == "__main__":
+    parser = make_parser(__doc__)
+    parser.add_argument("--calls", type=int, default=20000)
+    asyncio.run(main(parser.parse_args()))
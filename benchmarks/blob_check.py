@@ -0,0 +1,48 @@
+"""
+    Round-trip check and timings for the shared blob storage client.
+
+    Uploads `--blobs` blobs of `--size` bytes into the gym photos container
+    under `bench/`, deletes them again and prints the per-operation timings.
+    Works against Azure or a local Azurite emulator:
+
+        docker run -p 10000:10000 mcr.microsoft.com/azure-storage/azurite azurite-blob --blobHost 0.0.0.0
+        BLOB_CONNECTION_STRING=UseDevelopmentStorage=true python benchmarks/blob_check.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from services.blob_storage import GYM_PHOTOS_CONTAINER, blob_name_from_url, blob_storage  # noqa: E402
+
+
+async def main(args):
+    await blob_storage.open()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    payload = os.urandom(args.size)
+    run = uuid.uuid4().hex
+
+    async def round_trip(i):
+        async with semaphore:
+            blob_name = f"bench/{run}/{i}.bin"
+            url = await blob_storage.upload(GYM_PHOTOS_CONTAINER, blob_name, payload)
+            assert blob_name_from_url(url, GYM_PHOTOS_CONTAINER) == blob_name, url
+            assert await blob_storage.delete(GYM_PHOTOS_CONTAINER, blob_name)
+
+    try:
+        await asyncio.gather(*(round_trip(i) for i in range(args.blobs)))
+    finally:
+        await blob_storage.close()
+    print(json.dumps(blob_storage.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--blobs", type=int, default=200)
+    parser.add_argument("--size", type=int, default=256 * 1024)
+    parser.add_argument("--concurrency", type=int, default=16)
+    asyncio.run(main(parser.parse_args()))
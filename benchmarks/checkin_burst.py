@@ -0,0 +1,64 @@
+"""
+    Morning check-in rush against POST /verify-pass.
+
+    Reads guest passes from a purchases export
+    (`GET /admin/exports/purchases?format=csv`, optionally with `gym_id`), signs
+    a QR token for each with the server's QR_SIGNING_KEYS and fires
+    `--requests` scans per gym at `--concurrency` per gym, all gyms at once.
+    Every scan records a real visit, so point it at a disposable database.
+    `--unsigned` posts the legacy unsigned payload instead, for comparison.
+
+        QR_SIGNING_KEYS=k1:secret python benchmarks/checkin_burst.py --purchases purchases.csv --concurrency 200
+"""
+import asyncio
+import csv
+import os
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common import make_parser, print_results, run_load  # noqa: E402
+from services.qr_signing import sign_pass_token  # noqa: E402
+
+
+def load_scans(path, duration, unsigned):
+    scans = defaultdict(list)
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            if row.get("is_valid", "True").lower() not in ("true", "t"):
+                continue
+            pass_id, user_id, gym_id = int(row["id"]), int(row["user_id"]), int(row["gym_id"])
+            if unsigned:
+                body = {"pass_id": pass_id, "user_id": user_id, "gym_id": gym_id, "duration": duration}
+            else:
+                body = {"token": sign_pass_token(pass_id, user_id, gym_id, duration)}
+            scans[gym_id].append(body)
+    return scans
+
+
+async def main(args):
+    scans = load_scans(args.purchases, args.duration, args.unsigned)
+    if not scans:
+        sys.exit("no valid passes in the purchases file")
+
+    def scanner(bodies):
+        async def scan(client, i):
+            return await client.post("/verify-pass", json=bodies[i % len(bodies)])
+        return scan
+
+    label = "unsigned" if args.unsigned else "signed"
+    results = await asyncio.gather(*(
+        run_load(f"POST /verify-pass gym {gym_id} ({label})", args.base_url, scanner(bodies),
+                 args.requests, args.concurrency)
+        for gym_id, bodies in sorted(scans.items())
+    ))
+    print_results(list(results))
+
+
+if __name__ == "__main__":
+    parser = make_parser(__doc__)
+    parser.add_argument("--purchases", required=True, help="CSV export of GuestPassPurchases")
+    parser.add_argument("--duration", type=int, default=1, help="pass duration in days used when activating")
+    parser.add_argument("--unsigned", action="store_true")
+    asyncio.run(main(parser.parse_args()))
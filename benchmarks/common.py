@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name, latencies, errors, elapsed):
+    return {
+        "name": name,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round((len(latencies) + errors) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def run_load(name, base_url, send, total, concurrency):
+    """
+        Call `send(client, i)` `total` times with at most `concurrency` requests in flight.
+        A request counts as an error when it raises or returns a 5xx response.
+    """
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker(client):
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await send(client, i)
+                if response is not None and response.status_code >= 500:
+                    errors += 1
+                    continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return summarize(name, latencies, errors, elapsed)
+
+
+def make_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--token", help="bearer token for authenticated routes")
+    return parser
+
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+
+def print_results(results):
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,484 @@
+"""
+    Drive every route of main.py and routes/auth.py against a running server and
+    report p50/p95/p99 latency and throughput per route. Results are written as
+    JSON (with the commit they were measured on) so runs can be compared.
+
+    Expects the data set of seed.py, with the API and this script both using
+    bench.env:
+
+        docker compose -f benchmarks/docker-compose.yml up -d
+        set -a; . benchmarks/bench.env; set +a
+        python benchmarks/seed.py
+        uvicorn main:app --workers 4 &
+        python benchmarks/endpoints.py --requests 2000 --concurrency 64
+        python benchmarks/endpoints.py --only /gyms --compare benchmarks/results/<earlier run>.json
+
+    Routes that hash passwords, upload images or create gyms run --heavy-requests
+    times instead. Deletes are measured on rows created just before their run,
+    never on the seeded ones. Any 4xx/5xx response counts as an error.
+"""
+import asyncio
+import base64
+from datetime import datetime, timezone
+import io
+import json
+import os
+import subprocess
+import sys
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx  # noqa: E402
+
+from common import auth_headers, make_parser, print_results, run_load  # noqa: E402
+from seed import ADMIN_EMAIL, CITIES, GYM_ADMIN_EMAIL, PASSWORD, user_email  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+SCENARIOS = []
+
+
+def scenario(route, heavy=False):
+    """
+        Register `prepare(ctx, client, total)`, which does any untimed setup and
+        returns the `send(client, i)` that run_load times.
+    """
+    def register(prepare):
+        SCENARIOS.append((route, heavy, prepare))
+        return prepare
+    return register
+
+
+class Context:
+    """ Tokens and seeded ids shared by the scenarios. """
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.headers = {}
+        self.user_ids = {}
+        self.gym_ids = []
+        self.pass_options = []
+        self.gym_admin_gym_id = None
+        self.image = _test_image()
+
+    async def load(self, client):
+        for name, email in (("user", user_email(0)), ("admin", ADMIN_EMAIL), ("gym", GYM_ADMIN_EMAIL)):
+            response = _checked(await client.post("/auth/login", json={"email": email, "password": PASSWORD}))
+            token = response.json()["access_token"]
+            self.headers[name] = auth_headers(token)
+            self.user_ids[name] = int(_claims(token)["sub"])
+            if name == "gym":
+                self.gym_admin_gym_id = response.json()["gym_id"]
+
+        for city, *_ in CITIES:
+            response = await client.get(f"/gyms/city/{city}", params={"limit": 20})
+            if response.status_code == 200:
+                self.gym_ids += [gym["id"] for gym in response.json()]
+        if not self.gym_ids:
+            raise SystemExit("No gyms found, run benchmarks/seed.py first")
+
+        for gym_id in self.gym_ids[:20]:
+            response = _checked(await client.get(f"/gyms/{gym_id}/guest-pass-options"))
+            self.pass_options += [(gym_id, option["id"], option["duration"]) for option in response.json()]
+
+    def gym(self, i):
+        return self.gym_ids[i % len(self.gym_ids)]
+
+    def city(self, i):
+        return CITIES[i % len(CITIES)][0]
+
+
+def _claims(token):
+    payload = token.split(".")[1]
+    return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+
+
+def _checked(response):
+    if response.status_code >= 400:
+        raise httpx.HTTPStatusError(
+            f"{response.request.method} {response.request.url.path} returned {response.status_code}: {response.text[:200]}",
+            request=response.request, response=response,
+        )
+    return response
+
+
+def _test_image():
+    from PIL import Image
+
+    image = Image.linear_gradient("L").resize((1024, 768)).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def _photo_files(ctx, names):
+    return [("files", (name, ctx.image, "image/jpeg")) for name in names]
+
+
+async def _create_gyms(ctx, client, count, label):
+    gym_ids = []
+    for i in range(count):
+        city, state, *_ = CITIES[i % len(CITIES)]
+        response = _checked(await client.post("/gyms", headers=ctx.headers["admin"], json={
+            "gym_name": f"Bench {label} {ctx.run_id} {i}", "gym_description": "Created by endpoints.py",
+            "address1": f"{i} {label} {ctx.run_id} Ave", "city": city, "state": state, "zipcode": "90001",
+        }))
+        gym_ids.append(response.json()["id"])
+    return gym_ids
+
+
+# --- routes/auth.py
+
+@scenario("POST /auth/login", heavy=True)
+async def login(ctx, client, total):
+    async def send(client, i):
+        return await client.post("/auth/login", json={"email": user_email(i % 100), "password": PASSWORD})
+    return send
+
+@scenario("POST /auth/register", heavy=True)
+async def register(ctx, client, total):
+    async def send(client, i):
+        return await client.post("/auth/register", json={
+            "first_name": "Bench", "last_name": f"Register{i}",
+            "email": f"bench-register-{ctx.run_id}-{i}@example.com", "password": PASSWORD,
+        })
+    return send
+
+@scenario("POST /auth/logout")
+async def logout(ctx, client, total):
+    async def send(client, i):
+        return await client.post("/auth/logout")
+    return send
+
+@scenario("GET /auth/password-hashing/stats")
+async def password_hashing_stats(ctx, client, total):
+    async def send(client, i):
+        return await client.get("/auth/password-hashing/stats", headers=ctx.headers["admin"])
+    return send
+
+@scenario("POST /auth/users/{user_id}/profile-photo", heavy=True)
+async def profile_photo(ctx, client, total):
+    user_id = ctx.user_ids["user"]
+
+    async def send(client, i):
+        return await client.post(
+            f"/auth/users/{user_id}/profile-photo", headers=ctx.headers["user"],
+            files=[("profile_photo", (f"profile-{i}.jpg", ctx.image, "image/jpeg"))]
+        )
+    return send
+
+@scenario("PUT /auth/users/{user_id}")
+async def update_user(ctx, client, total):
+    user_id = ctx.user_ids["user"]
+
+    async def send(client, i):
+        return await client.put(f"/auth/users/{user_id}", headers=ctx.headers["user"], json={"lastName": f"User{i}"})
+    return send
+
+@scenario("GET /auth/users/{user_id}")
+async def get_user(ctx, client, total):
+    user_id = ctx.user_ids["user"]
+
+    async def send(client, i):
+        return await client.get(f"/auth/users/{user_id}", headers=ctx.headers["user"])
+    return send
+
+@scenario("GET /auth/users")
+async def list_users(ctx, client, total):
+    async def send(client, i):
+        return await client.get("/auth/users", headers=ctx.headers["admin"], params={"limit": 50})
+    return send
+
+
+# --- main.py
+
+@scenario("GET /")
+async def root(ctx, client, total):
+    async def send(client, i):
+        return await client.get("/")
+    return send
+
+def _admin_get(path):
+    async def prepare(ctx, client, total):
+        async def send(client, i):
+            return await client.get(path, headers=ctx.headers["admin"])
+        return send
+    return prepare
+
+for _path in ("/cache/stats", "/qr-codes/stats", "/blob/stats", "/db/pool-stats", "/db/query-stats"):
+    scenario(f"GET {_path}")(_admin_get(_path))
+
+@scenario("GET /gyms/city/{city_name}")
+async def gyms_in_city(ctx, client, total):
+    async def send(client, i):
+        return await client.get(f"/gyms/city/{ctx.city(i)}")
+    return send
+
+@scenario("POST /gyms", heavy=True)
+async def create_gym(ctx, client, total):
+    async def send(client, i):
+        city, state, *_ = CITIES[i % len(CITIES)]
+        return await client.post("/gyms", headers=ctx.headers["admin"], json={
+            "gym_name": f"Bench Create {ctx.run_id} {i}", "gym_description": "Created by endpoints.py",
+            "address1": f"{i} Create {ctx.run_id} Ave", "city": city, "state": state, "zipcode": "90001",
+            "amenities": ["showers"], "hours_of_operation": {"mon-sun": "06:00-22:00"},
+        })
+    return send
+
+@scenario("GET /gyms/{gym_id}")
+async def gym_detail(ctx, client, total):
+    async def send(client, i):
+        return await client.get(f"/gyms/{ctx.gym(i)}")
+    return send
+
+@scenario("PUT /gyms/{gym_id}")
+async def update_gym(ctx, client, total):
+    async def send(client, i):
+        return await client.put(
+            f"/gyms/{ctx.gym(i)}", headers=ctx.headers["admin"], json={"gym_description": f"Updated by run {ctx.run_id}"}
+        )
+    return send
+
+@scenario("POST /gyms/{gym_id}/guest-pass-options")
+async def create_pass_option(ctx, client, total):
+    gym_id = ctx.gym_admin_gym_id
+
+    async def send(client, i):
+        return await client.post(f"/gyms/{gym_id}/guest-pass-options", headers=ctx.headers["gym"], json={
+            "pass_name": f"Bench {i}", "price": "15.00", "duration": 3, "description": "Created by endpoints.py",
+        })
+    return send
+
+@scenario("GET /gyms/{gym_id}/guest-pass-options")
+async def pass_options(ctx, client, total):
+    async def send(client, i):
+        return await client.get(f"/gyms/{ctx.gym(i)}/guest-pass-options")
+    return send
+
+@scenario("DELETE /gyms/{gym_id}/guest-pass-options/{pass_option_id}")
+async def delete_pass_option(ctx, client, total):
+    gym_id = ctx.gym_admin_gym_id
+    option_ids = []
+    for i in range(total):
+        response = _checked(await client.post(f"/gyms/{gym_id}/guest-pass-options", headers=ctx.headers["gym"], json={
+            "pass_name": f"Bench delete {i}", "price": "15.00", "duration": 3,
+        }))
+        option_ids.append(response.json()["pass_option_id"])
+
+    async def send(client, i):
+        return await client.delete(f"/gyms/{gym_id}/guest-pass-options/{option_ids[i]}", headers=ctx.headers["gym"])
+    return send
+
+@scenario("DELETE /gyms/{gym_id}", heavy=True)
+async def delete_gym(ctx, client, total):
+    gym_ids = await _create_gyms(ctx, client, total, "Delete")
+
+    async def send(client, i):
+        return await client.delete(f"/gyms/{gym_ids[i]}", headers=ctx.headers["admin"])
+    return send
+
+@scenario("POST /gyms/{gym_id}/guest-passes/purchase")
+async def purchase(ctx, client, total):
+    async def send(client, i):
+        gym_id, option_id, _ = ctx.pass_options[i % len(ctx.pass_options)]
+        return await client.post(
+            f"/gyms/{gym_id}/guest-passes/purchase", headers=ctx.headers["user"], params={"pass_option_id": option_id}
+        )
+    return send
+
+@scenario("GET /guest-passes/{purchase_id}/qr")
+async def pass_qr(ctx, client, total):
+    response = _checked(await client.get("/guest-passes/user_id", headers=ctx.headers["user"], params={"limit": 50}))
+    purchase_ids = [guest_pass["purchase_id"] for guest_pass in response.json()]
+    if not purchase_ids:
+        raise SystemExit("The benchmark user has no guest passes, run benchmarks/seed.py first")
+
+    async def send(client, i):
+        # Mostly repeat requests, as a phone refreshing its pass would make
+        return await client.get(
+            f"/guest-passes/{purchase_ids[i % len(purchase_ids)]}/qr", headers=ctx.headers["user"],
+            params={"format": "svg" if i % 4 == 0 else "png", "size": 300}
+        )
+    return send
+
+@scenario("POST /gyms/{gym_id}/photos/add", heavy=True)
+async def add_photos(ctx, client, total):
+    gym_id = ctx.gym_admin_gym_id
+
+    async def send(client, i):
+        return await client.post(
+            f"/gyms/{gym_id}/photos/add", headers=ctx.headers["gym"],
+            files=_photo_files(ctx, [f"bench-{ctx.run_id}-{i}-{n}.jpg" for n in range(3)])
+        )
+    return send
+
+@scenario("DELETE /gyms/{gym_id}/photos/{photo_id}", heavy=True)
+async def delete_photo(ctx, client, total):
+    gym_id = ctx.gym_admin_gym_id
+    photo_ids = []
+    for start in range(0, total, 10):
+        names = [f"bench-delete-{ctx.run_id}-{n}.jpg" for n in range(start, min(start + 10, total))]
+        response = _checked(await client.post(
+            f"/gyms/{gym_id}/photos/add", headers=ctx.headers["gym"], files=_photo_files(ctx, names)
+        ))
+        photo_ids += [photo["id"] for photo in response.json()["photos"] if photo["status"] == "uploaded"]
+    if not photo_ids:
+        raise SystemExit("No photos could be uploaded to delete, is Azurite running?")
+
+    async def send(client, i):
+        return await client.delete(f"/gyms/{gym_id}/photos/{photo_ids[i % len(photo_ids)]}", headers=ctx.headers["gym"])
+    return send
+
+@scenario("GET /gyms/{gym_id}/photos")
+async def gym_photos(ctx, client, total):
+    async def send(client, i):
+        return await client.get(f"/gyms/{ctx.gym(i)}/photos")
+    return send
+
+@scenario("POST /getNearbyGyms")
+async def nearby_gyms(ctx, client, total):
+    async def send(client, i):
+        _, _, latitude, longitude = CITIES[i % len(CITIES)]
+        offset = (i % 7 - 3) * 0.01
+        return await client.post("/getNearbyGyms", json={
+            "latitude": latitude + offset, "longitude": longitude - offset, "radius_in_meters": 5000,
+        })
+    return send
+
+@scenario("GET /guest-passes/user_id")
+async def user_guest_passes(ctx, client, total):
+    async def send(client, i):
+        return await client.get("/guest-passes/user_id", headers=ctx.headers["user"])
+    return send
+
+@scenario("POST /verify-pass")
+async def verify_pass(ctx, client, total):
+    # Signed with the same keys as the server (QR_SIGNING_KEYS / SECRET_KEY from bench.env)
+    from services.qr_signing import sign_pass_token
+
+    user_id = ctx.user_ids["user"]
+    tokens = []
+    for i in range(total):
+        gym_id, option_id, duration = ctx.pass_options[i % len(ctx.pass_options)]
+        response = _checked(await client.post(
+            f"/gyms/{gym_id}/guest-passes/purchase", headers=ctx.headers["user"], params={"pass_option_id": option_id}
+        ))
+        tokens.append(sign_pass_token(response.json()["purchase_id"], user_id, gym_id, duration))
+
+    async def send(client, i):
+        return await client.post("/verify-pass", json={"token": tokens[i]})
+    return send
+
+@scenario("POST /users/{user_id}/favorites")
+async def add_favorite(ctx, client, total):
+    user_id = ctx.user_ids["user"]
+
+    async def send(client, i):
+        return await client.post(f"/users/{user_id}/favorites", headers=ctx.headers["user"], params={"gym_id": ctx.gym(i)})
+    return send
+
+@scenario("GET /users/favorites")
+async def favorites(ctx, client, total):
+    async def send(client, i):
+        return await client.get("/users/favorites", headers=ctx.headers["user"])
+    return send
+
+@scenario("DELETE /users/favorites/{gym_id}")
+async def remove_favorite(ctx, client, total):
+    async def send(client, i):
+        return await client.delete(f"/users/favorites/{ctx.gym(i)}", headers=ctx.headers["user"])
+    return send
+
+@scenario("GET /users/pass-usage")
+async def pass_usage(ctx, client, total):
+    async def send(client, i):
+        return await client.get("/users/pass-usage", headers=ctx.headers["user"])
+    return send
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(previous, results, threshold):
+    """ Per-route change of p95 latency and throughput against an earlier results file. """
+    before = {result["name"]: result for result in previous["results"]}
+    rows = []
+    for result in results:
+        old = before.get(result["name"])
+        if old is None:
+            continue
+        p95_change = (result["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+        rps_change = (result["throughput_rps"] - old["throughput_rps"]) / old["throughput_rps"] * 100 if old["throughput_rps"] else 0.0
+        rows.append({
+            "name": result["name"],
+            "p95_ms": [old["p95_ms"], result["p95_ms"]],
+            "p95_change_pct": round(p95_change, 1),
+            "throughput_rps": [old["throughput_rps"], result["throughput_rps"]],
+            "throughput_change_pct": round(rps_change, 1),
+            "regression": p95_change > threshold or rps_change < -threshold,
+        })
+    return {"against": previous["commit"], "threshold_pct": threshold, "routes": rows}
+
+
+async def main(args):
+    ctx = Context(uuid.uuid4().hex[:8])
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=120) as client:
+        await ctx.load(client)
+
+        results = []
+        for route, heavy, prepare in SCENARIOS:
+            if args.only and not any(part in route for part in args.only):
+                continue
+            total = args.heavy_requests if heavy else args.requests
+            send = await prepare(ctx, client, total)
+
+            async def checked(client, i, send=send):
+                return _checked(await send(client, i))
+
+            result = await run_load(route, args.base_url, checked, total, args.concurrency)
+            result["concurrency"] = args.concurrency
+            results.append(result)
+            print(f"{route}: p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, "
+                  f"{result['throughput_rps']} req/s, {result['errors']} errors", file=sys.stderr)
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "base_url": args.base_url,
+        "requests": args.requests,
+        "heavy_requests": args.heavy_requests,
+        "concurrency": args.concurrency,
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"endpoints-{report['commit']}-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print_results(results)
+    if args.compare:
+        with open(args.compare) as f:
+            print_results(compare(json.load(f), results, args.threshold))
+    print(f"Results saved to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = make_parser(__doc__)
+    parser.add_argument("--heavy-requests", type=int, default=200,
+                        help="requests for routes that hash passwords, upload images or create gyms")
+    parser.add_argument("--only", nargs="+", help="only routes containing any of these strings")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/endpoints-<commit>-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percent change of p95 or throughput reported as a regression")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,72 @@
+"""
+    Latency of the login lookup: the old three queries (users, Admins,
+    Gym_Admins) against the single role-resolving query now used by
+    POST /auth/login, straight against the database configured in the
+    environment (DATABASE_NAME, DB_HOST, ...). End-to-end login latency,
+    bcrypt included, is measured by login_throughput.py.
+
+        python benchmarks/login_query.py --email bench@example.com --iterations 2000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common import percentile  # noqa: E402
+from services.database import connect  # noqa: E402
+from services.roles import USER_ROLE_BY_EMAIL, resolve_role  # noqa: E402
+
+
+def three_queries(cursor, email):
+    cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
+    user_id = cursor.fetchone()[0]
+    cursor.execute("SELECT id FROM Admins WHERE user_id = %s", (user_id,))
+    if cursor.fetchone():
+        return "admin", None
+    cursor.execute("SELECT gym_id FROM Gym_Admins WHERE user_id = %s", (user_id,))
+    gym_admin = cursor.fetchone()
+    return ("gym", gym_admin[0]) if gym_admin else ("user", None)
+
+
+def one_query(cursor, email):
+    cursor.execute(USER_ROLE_BY_EMAIL, (email,))
+    row = cursor.fetchone()
+    return resolve_role(row[4], row[5])
+
+
+def measure(name, lookup, cursor, email, iterations):
+    result = lookup(cursor, email)
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        lookup(cursor, email)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "name": name,
+        "role": result[0],
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def main(args):
+    connection = connect()
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        results = [
+            measure("users + Admins + Gym_Admins", three_queries, cursor, args.email, args.iterations),
+            measure("single LEFT JOIN query", one_query, cursor, args.email, args.iterations),
+        ]
+    connection.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--iterations", type=int, default=2000)
+    main(parser.parse_args())
@@ -0,0 +1,77 @@
+"""
+    Latency of the gym detail query sent as plain text (parsed and planned on
+    every call) against the prepared statement used by GET /gyms/{gym_id},
+    straight against the database configured in the environment
+    (DATABASE_NAME, DB_HOST, ...). With --explain it also reports the planning
+    time Postgres spends on a call of each, the prepared one through EXPLAIN EXECUTE.
+
+        python benchmarks/prepared_statements.py --gym-id 1 --iterations 2000 --explain
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common import percentile  # noqa: E402
+from services import queries  # noqa: E402
+from services.database import connect  # noqa: E402
+
+
+def plain(cursor, gym_id):
+    cursor.execute(queries.GYM_DETAIL.sql, (gym_id,))
+    return cursor.fetchone()
+
+
+def prepared(cursor, gym_id):
+    queries.execute(cursor, queries.GYM_DETAIL, (gym_id,))
+    return cursor.fetchone()
+
+
+def measure(name, run, cursor, gym_id, iterations):
+    if run(cursor, gym_id) is None:
+        raise SystemExit(f"Gym {gym_id} does not exist")
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run(cursor, gym_id)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "name": name,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def planning_time(cursor, sql, gym_id):
+    cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, (gym_id,))
+    return cursor.fetchone()[0][0]["Planning Time"]
+
+
+def main(args):
+    # Prepare regardless of DB_PREPARED_STATEMENTS, that is what is being measured
+    queries.PREPARED_STATEMENTS = True
+    connection = connect()
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        results = [
+            measure("plain text", plain, cursor, args.gym_id, args.iterations),
+            measure("prepared", prepared, cursor, args.gym_id, args.iterations),
+        ]
+        if args.explain:
+            # The measured runs above already prepared gym_detail on this connection
+            for result, sql in zip(results, (queries.GYM_DETAIL.sql, queries.GYM_DETAIL.execute_sql)):
+                result["planning_ms"] = round(planning_time(cursor, sql, args.gym_id), 3)
+    connection.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--gym-id", type=int, required=True)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--explain", action="store_true")
+    main(parser.parse_args())
@@ -0,0 +1,34 @@
+"""
+    Guest pass purchase throughput.
+
+    Fires `--requests` purchases of `--pass-option-id` at `--gym-id` with
+    `--concurrency` in flight, authenticated as a regular user. Run it against
+    servers on two releases (e.g. QR rendered and uploaded inside the request
+    vs. rendered on demand) and compare; `--label` tags each run in the output.
+
+        python benchmarks/purchase_throughput.py --token $USER_TOKEN --gym-id 1 --pass-option-id 1 --label on-demand-qr
+"""
+import asyncio
+
+from common import auth_headers, make_parser, print_results, run_load
+
+
+async def main(args):
+    headers = auth_headers(args.token)
+    url = f"/gyms/{args.gym_id}/guest-passes/purchase"
+
+    async def purchase(client, i):
+        return await client.post(url, params={"pass_option_id": args.pass_option_id}, headers=headers)
+
+    result = await run_load(
+        f"POST purchase ({args.label})", args.base_url, purchase, args.requests, args.concurrency
+    )
+    print_results([result])
+
+
+if __name__ == "__main__":
+    parser = make_parser(__doc__)
+    parser.add_argument("--gym-id", type=int, required=True)
+    parser.add_argument("--pass-option-id", type=int, required=True)
+    parser.add_argument("--label", default="current")
+    asyncio.run(main(parser.parse_args()))
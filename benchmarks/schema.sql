@@ -0,0 +1,84 @@
+-- Base tables the API expects before anything in migrations/ is applied. Only used
+-- to build the local benchmark database (benchmarks/docker-compose.yml); the
+-- migrations run on top of it in order.
+CREATE EXTENSION IF NOT EXISTS postgis;
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    firstName TEXT NOT NULL,
+    lastName TEXT NOT NULL,
+    email TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    profile_photo TEXT,
+    CONSTRAINT users_email_key UNIQUE (email)
+);
+
+CREATE TABLE IF NOT EXISTS gyms (
+    id SERIAL PRIMARY KEY,
+    gym_name TEXT NOT NULL,
+    description TEXT,
+    address1 TEXT NOT NULL,
+    address2 TEXT,
+    city TEXT NOT NULL,
+    state TEXT NOT NULL,
+    zipcode TEXT NOT NULL,
+    longitude DOUBLE PRECISION,
+    latitude DOUBLE PRECISION,
+    location GEOGRAPHY(Point, 4326),
+    amenities TEXT[],
+    hours_of_operation JSONB
+);
+
+CREATE INDEX IF NOT EXISTS gyms_location_idx ON gyms USING GIST (location);
+
+CREATE TABLE IF NOT EXISTS Admins (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS Gym_Admins (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    gym_id INTEGER NOT NULL REFERENCES gyms (id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS GymPhotos (
+    id SERIAL PRIMARY KEY,
+    gym_id INTEGER NOT NULL REFERENCES gyms (id) ON DELETE CASCADE,
+    photo_url TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS passoptions (
+    id SERIAL PRIMARY KEY,
+    gym_id INTEGER NOT NULL REFERENCES gyms (id) ON DELETE CASCADE,
+    pass_name TEXT NOT NULL,
+    price NUMERIC(5, 2) NOT NULL,
+    duration_days INTEGER NOT NULL,
+    description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS GuestPassPurchases (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    gym_id INTEGER NOT NULL REFERENCES gyms (id) ON DELETE CASCADE,
+    pass_option_id INTEGER NOT NULL REFERENCES passoptions (id) ON DELETE CASCADE,
+    qr_code TEXT,
+    expiration_date TIMESTAMPTZ,
+    is_valid BOOLEAN NOT NULL DEFAULT TRUE
+);
+
+CREATE TABLE IF NOT EXISTS PassUsage (
+    id SERIAL PRIMARY KEY,
+    purchase_id INTEGER REFERENCES GuestPassPurchases (id) ON DELETE SET NULL,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    gym_id INTEGER,
+    usage_date TIMESTAMPTZ NOT NULL DEFAULT now(),
+    gym_name TEXT,
+    gym_city TEXT
+);
+
+CREATE TABLE IF NOT EXISTS UserFavorites (
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    gym_id INTEGER NOT NULL REFERENCES gyms (id) ON DELETE CASCADE,
+    PRIMARY KEY (user_id, gym_id)
+);
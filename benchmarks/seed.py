@@ -0,0 +1,183 @@
+"""
+    Fill the local benchmark database (docker-compose.yml) with a reproducible
+    data set: gyms spread around a few cities with pass options and photos,
+    users with purchases, visits and favorites, plus one admin and one gym
+    admin. Every table is emptied first, so only run it against a throwaway
+    database; it refuses non-local hosts unless --force is given.
+
+        set -a; . benchmarks/bench.env; set +a
+        python benchmarks/seed.py --users 2000 --gyms 1000
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from psycopg2.extras import Json, execute_values  # noqa: E402
+
+from services.database import connect  # noqa: E402
+from services.passwords import hash_password  # noqa: E402
+
+# Shared with endpoints.py, which logs in as these accounts
+PASSWORD = "benchmark-password"
+ADMIN_EMAIL = "bench-admin@example.com"
+GYM_ADMIN_EMAIL = "bench-gym@example.com"
+
+# (city, state, latitude, longitude) of the centers gyms are scattered around
+CITIES = [
+    ("Los Angeles", "CA", 34.0522, -118.2437),
+    ("San Diego", "CA", 32.7157, -117.1611),
+    ("San Francisco", "CA", 37.7749, -122.4194),
+    ("Sacramento", "CA", 38.5816, -121.4944),
+    ("Fresno", "CA", 36.7378, -119.7871),
+    ("Seattle", "WA", 47.6062, -122.3321),
+    ("Portland", "OR", 45.5152, -122.6784),
+    ("Phoenix", "AZ", 33.4484, -112.0740),
+    ("Denver", "CO", 39.7392, -104.9903),
+    ("Austin", "TX", 30.2672, -97.7431),
+]
+AMENITIES = ["pool", "sauna", "showers", "lockers", "parking", "classes", "towels", "climbing wall"]
+PASS_OPTIONS = [("Day Pass", "12.50", 1), ("Week Pass", "45.00", 7), ("Month Pass", "99.00", 30)]
+TABLES = ["PassUsage", "UserFavorites", "GuestPassPurchases", "GymPhotos", "passoptions",
+          "Gym_Admins", "Admins", "gyms", "users", "geocode_cache"]
+
+
+def user_email(index):
+    return f"bench-user-{index}@example.com"
+
+
+def seed(cursor, args, rng):
+    password_hash = hash_password(PASSWORD)
+    cursor.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE")
+
+    user_ids = [row[0] for row in execute_values(
+        cursor, "INSERT INTO users (firstName, lastName, email, password_hash) VALUES %s RETURNING id",
+        [("Bench", f"User{i}", user_email(i), password_hash) for i in range(args.users)],
+        fetch=True, page_size=1000
+    )]
+    staff_ids = []
+    for last_name, email in (("Admin", ADMIN_EMAIL), ("GymAdmin", GYM_ADMIN_EMAIL)):
+        cursor.execute(
+            "INSERT INTO users (firstName, lastName, email, password_hash) VALUES (%s, %s, %s, %s) RETURNING id",
+            ("Bench", last_name, email, password_hash)
+        )
+        staff_ids.append(cursor.fetchone()[0])
+    admin_id, gym_admin_id = staff_ids
+
+    gyms = []
+    for i in range(args.gyms):
+        city, state, latitude, longitude = CITIES[i % len(CITIES)]
+        # Within roughly 15 km of the city center
+        latitude += rng.uniform(-0.135, 0.135)
+        longitude += rng.uniform(-0.17, 0.17)
+        gyms.append((
+            f"Bench Gym {i}", f"Benchmark gym number {i}", f"{100 + i} Main St", city, state, f"{90000 + i % 1000:05d}",
+            longitude, latitude, longitude, latitude, rng.sample(AMENITIES, 3),
+            Json({"mon-fri": "05:00-23:00", "sat-sun": "07:00-20:00"}),
+        ))
+    gym_rows = execute_values(
+        cursor,
+        """
+        INSERT INTO gyms (gym_name, description, address1, city, state, zipcode, longitude, latitude,
+                          location, amenities, hours_of_operation)
+        VALUES %s RETURNING id, gym_name, city
+        """,
+        gyms,
+        template="(%s, %s, %s, %s, %s, %s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s, %s)",
+        fetch=True, page_size=1000
+    )
+    gym_ids = [row[0] for row in gym_rows]
+
+    cursor.execute("INSERT INTO Admins (user_id) VALUES (%s)", (admin_id,))
+    cursor.execute("INSERT INTO Gym_Admins (user_id, gym_id) VALUES (%s, %s)", (gym_admin_id, gym_ids[0]))
+
+    options = execute_values(
+        cursor,
+        "INSERT INTO passoptions (gym_id, pass_name, price, duration_days, description) VALUES %s RETURNING id, gym_id, duration_days",
+        [(gym_id, name, price, days, f"{name} with full access") for gym_id in gym_ids for name, price, days in PASS_OPTIONS],
+        fetch=True, page_size=1000
+    )
+    options_by_gym = {}
+    for option_id, gym_id, days in options:
+        options_by_gym.setdefault(gym_id, []).append((option_id, days))
+
+    # Blobs behind these URLs don't exist; deleting them is a no-op for blob storage
+    execute_values(
+        cursor,
+        "INSERT INTO GymPhotos (gym_id, photo_url) VALUES %s",
+        [(gym_id, f"http://127.0.0.1:10000/devstoreaccount1/gym-photos/gym-{gym_id}/seed-{n}.jpg")
+         for gym_id in gym_ids for n in range(args.photos_per_gym)],
+        page_size=1000
+    )
+
+    now = datetime.now(timezone.utc)
+    purchases = []
+    for user_id in user_ids:
+        for _ in range(args.passes_per_user):
+            gym_id = rng.choice(gym_ids)
+            option_id, _ = rng.choice(options_by_gym[gym_id])
+            purchases.append((user_id, gym_id, option_id, now - timedelta(days=rng.uniform(0, 90))))
+    purchase_rows = execute_values(
+        cursor,
+        "INSERT INTO GuestPassPurchases (user_id, gym_id, pass_option_id, purchase_date) VALUES %s RETURNING id, user_id, gym_id, purchase_date",
+        purchases, fetch=True, page_size=1000
+    )
+    cursor.execute("UPDATE GuestPassPurchases SET qr_code = '/guest-passes/' || id || '/qr'")
+
+    gym_names = {gym_id: (name, city) for gym_id, name, city in gym_rows}
+    visits = [
+        (purchase_id, user_id, gym_id, purchased_at + timedelta(hours=rng.uniform(1, 48) + day * 24), *gym_names[gym_id])
+        for purchase_id, user_id, gym_id, purchased_at in purchase_rows
+        for day in range(rng.randint(0, args.max_visits_per_pass))
+    ]
+    execute_values(
+        cursor,
+        "INSERT INTO PassUsage (purchase_id, user_id, gym_id, usage_date, gym_name, gym_city) VALUES %s",
+        visits, page_size=1000
+    )
+
+    favorites = {(user_id, gym_id) for user_id in user_ids for gym_id in rng.sample(gym_ids, min(args.favorites_per_user, len(gym_ids)))}
+    execute_values(cursor, "INSERT INTO UserFavorites (user_id, gym_id) VALUES %s", sorted(favorites), page_size=1000)
+
+    return {
+        "users": len(user_ids) + 2,
+        "gyms": len(gym_ids),
+        "pass_options": len(options),
+        "photos": len(gym_ids) * args.photos_per_gym,
+        "purchases": len(purchase_rows),
+        "visits": len(visits),
+        "favorites": len(favorites),
+    }
+
+
+def main(args):
+    if os.getenv("DB_HOST") not in ("localhost", "127.0.0.1", "db") and not args.force:
+        raise SystemExit(f"Refusing to empty the database on {os.getenv('DB_HOST')}, use --force")
+    if args.gyms < 1:
+        raise SystemExit("--gyms must be at least 1")
+
+    connection = connect()
+    try:
+        with connection.cursor() as cursor:
+            counts = seed(cursor, args, random.Random(args.seed))
+        connection.commit()
+    finally:
+        connection.close()
+    print(json.dumps(counts, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--gyms", type=int, default=1000)
+    parser.add_argument("--photos-per-gym", type=int, default=3)
+    parser.add_argument("--passes-per-user", type=int, default=5)
+    parser.add_argument("--max-visits-per-pass", type=int, default=3)
+    parser.add_argument("--favorites-per-user", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--force", action="store_true", help="seed a database that is not on localhost")
+    main(parser.parse_args())
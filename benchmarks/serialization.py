@@ -0,0 +1,96 @@
+"""
+    Serialization cost per 1,000 rows, in-process and without a database.
+
+    "before" is the old handler path: build a dict per positional tuple,
+    validate the list against the pydantic response_model, run FastAPI's
+    jsonable_encoder and encode with the stdlib json module. "after" maps the
+    tuples to slotted rows and renders them with the orjson response class.
+
+        python benchmarks/serialization.py --rows 1000 --repeat 200
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import json
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import parse_obj_as  # noqa: E402
+
+from models.models import GymCityResponse, GymCityRow, PassOptionResponse, PassOptionRow, PassUsageRow  # noqa: E402
+from utils.responses import ORJSONResponse  # noqa: E402
+
+
+def gym_rows(count):
+    return [(i, f"Gym {i}", -118.2 + i / 1e4, 34.0 + i / 1e4) for i in range(count)]
+
+def pass_option_rows(count):
+    return [(i, i % 50, f"Pass {i}", Decimal("12.50"), 1 + i % 30, "Full gym access") for i in range(count)]
+
+def pass_usage_rows(count):
+    now = datetime.now(timezone.utc)
+    return [(i % 50, now - timedelta(hours=i), f"Gym {i % 50}", "Los Angeles", i) for i in range(count)]
+
+
+def old_gyms(rows):
+    return [{"id": gym[0], "gym_name": gym[1], "coordinate": {"latitude": gym[3], "longitude": gym[2]}} for gym in rows]
+
+def old_pass_options(rows):
+    return [{"id": p[0], "gym_id": p[1], "pass_name": p[2], "price": p[3], "duration": p[4], "description": p[5]}
+            for p in rows]
+
+def old_pass_usages(rows):
+    return [{"gym_id": u[0], "usage_date": u[1], "gym_name": u[2], "gym_city": u[3]} for u in rows]
+
+
+CASES = [
+    ("gyms in city", gym_rows, old_gyms, GymCityRow, List[GymCityResponse]),
+    ("pass options", pass_option_rows, old_pass_options, PassOptionRow, List[PassOptionResponse]),
+    ("pass usage", pass_usage_rows, old_pass_usages, PassUsageRow, None),
+]
+
+
+def before(rows, build, model):
+    content = build(rows)
+    if model is not None:
+        content = parse_obj_as(model, content)
+    return json.dumps(jsonable_encoder(content)).encode()
+
+def after(rows, row_type):
+    return ORJSONResponse(row_type.map(rows)).body
+
+
+def per_thousand(fn, rows, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat / len(rows) * 1000 * 1e6
+
+
+def main(args):
+    results = []
+    for name, make_rows, build, row_type, model in CASES:
+        rows = make_rows(args.rows)
+        old = per_thousand(lambda: before(rows, build, model), rows, args.repeat)
+        new = per_thousand(lambda: after(rows, row_type), rows, args.repeat)
+        results.append({
+            "name": name,
+            "rows": args.rows,
+            "before_us_per_1k_rows": round(old, 1),
+            "after_us_per_1k_rows": round(new, 1),
+            "speedup": round(old / new, 1) if new else None,
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,83 @@
+"""
+    Compare /getNearbyGyms answers from the in-memory spatial index with the PostGIS query.
+
+    Loads the index from the database configured in the environment (DATABASE_NAME, DB_HOST, ...),
+    runs the same radius queries against both and reports mismatches and per-query latency:
+
+        python benchmarks/spatial_index_check.py --queries 500
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from services.database import connect  # noqa: E402
+from services.spatial_index import NEARBY_GYM_COLUMNS, SpatialIndex  # noqa: E402
+from utils.settings import get_spatial_index_settings  # noqa: E402
+
+POSTGIS_QUERY = f"""
+    SELECT {NEARBY_GYM_COLUMNS},
+        ST_Distance(location, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography)
+    FROM gyms
+    WHERE ST_DWithin(location, ST_SetSRID(ST_MakePoint(%s, %s), 4326), %s)
+"""
+
+# Gyms this close to the search radius may legitimately flip between the two geodesic implementations
+BOUNDARY_TOLERANCE_METERS = 0.01
+
+
+def main(args):
+    connection = connect()
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT {NEARBY_GYM_COLUMNS} FROM gyms")
+    rows = cursor.fetchall()
+    if not rows:
+        sys.exit("The gyms table is empty, seed it first")
+
+    index = SpatialIndex(get_spatial_index_settings()["cell_degrees"])
+    index.load(rows)
+
+    random.seed(args.seed)
+    mismatches = 0
+    index_seconds = postgis_seconds = 0.0
+    for _ in range(args.queries):
+        # Query around real gyms so most searches have results
+        gym = random.choice(rows)
+        latitude = float(gym[9]) + random.uniform(-0.05, 0.05)
+        longitude = float(gym[8]) + random.uniform(-0.05, 0.05)
+        radius = random.choice([250, 1000, 2000, 5000, 20000])
+
+        start = time.perf_counter()
+        from_index = index.nearby(latitude, longitude, radius)
+        index_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        cursor.execute(POSTGIS_QUERY, (longitude, latitude, longitude, latitude, radius))
+        from_postgis = sorted(cursor.fetchall(), key=lambda row: (row[-1], row[0]))
+        postgis_seconds += time.perf_counter() - start
+
+        expected = [row[0] for row in from_postgis if abs(row[-1] - radius) > BOUNDARY_TOLERANCE_METERS]
+        actual = [row[0] for row in from_index if abs(row[-1] - radius) > BOUNDARY_TOLERANCE_METERS]
+        distances_match = all(
+            abs(a[-1] - b[-1]) < 0.01 for a, b in zip(from_index, from_postgis)
+        )
+        if expected != actual or not distances_match:
+            mismatches += 1
+            print(f"mismatch at ({latitude:.6f}, {longitude:.6f}) r={radius}: index={actual[:10]} postgis={expected[:10]}")
+
+    print(f"gyms indexed:        {len(index)}")
+    print(f"queries:             {args.queries}")
+    print(f"mismatches:          {mismatches}")
+    print(f"index per query:     {index_seconds / args.queries * 1e6:.1f} us")
+    print(f"postgis per query:   {postgis_seconds / args.queries * 1e6:.1f} us")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
@@ -0,0 +1,140 @@
+"""
+    Check the in-memory spatial index against a reference computation, without a database.
+
+    Builds a fixed synthetic data set (gyms around a few cities plus points next to the
+    poles and the antimeridian), then for every query compares SpatialIndex.nearby with a
+    brute-force scan of all gyms and checks each answer against haversine distances:
+
+        python benchmarks/spatial_index_reference.py --queries 2000
+
+    Exits with status 1 on any mismatch.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from services.spatial_index import LATITUDE, LONGITUDE, SpatialIndex, geodesic_distance, haversine_distance  # noqa: E402
+
+# (latitude, longitude, spread in degrees) of the areas gyms are scattered around
+CENTERS = [
+    (34.0522, -118.2437, 0.3),
+    (47.6062, -122.3321, 0.3),
+    (0.0, 0.0, 0.5),
+    (-33.8688, 151.2093, 0.3),
+    (64.1466, -21.9426, 0.3),
+    (-17.7134, 179.95, 0.2),   # crosses the antimeridian
+    (89.95, 0.0, 0.05),        # next to the north pole
+    (-89.95, 45.0, 0.05),      # next to the south pole
+]
+RADII = [250, 1000, 2000, 5000, 20000, 50000]
+# The sphere is within 0.6% of the WGS84 ellipsoid over these distances
+SPHERE_TOLERANCE = 0.006
+
+
+def make_rows(rng, count):
+    rows = []
+    for gym_id in range(1, count + 1):
+        latitude, longitude, spread = CENTERS[gym_id % len(CENTERS)]
+        latitude = max(-90.0, min(90.0, latitude + rng.uniform(-spread, spread)))
+        longitude = (longitude + rng.uniform(-spread, spread) + 180) % 360 - 180
+        rows.append((gym_id, f"Gym {gym_id}", None, None, None, None, None, None, longitude, latitude))
+    # Gyms without coordinates are never returned
+    rows.append((count + 1, "No location", None, None, None, None, None, None, None, None))
+    return rows
+
+
+def reference(rows, latitude, longitude, radius):
+    results = []
+    for row in rows:
+        if row[LATITUDE] is None or row[LONGITUDE] is None:
+            continue
+        distance = geodesic_distance(latitude, longitude, row[LATITUDE], row[LONGITUDE])
+        if distance <= radius:
+            results.append((distance, row[0]))
+    return sorted(results)
+
+
+def check_haversine(rows, answer, latitude, longitude, radius):
+    """ Problems with `answer` that a spherical computation can rule out. """
+    problems = []
+    returned = {row[0] for row in answer}
+    for row in answer:
+        distance = haversine_distance(latitude, longitude, row[LATITUDE], row[LONGITUDE])
+        if distance > radius * (1 + SPHERE_TOLERANCE) + 1:
+            problems.append(f"gym {row[0]} returned at {distance:.1f} m")
+        if abs(distance - row[-1]) > distance * SPHERE_TOLERANCE + 1:
+            problems.append(f"gym {row[0]} distance {row[-1]:.1f} m, haversine {distance:.1f} m")
+    for row in rows:
+        if row[LATITUDE] is None or row[0] in returned:
+            continue
+        distance = haversine_distance(latitude, longitude, row[LATITUDE], row[LONGITUDE])
+        if distance < radius * (1 - SPHERE_TOLERANCE) - 1:
+            problems.append(f"gym {row[0]} missing at {distance:.1f} m")
+    return problems
+
+
+def check_replay(cell_degrees):
+    """ Upserts and removes made while a load reads the table must survive that load. """
+    index = SpatialIndex(cell_degrees)
+    stale = [(1, "Kept", *[None] * 6, 10.0, 10.0), (2, "Deleted", *[None] * 6, 10.0, 10.001)]
+    index.load(stale)
+    index.begin_load()
+    index.upsert((3, "Added", *[None] * 6, 10.0, 10.002))
+    index.remove(2)
+    index.load(stale)
+    return sorted(row[0] for row in index.nearby(10.0, 10.0, 1000)) == [1, 3]
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    rows = make_rows(rng, args.gyms)
+    index = SpatialIndex(args.cell_degrees)
+    index.load(rows)
+
+    failures = 0
+    index_seconds = scan_seconds = 0.0
+    for _ in range(args.queries):
+        gym = rng.choice(rows[:-1])
+        latitude = max(-90.0, min(90.0, gym[LATITUDE] + rng.uniform(-0.05, 0.05)))
+        longitude = (gym[LONGITUDE] + rng.uniform(-0.05, 0.05) + 180) % 360 - 180
+        radius = rng.choice(RADII)
+
+        start = time.perf_counter()
+        answer = index.nearby(latitude, longitude, radius)
+        index_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = reference(rows, latitude, longitude, radius)
+        scan_seconds += time.perf_counter() - start
+
+        problems = check_haversine(rows, answer, latitude, longitude, radius)
+        if [(row[-1], row[0]) for row in answer] != expected:
+            problems.append(f"index={[row[0] for row in answer][:10]} scan={[gym_id for _, gym_id in expected][:10]}")
+        if problems:
+            failures += 1
+            print(f"mismatch at ({latitude:.6f}, {longitude:.6f}) r={radius}: {'; '.join(problems[:3])}")
+
+    replay_ok = check_replay(args.cell_degrees)
+    if not replay_ok:
+        print("changes made during a load were lost")
+
+    print(f"gyms indexed:        {len(index)}")
+    print(f"queries:             {args.queries}")
+    print(f"mismatches:          {failures}")
+    print(f"load replay:         {'ok' if replay_ok else 'FAILED'}")
+    print(f"index per query:     {index_seconds / args.queries * 1e6:.1f} us")
+    print(f"scan per query:      {scan_seconds / args.queries * 1e6:.1f} us")
+    sys.exit(1 if failures or not replay_ok else 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--gyms", type=int, default=4000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--cell-degrees", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=11)
+    main(parser.parse_args())
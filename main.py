@@ -1,79 +1,174 @@
 import uvicorn
-import googlemaps
-from fastapi import Depends, FastAPI, HTTPException, APIRouter, UploadFile, File
-from typing import List
+from fastapi import Depends, FastAPI, HTTPException, APIRouter, UploadFile, File, Header, Query, Request, Response
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
 from pydantic import BaseModel
-from psycopg2.extensions import AsIs
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
+import psycopg
+from psycopg.types.json import Jsonb
 
 from services.database import *
+from services.async_database import async_db_connection, get_async_db_connection, get_async_pool, open_async_pool, close_async_pool
+from services.passwords import password_hasher
+from services.geocoding import format_address, get_geocoder
+from services.blob_storage import GYM_PHOTOS_CONTAINER, blob_storage
+from services.images import UnsupportedImage, delete_image, image_processor, upload_variants
+from services.uploads import remove_file, stream_uploads
+from services.cache import city_tag, gym_tag, response_cache
+from services.metrics import MetricsMiddleware, metrics_allowed, metrics_response
+from services.sql_trace import SQLTraceMiddleware
+from services.qr_codes import QR_MEDIA_TYPES, qr_code_url, qr_renderer
+from services.qr_signing import sign_pass_token, token_expiry, verify_pass_token
+from services import qr_signing, queries
+from services.spatial_index import (
+    NEARBY_GYM_COLUMNS, get_spatial_index, nearby_from_index, start_change_listener, stop_change_listener
+)
 from models.models import *
-from utils.settings import get_blob_connection_string
+from utils.http import etag_matches
+from utils.settings import get_photo_upload_concurrency
+from utils.pagination import NEXT_CURSOR_HEADER, PageParams, keyset_values, page_params, split_page
+from utils.responses import ORJSONResponse, json_response
 from routes.auth import get_current_user
 import routes.auth
-from services.blob_functions  import *
+import routes.admin
 import os
+import asyncio
 import json
-import io
-import qrcode
-from qrcode.image.pil import PilImage
+import time
 import logging
 from datetime import datetime
-from zoneinfo import ZoneInfo
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 app.include_router(routes.auth.router)
+app.include_router(routes.admin.router)
+app.add_middleware(SQLTraceMiddleware)
+app.add_middleware(MetricsMiddleware)
 
-# Load environment variables
-blob_connection_string = os.getenv("BLOB_CONNECTION_STRING")
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def open_db_pools():
+    get_pool().open()
+    await open_async_pool()
+    start_change_listener()
+    await blob_storage.open()
+
+@app.on_event("shutdown")
+async def close_db_pools():
+    stop_change_listener()
+    close_pool()
+    await close_async_pool()
+
+@app.on_event("shutdown")
+async def close_blob_storage():
+    await blob_storage.close()
+
+@app.on_event("shutdown")
+def stop_password_hasher():
+    password_hasher.shutdown()
+
+@app.on_event("shutdown")
+def stop_qr_renderer():
+    qr_renderer.shutdown()
+
+@app.on_event("shutdown")
+def stop_image_processor():
+    image_processor.shutdown()
+
 # API endPoints
 @app.get("/")
 async def root():
     return {"message": "TravelFitAPI"}
 
+# Prometheus scrape target, off unless METRICS_TOKEN or METRICS_ENABLED is set
+@app.get("/metrics", include_in_schema=False)
+def metrics(authorization: Optional[str] = Header(None)):
+    # Answers 404 rather than 401 so a scan can't tell the endpoint exists
+    if not metrics_allowed(authorization):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return metrics_response()
+
+@app.get("/cache/stats")
+def cache_stats(
+    user = Depends(get_current_user)
+):
+    if user.role not in ['admin']:
+        raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
+
+    return response_cache.stats()
+
+@app.get("/qr-codes/stats")
+def qr_code_stats(
+    user = Depends(get_current_user)
+):
+    if user.role not in ['admin']:
+        raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
+
+    return qr_renderer.stats()
+
+@app.get("/blob/stats")
+def blob_stats(
+    user = Depends(get_current_user)
+):
+    if user.role not in ['admin']:
+        raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
+
+    return blob_storage.stats()
+
+@app.get("/db/pool-stats")
+def db_pool_stats(
+    user = Depends(get_current_user)
+):
+    if user.role not in ['admin']:
+        raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
+
+    return {"sync": get_pool().stats(), "async": get_async_pool().get_stats()}
+
+@app.get("/db/query-stats")
+def db_query_stats(
+    user = Depends(get_current_user)
+):
+    if user.role not in ['admin']:
+        raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
+
+    return queries.stats()
+
 
 @app.get("/gyms/city/{city_name}", response_model=List[GymCityResponse])
 def get_gyms_in_city(
     city_name: str,
-    db: tuple = Depends(get_db_connection)
+    page: PageParams = Depends(page_params)
 ):
-    connection, cursor = db
-    
-    try:
-        cursor.execute(
-            """
-            SELECT id, gym_name, longitude, latitude
-            FROM gyms
-            WHERE city = %s
-            """,
-            (city_name,)
-        )
-        gyms = cursor.fetchall()
-
-        if not gyms:
-            raise HTTPException(status_code=404, detail=f"No gyms found in {city_name}")
-
-    # Create GymCityResponse objects for each gym
-        gym_responses = []
-        for gym in gyms:
-            gym_response = GymCityResponse(
-                id=gym[0],
-                gym_name=gym[1],
-                coordinate={"latitude": gym[3], "longitude": gym[2]}
+    after = keyset_values(page, int)
+
+    def load_gyms_in_city():
+        with db_connection() as (connection, cursor):
+            cursor.execute(
+                f"""
+                SELECT id, gym_name, longitude, latitude
+                FROM gyms
+                WHERE city = %s {"AND id > %s" if after else ""}
+                ORDER BY id
+                LIMIT %s
+                """,
+                (city_name, *(after or []), page.limit + 1)
             )
-            gym_responses.append(gym_response)
+            gyms, next_cursor = split_page(cursor.fetchall(), page, lambda gym: [gym[0]])
 
-        return gym_responses
-       
+        return {"gyms": GymCityRow.map(gyms), "next_cursor": next_cursor}
 
+    try:
+        # Cached until a gym in this city is added, changed or removed
+        cached = response_cache.get_or_load(
+            f"gyms:city:{city_name}:{after and after[0]}:{page.limit}", [city_tag(city_name)], load_gyms_in_city
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to fetch gym information")
-    
-    finally:
-        cursor.close()
-        connection.close()
+
+    if not cached["gyms"] and after is None:
+        raise HTTPException(status_code=404, detail=f"No gyms found in {city_name}")
+
+    headers = {NEXT_CURSOR_HEADER: cached["next_cursor"]} if cached["next_cursor"] else None
+    return json_response(cached["gyms"], List[GymCityResponse], headers=headers)
 
 
 # post gym listing
@@ -83,23 +178,19 @@ def add_gym_listing(
     user = Depends(get_current_user),
     db: tuple = Depends(get_db_connection)
 ):
-    if user['role'] not in ['admin']:
+    if user.role not in ['admin']:
             raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
 
 
     connection, cursor = db
         # Construct the address string
-    address = f"{gym.address1}, {gym.city}, {gym.state}, {gym.zipcode}"
+    address = format_address(gym.address1, gym.city, gym.state, gym.zipcode)
 
-    # Call Google Maps API to geocode the address
-    api_key = os.getenv("GOOGLE_API_KEY")
-    gmaps = googlemaps.Client(key=api_key)
-    geocode_result = gmaps.geocode(address)
+    # Geocode through the shared cache, only unseen addresses reach Google Maps
+    coordinates, new_coordinates = get_geocoder().geocode(address, db)
 
-    # Extract latitude and longitude from geocode result
-    if geocode_result:
-        latitude = geocode_result[0]['geometry']['location']['lat']
-        longitude = geocode_result[0]['geometry']['location']['lng']
+    if coordinates:
+        latitude, longitude = coordinates
     else:
         return None
     
@@ -117,52 +208,36 @@ def add_gym_listing(
             (gym.gym_name, gym.gym_description, gym.address1, gym.city, gym.state, gym.zipcode, longitude, latitude, point, gym.amenities, hours_of_operation_json),
         )
         connection.commit()  # Commit the transaction
+        get_geocoder().remember(new_coordinates)
         gym_row = cursor.fetchone()
 
         assert gym_row is not None
         id = gym_row[0]  # Access the id directly from the row 
 
+        get_spatial_index().upsert(
+            (id, gym.gym_name, gym.gym_description, gym.address1, None, gym.city, gym.state, gym.zipcode, longitude, latitude)
+        )
+        response_cache.invalidate(gym_tag(id), city_tag(gym.city))
+
         return ReturnIdResponse(id=id)
     
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to post gym information")
 
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
 
 # get gym by gym_id
 @app.get("/gyms/{gym_id}")
 def get_gym_by_id(
     gym_id: int,
-    db: tuple = Depends(get_db_connection)
+    if_none_match: Optional[str] = Header(None)
 ):
-    connection, cursor = db
-    try:
-        cursor.execute(
-            """
-            SELECT id, gym_name, description, address1, address2, city, state, zipcode, amenities, hours_of_operation
-            FROM gyms
-            WHERE id = %s
-            """,
-            (gym_id,)
-        )
-        gym = cursor.fetchone()
+    def load_gym():
+        with db_connection() as (connection, cursor):
+            queries.execute(cursor, queries.GYM_DETAIL, (gym_id,))
+            gym = cursor.fetchone()
 
         if gym is None:
-            raise HTTPException(status_code=404, detail="Gym not found")
-        
-        cursor.execute(
-            """
-            SELECT photo_url
-            FROM GymPhotos
-            WHERE gym_id = %s
-            """,
-            (gym_id,)
-        )
-        gym_photos = [row[0] for row in cursor.fetchall()]
+            return None
 
         # Construct a dictionary to represent the gym
         gym_info = {
@@ -176,17 +251,26 @@ def get_gym_by_id(
             "zipcode": gym[7],
             "amenities": gym[8] if gym[8] is not None else [],
             "hours_of_operation": gym[9] if gym[9] is not None else {},
-            "photos": gym_photos if gym_photos else []
+            "photos": gym[11],
+            "photo_variants": gym[12],
+            "pass_options": gym[13]
         }
+        # gyms.version is bumped by triggers whenever the gym, its photos or its pass options change
+        return {"etag": f'"gym-{gym[0]}-v{gym[10]}"', "gym": gym_info}
 
-        return gym_info
-
+    try:
+        cached = response_cache.get_or_load(f"gyms:{gym_id}", [gym_tag(gym_id)], load_gym)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to fetch gym information")
 
-    finally:
-        cursor.close()
-        connection.close()
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Gym not found")
+
+    headers = {"ETag": cached["etag"], "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, cached["etag"]):
+        return Response(status_code=304, headers=headers)
+
+    return json_response(cached["gym"], headers=headers)
 
 
 @app.put("/gyms/{gym_id}")
@@ -197,16 +281,16 @@ def update_gym_info(
     db: tuple = Depends(get_db_connection)
 ):
     # check user roles
-    if user['role'] not in ['admin', 'gym']:
+    if user.role not in ['admin', 'gym']:
             raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
 
-    if user['role'] == 'gym' and user['gym_id'] != gym_id:
+    if user.role == 'gym' and user.gym_id != gym_id:
         raise HTTPException(status_code=403, detail="Access denied: Cannot update other gyms")
 
     connection, cursor = db
     try:
         # Check if the gym exists
-        cursor.execute("SELECT id FROM gyms WHERE id = %s", (gym_id,))
+        cursor.execute("SELECT id, address1, city, state, zipcode FROM gyms WHERE id = %s", (gym_id,))
         gym = cursor.fetchone()
         if not gym:
             raise HTTPException(status_code=404, detail="Gym not found")
@@ -255,27 +339,50 @@ def update_gym_info(
             update_query += " hours_of_operation = %s,"
             update_values.append(update_request.hours_of_operation)
 
+        # Re-geocode through the shared cache when any part of the address changes
+        new_coordinates = {}
+        if update_request.address1 or update_request.city or update_request.state or update_request.zipcode:
+            address = format_address(
+                update_request.address1 or gym[1],
+                update_request.city or gym[2],
+                update_request.state or gym[3],
+                update_request.zipcode or gym[4],
+            )
+            coordinates, new_coordinates = get_geocoder().geocode(address, db)
+            if not coordinates:
+                raise HTTPException(status_code=400, detail="Could not geocode the updated address")
+
+            latitude, longitude = coordinates
+            update_query += " longitude = %s, latitude = %s, location = ST_GeographyFromText(%s),"
+            update_values.extend([longitude, latitude, f"POINT({longitude} {latitude})"])
+
         # Remove trailing comma
         update_query = update_query.rstrip(",")
 
-        update_query += " WHERE id = %s"
+        update_query += f" WHERE id = %s RETURNING {NEARBY_GYM_COLUMNS}"
         update_values.append(gym_id)
 
         # Execute the update query
         cursor.execute(update_query, update_values)
+        updated_gym = cursor.fetchone()
 
         connection.commit()
+        get_geocoder().remember(new_coordinates)
+
+        get_spatial_index().upsert(updated_gym)
+        # gym[2] is the city before the update, updated_gym[5] the city after it
+        response_cache.invalidate(gym_tag(gym_id), city_tag(gym[2]), city_tag(updated_gym[5]))
 
         return {"message": "Gym information updated successfully"}
 
+    except HTTPException:
+        connection.rollback()
+        raise
     except Exception as e:
         # Rollback changes and raise HTTPException
         connection.rollback()
         raise HTTPException(status_code=500, detail="Failed to update gym information")
 
-    finally:
-        cursor.close()
-        connection.close()
 
 
 # post pass options for specific gym
@@ -286,10 +393,10 @@ def add_guest_pass_options(
     user = Depends(get_current_user),  # get the current user
     db: tuple = Depends(get_db_connection)
 ):
-    if user['role'] not in ['admin', 'gym']:
+    if user.role not in ['admin', 'gym']:
         raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
 
-    if user['role'] == 'gym' and user['gym_id'] != gym_id:
+    if user.role == 'gym' and user.gym_id != gym_id:
         raise HTTPException(status_code=403, detail="Access denied: Cannot add passes to other gyms")
    
     connection, cursor = db
@@ -309,6 +416,7 @@ def add_guest_pass_options(
         
         # Commit to db
         connection.commit()
+        response_cache.invalidate(gym_tag(gym_id))
         
         return {"pass_option_id": pass_option_id}
     
@@ -317,10 +425,6 @@ def add_guest_pass_options(
         connection.rollback()
         raise HTTPException(status_code=500, detail="Failed to add guest pass option")
 
-    finally:
-        # Close the cursor and connection
-        cursor.close()
-        connection.close()
 
 @app.get("/gyms/{gym_id}/guest-pass-options", response_model=List[PassOptionResponse])
 def get_guest_pass_options(
@@ -329,42 +433,18 @@ def get_guest_pass_options(
 ):
     connection, cursor = db
     try:
-        cursor.execute(
-            """
-            SELECT id, gym_id, pass_name, price, duration_days, description
-            FROM passoptions
-            WHERE gym_id = %s
-            """,
-            (gym_id,)
-        )
+        queries.execute(cursor, queries.PASS_OPTIONS_BY_GYM, (gym_id,))
         # Fetch all rows
         pass_options = cursor.fetchall()
         
         # Commit to DB
         connection.commit()
 
-        # Convert each tuple into a dictionary
-        pass_option_dicts = []
-        for pass_option in pass_options:
-            pass_option_dict = {
-                "id": pass_option[0],
-                "gym_id": pass_option[1],
-                "pass_name": pass_option[2],
-                "price": pass_option[3],
-                "duration": pass_option[4],
-                "description": pass_option[5]
-            }
-            pass_option_dicts.append(pass_option_dict)
-        
-        # Return the pass options
-        return pass_option_dicts
+        return json_response(PassOptionRow.map(pass_options), List[PassOptionResponse])
     
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to fetch guest pass options")
 
-    finally:
-        cursor.close()
-        connection.close()
 
 @app.delete("/gyms/{gym_id}/guest-pass-options/{pass_option_id}")
 def delete_guest_pass_option(
@@ -373,10 +453,10 @@ def delete_guest_pass_option(
     user = Depends(get_current_user),
     db: tuple = Depends(get_db_connection)
 ):
-    if user['role'] not in ['admin', 'gym']:
+    if user.role not in ['admin', 'gym']:
         raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
 
-    if user['role'] == 'gym' and user['gym_id'] != gym_id:
+    if user.role == 'gym' and user.gym_id != gym_id:
         raise HTTPException(status_code=403, detail="Access denied: Cannot update other gyms")
 
     connection, cursor = db
@@ -406,6 +486,7 @@ def delete_guest_pass_option(
 
         # Commit to DB
         connection.commit()
+        response_cache.invalidate(gym_tag(gym_id))
 
         return {"message": "Pass option deleted successfully"}
 
@@ -413,9 +494,6 @@ def delete_guest_pass_option(
         connection.rollback()
         raise HTTPException(status_code=500, detail="Failed to delete pass option")
 
-    finally:
-        cursor.close()
-        connection.close()
 
 @app.delete("/gyms/{gym_id}")
 def delete_gym(
@@ -423,7 +501,7 @@ def delete_gym(
     user = Depends(get_current_user),
     db: tuple = Depends(get_db_connection)
 ):
-    if user['role'] not in ['admin']:
+    if user.role not in ['admin']:
             raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
 
     connection, cursor = db
@@ -431,7 +509,7 @@ def delete_gym(
         # Check if exist
         cursor.execute(
             """
-            SELECT id
+            SELECT id, city
             FROM gyms
             WHERE id = %s 
             """,
@@ -454,15 +532,15 @@ def delete_gym(
         # Commit to DB
         connection.commit()
 
+        get_spatial_index().remove(gym_id)
+        response_cache.invalidate(gym_tag(gym_id), city_tag(gym_listing[1]))
+
         return {"message": "Gym deleted successfully"}
 
     except Exception as e:
         connection.rollback()
         raise HTTPException(status_code=500, detail="Failed to delete Gym")
 
-    finally:
-        cursor.close()
-        connection.close()
 
 @app.post("/gyms/{gym_id}/guest-passes/purchase")
 def purchase_guest_pass(
@@ -471,13 +549,13 @@ def purchase_guest_pass(
     user = Depends(get_current_user),  # get the current user
     db: tuple = Depends(get_db_connection)
 ):
-    if user['role'] not in ['user']:
+    if user.role not in ['user']:
             raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
     
     
     connection, cursor = db
     try:
-        user_id = int(user["sub"])
+        user_id = user.user_id
         # Insert the guest pass purchase into the database
         cursor.execute(
             """
@@ -489,92 +567,150 @@ def purchase_guest_pass(
         )
         purchase_id = cursor.fetchone()[0]
 
+        # The QR image is rendered on request from these same columns, nothing to upload
         cursor.execute(
-            """
-            SELECT pass_name, duration_days
-            FROM passoptions
-            WHERE id = %s
-            """,
-            (pass_option_id,)
-        )
-        pass_info = cursor.fetchone()
-        
-        # Generate QR code
-        qr_code_data = (
-            f"pass_id:{purchase_id},user_id:{user_id},gym_id:{gym_id}, "
-            f"duration:{pass_info[1]} "
+            "UPDATE guestpasspurchases SET qr_code = %s WHERE id = %s",
+            (qr_code_url(purchase_id), purchase_id)
         )
-        qr_code = qrcode.make(qr_code_data, image_factory=PilImage)
-
-        # Create an in-memory buffer to store the QR code image
-        qr_code_buffer = io.BytesIO()
-        qr_code.save(qr_code_buffer, format='PNG')
-        qr_code_buffer.seek(0)  # Reset buffer position to the beginning
-
-        # Save QR code image to blob storage
-        qr_code_filename = f"pass_{purchase_id}_qr.png"
-        blob_url = upload_qr_code_to_blob_storage(qr_code_buffer, qr_code_filename)
 
-        cursor.execute(
-            """
-            UPDATE guestpasspurchases
-            SET qr_code = %s 
-            WHERE id = %s
-            """,
-            (blob_url, purchase_id,)
-        )
-        
         connection.commit()
-        return {"message": "Guest pass purchased successfully", "purchase_id": purchase_id}
+        return {"message": "Guest pass purchased successfully", "purchase_id": purchase_id,
+                "qr_code": qr_code_url(purchase_id)}
     except Exception as e:
         connection.rollback()
         raise HTTPException(status_code=500, detail="Failed to purchase guest pass")
-    finally:
-        cursor.close()
-        connection.close()
+
+
+@app.get("/guest-passes/{purchase_id}/qr")
+async def get_guest_pass_qr(
+    purchase_id: int,
+    format: str = Query("png", pattern="^(png|svg)$"),
+    size: int = Query(300, ge=64, le=2048, description="Approximate width in pixels"),
+    if_none_match: Optional[str] = Header(None),
+    user = Depends(get_current_user),
+    db: tuple = Depends(get_async_db_connection)
+):
+    connection, cursor = db
+    await cursor.execute(
+        """
+        SELECT gp.user_id, gp.gym_id, po.duration_days
+        FROM guestpasspurchases gp
+        JOIN passoptions po ON po.id = gp.pass_option_id
+        WHERE gp.id = %s
+        """,
+        (purchase_id,)
+    )
+    guest_pass = await cursor.fetchone()
+    if guest_pass is None or (user.role != 'admin' and guest_pass[0] != user.user_id):
+        raise HTTPException(status_code=404, detail="Guest pass not found")
+
+    # The signed token stays the same for the whole expiry window, so clients can keep
+    # the image until the window rolls over; it is a credential, so only privately
+    expires_at = token_expiry()
+    data = sign_pass_token(purchase_id, *guest_pass, expires_at=expires_at)
+    max_age = max(0, expires_at - qr_signing.settings["ttl"] - int(time.time()))
+    etag = qr_renderer.etag(data, format, size)
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={max_age}"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    image = await qr_renderer.render(data, format, size)
+    return Response(content=image, media_type=QR_MEDIA_TYPES[format], headers=headers)
+
+async def _discard_photo_uploads(results, tasks):
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.gather(*(
+        delete_image(GYM_PHOTOS_CONTAINER, result["photo_url"], result.get("variants"))
+        for result in results if result["status"] == "uploaded"
+    ), return_exceptions=True)
 
 # add gym photos
 @app.post("/gyms/{gym_id}/photos/add")
 async def upload_photos(
     gym_id: int, 
-    user = Depends(get_current_user),
-    files: List[UploadFile] = File(...)
+    request: Request,
+    user = Depends(get_current_user)
 ):
-    if user['role'] not in ['admin', 'gym']:
+    """
+        Multipart upload of any number of image files. Each file is streamed into blob
+        storage as it arrives; its variants are made while the next one is still coming in.
+    """
+    if user.role not in ['admin', 'gym']:
         raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
 
-    if user['role'] == 'gym' and user['gym_id'] != gym_id:
+    if user.role == 'gym' and user.gym_id != gym_id:
         raise HTTPException(status_code=403, detail="Access denied: Cannot update other gyms photos")
 
-    blob_connection_string = get_blob_connection_string()
-
-    container_name = f"gym-photos"
-    blob_service_client = BlobServiceClient.from_connection_string(blob_connection_string)
-    container_client = blob_service_client.get_container_client(container_name)
-
-    # Define the virtual directory
-    virtual_directory_name = f"gym-{gym_id}"
-
-    # Check if the container exists, create if not
-    if not container_client.exists():
-        container_client.create_container()
-
-    for file in files:
+    def photo_blob_name(filename):
+        return f"gym-{gym_id}/{filename}"
+
+    semaphore = asyncio.Semaphore(get_photo_upload_concurrency())
+
+    async def add_variants(result, path):
+        async with semaphore:
+            try:
+                result["variants"] = await upload_variants(GYM_PHOTOS_CONTAINER, photo_blob_name(result["filename"]), path)
+            except Exception as e:
+                unsupported = isinstance(e, UnsupportedImage)
+                if not unsupported:
+                    logger.warning("Making variants of %s for gym %s failed: %s", result["filename"], gym_id, e)
+                result.update(status="failed", error="Not a supported image" if unsupported else "Upload failed")
+                # The original is already stored, don't keep it without its variants
+                await asyncio.gather(delete_image(GYM_PHOTOS_CONTAINER, result.pop("photo_url")), return_exceptions=True)
+            finally:
+                remove_file(path)
+
+    results, tasks = [], []
+    try:
+        async for upload in stream_uploads(request, GYM_PHOTOS_CONTAINER, photo_blob_name):
+            result = {"filename": upload["filename"], "status": upload["status"]}
+            if upload["status"] == "uploaded":
+                result["photo_url"] = upload["url"]
+                # At most PHOTO_UPLOAD_CONCURRENCY files are processed at a time
+                tasks.append(asyncio.create_task(add_variants(result, upload["path"])))
+            else:
+                result["error"] = upload["error"]
+            results.append(result)
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # Over a size limit, client gone, request cancelled or anything else before the
+        # rows are written: nothing from this request is kept. Shielded so a cancelled
+        # request still finishes deleting what it already committed
+        await asyncio.shield(_discard_photo_uploads(results, tasks))
+        raise
+
+    uploaded = [result for result in results if result["status"] == "uploaded"]
+
+    if uploaded:
         try:
-            blob_name = f"{virtual_directory_name}/{file.filename}"
-            blob_client = container_client.get_blob_client(blob_name)
-            blob_client.upload_blob(file.file)
-
-            db = get_db_connection()
-
-            # Insert the photo path into the database
-            photo_url = f"https://travelfitstorage.blob.core.windows.net/{container_name}/{blob_name}"
-            insert_gym_photo_into_database(gym_id, photo_url, db)
-
+            async with async_db_connection() as (connection, cursor):
+                await cursor.execute(
+                    f"""
+                    INSERT INTO GymPhotos (gym_id, photo_url, variants)
+                    VALUES {", ".join(["(%s, %s, %s)"] * len(uploaded))}
+                    RETURNING id, photo_url
+                    """,
+                    [value for result in uploaded for value in (gym_id, result["photo_url"], Jsonb(result["variants"]))]
+                )
+                photo_ids = {photo_url: photo_id for photo_id, photo_url in await cursor.fetchall()}
+                await connection.commit()
         except Exception as e:
-            print(f"Error uploading photo or inserting into database: {e}")
+            logger.warning("Saving photos for gym %s failed: %s", gym_id, e)
+            # Don't leave blobs behind that no row points to
+            await asyncio.gather(*(
+                delete_image(GYM_PHOTOS_CONTAINER, result["photo_url"], result["variants"]) for result in uploaded
+            ), return_exceptions=True)
+            for result in uploaded:
+                result.update(status="failed", error="Failed to save photo")
+                del result["photo_url"], result["variants"]
+        else:
+            for result in uploaded:
+                result["id"] = photo_ids[result["photo_url"]]
+            response_cache.invalidate(gym_tag(gym_id))
 
-    return {"message": "Photos uploaded successfully"}
+    failed = len(results) - sum(result["status"] == "uploaded" for result in results)
+    message = "Photos uploaded successfully" if not failed else f"{failed} of {len(results)} photos failed to upload"
+    return {"message": message, "photos": results}
 
 
 # delete gym photos
@@ -584,119 +720,112 @@ async def delete_photo(
     photo_id: int,
     user = Depends(get_current_user),
 ):
-    if user['role'] not in ['admin', 'gym']:
+    if user.role not in ['admin', 'gym']:
         raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
 
-    if user['role'] == 'gym' and user['gym_id'] != gym_id:
+    if user.role == 'gym' and user.gym_id != gym_id:
         raise HTTPException(status_code=403, detail="Access denied: Cannot delete other gyms photos")
 
     try:
-        db = get_db_connection()
-        # Check if the photo exists in the database
-        photo = get_photo_by_id(photo_id, db)
+        # Delete the row first and release the connection before talking to blob storage
+        async with async_db_connection() as (connection, cursor):
+            await cursor.execute(
+                "DELETE FROM GymPhotos WHERE id = %s AND gym_id = %s RETURNING photo_url, variants",
+                (photo_id, gym_id)
+            )
+            photo = await cursor.fetchone()
+            await connection.commit()
         if not photo:
             raise HTTPException(status_code=404, detail="Photo not found in database")
+        response_cache.invalidate(gym_tag(gym_id))
 
-        file_name = photo[2].split("/")[-1]
-        # Construct the blob name for the photo to be deleted
-        blob_name = f"gym-{gym_id}/{file_name}"
-
-        # Get the container client
-        container_name = "gym-photos"
-        blob_service_client = BlobServiceClient.from_connection_string(blob_connection_string)
-        container_client = blob_service_client.get_container_client(container_name)
-
-        # Check if the blob exists in Azure Blob Storage
-        blob_client = container_client.get_blob_client(blob_name)
-        if not blob_client.exists():
-            raise HTTPException(status_code=404, detail="Photo not found in blob storage")
-
-        # Delete the photo from Azure Blob Storage
-        blob_client.delete_blob()
-
-        db = get_db_connection()
-        # Delete the photo from the database
-        delete_gym_photo(photo_id, db)
+        # Delete the photo and its variants from Azure Blob Storage
+        await delete_image(GYM_PHOTOS_CONTAINER, photo[0], photo[1])
 
         return {"message": "Photo deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to delete photo: {e}")
+        logger.warning("Deleting photo %s of gym %s failed: %s", photo_id, gym_id, e)
+        raise HTTPException(status_code=500, detail="Failed to delete photo")
     
 # get gym photos for gym by gym_id
 @app.get("/gyms/{gym_id}/photos", response_model=List[dict])
 async def get_gym_photos(
     gym_id: int, 
-    db: tuple = Depends(get_db_connection)
+    db: tuple = Depends(get_async_db_connection)
 ):
     connection, cursor = db    
     try:
-        cursor.execute(
+        await cursor.execute(
             """
-            SELECT id, photo_url
+            SELECT id, photo_url, variants
             FROM GymPhotos
             WHERE gym_id = %s
             """,
             (gym_id,)
         )
-        photos = cursor.fetchall()
+        photos = await cursor.fetchall()
 
-        return [{"id": photo[0], "photo_url": photo[1]} for photo in photos]
+        return json_response(GymPhotoRow.map(photos))
         
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         raise HTTPException(status_code=500, detail="Failed to fetch photos for the gym")
-    finally:
-        cursor.close()
-        connection.close()
     
 # The front-end will make a post request to this endpoint providing the users
 # latitude and longitude and optionaly radius_in_meter(or defaults to 2000)
 @app.post("/getNearbyGyms")
 async def get_nearby_gyms(
-    location: UserLocation,
-    db: tuple = Depends(get_db_connection)
+    location: UserLocation
 ):
+    # Served from the in-memory spatial index; PostGIS is only used until it is loaded.
+    # The distance math is CPU work, so it runs on the threadpool rather than the event loop
+    gyms = await run_in_threadpool(nearby_from_index, location.latitude, location.longitude, location.radius_in_meters)
+    if gyms is not None:
+        return json_response(gyms)
+
     # query database for nearby gyms based on the location
-    connection, cursor = db    
     try:
-        cursor.execute(
-            """
-            SELECT id, gym_name, description, address1, address2, city, state, zipcode, longitude, latitude
-            FROM gyms
-            WHERE ST_DWithin(
-                location,
-                ST_SetSRID(ST_MakePoint(%s, %s), 4326),
-                %s
+        async with async_db_connection() as (connection, cursor):
+            await cursor.execute(
+                f"""
+                SELECT {NEARBY_GYM_COLUMNS},
+                    ST_Distance(location, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography)
+                FROM gyms
+                WHERE ST_DWithin(
+                    location,
+                    ST_SetSRID(ST_MakePoint(%s, %s), 4326),
+                    %s
+                )
+                ORDER BY 
+                    location <-> ST_SetSRID(ST_MakePoint(%s, %s), 4326)
+                """,
+                (location.longitude, location.latitude, location.longitude, location.latitude,
+                 location.radius_in_meters, location.longitude, location.latitude)
             )
-            ORDER BY 
-                location <-> ST_SetSRID(ST_MakePoint(%s, %s), 4326);
-            );
-            """,
-            (location.longitude, location.latitude, location.radius_in_meters, location.longitude, location.latitude)
-        )
-        gyms = cursor.fetchall()
-        return gyms
+            gyms = await cursor.fetchall()
+            return json_response(gyms)
         
         
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         raise HTTPException(status_code=500, detail="Failed to fetch gyms nearby")
-    finally:
-        cursor.close()
-        connection.close()
 # Need to add QR code to this endpoint as well    
 @app.get("/guest-passes/user_id")
 async def get_user_guest_passes(
-    user: dict = Depends(get_current_user),
-    db: tuple = Depends(get_db_connection)
+    user: Principal = Depends(get_current_user),
+    page: PageParams = Depends(page_params),
+    db: tuple = Depends(get_async_db_connection)
 ):
     # query database for nearby gyms based on the location
     connection, cursor = db    
+    after = keyset_values(page, int)
     
     try:
         
-        user_id = int(user["sub"])
-        # Insert the guest pass purchase into the database
-        cursor.execute(
-            """
+        user_id = user.user_id
+        # Newest purchases first, keyed on the purchase id
+        await cursor.execute(
+            f"""
             SELECT 
                 g.id,
                 g.gym_name,
@@ -708,7 +837,8 @@ async def get_user_guest_passes(
                 gp.expiration_date,
                 gp.is_valid,
                 g.latitude,
-                g.longitude
+                g.longitude,
+                gp.id
             FROM 
                 GuestPassPurchases gp
             JOIN 
@@ -717,198 +847,149 @@ async def get_user_guest_passes(
                 PassOptions po ON gp.pass_option_id = po.id
             WHERE 
                 gp.user_id = %s AND
-                gp.is_valid = TRUE;
+                gp.is_valid = TRUE
+                {"AND gp.id < %s" if after else ""}
+            ORDER BY gp.id DESC
+            LIMIT %s
             """,
-            (user_id,)
+            (user_id, *(after or []), page.limit + 1)
+        )
+        guest_passes, next_cursor = split_page(
+            GuestPassRow.map(await cursor.fetchall()), page, lambda guest_pass: [guest_pass.purchase_id]
         )
-        guest_passes = cursor.fetchall()
 
-        return [{"gym_id": guest_pass[0], "gym_name": guest_pass[1], "city": guest_pass[2],
-                 "pass_name": guest_pass[3], "duration_days": guest_pass[4], 
-                 "description": guest_pass[5], "qr_code": guest_pass[6], "expiration": guest_pass[7],
-                 "is_valid": guest_pass[8], "latitude": guest_pass[9], "longitude": guest_pass[10]} 
-                 for guest_pass in guest_passes]
+        return json_response(guest_passes, headers={NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None)
         
     except Exception as e:
-        connection.rollback()
+        await connection.rollback()
         raise HTTPException(status_code=500, detail="Failed to fetch guest passes")
-    finally:
-        cursor.close()
-        connection.close()
 
-# 1. Update the GuestPassPurchases table to mark the pass as active
-# 2. Calculate the expiration time based on the current time and duration
-# 3. Update the expiration_time column in the database    
 @app.post("/verify-pass")
 async def verify_pass(
     scanned_data: ScannedQrCodeData,
-    db: tuple = Depends(get_db_connection),
+    db: tuple = Depends(get_async_db_connection),
 ):
+    if scanned_data.token is not None:
+        # Signed codes are authenticated in memory, no read needed
+        pass_id, user_id, gym_id, duration = verify_pass_token(scanned_data.token)
+    elif qr_signing.settings["accept_unsigned"]:
+        # Unsigned fields are forgeable; the duration is taken from the pass option instead
+        logger.warning("Accepted unsigned pass code for pass %s", scanned_data.pass_id)
+        pass_id, user_id, gym_id, duration = scanned_data.pass_id, scanned_data.user_id, scanned_data.gym_id, None
+    else:
+        raise HTTPException(status_code=400, detail="Unsigned pass codes are no longer accepted, refresh the pass")
+
     connection, cursor = db
     try:
-        # 
-        cursor.execute(
-            """
-            SELECT expiration_date, is_valid FROM guestpasspurchases
-            WHERE id = %s
-               
-            """,
-            (scanned_data.pass_id,)
+        await queries.execute_async(
+            cursor,
+            queries.VERIFY_PASS,
+            {"pass_id": pass_id, "user_id": user_id, "gym_id": gym_id, "duration": duration}
         )
-        guest_pass = cursor.fetchone()
-
-        if guest_pass is None:
-            raise HTTPException(status_code=404, detail="Pass not found")
-
-        expiration_date = guest_pass[0]
-        is_valid = guest_pass[1]
-
-        if expiration_date is None:
-        
-            cursor.execute(
-                """
-                UPDATE guestpasspurchases
-                SET expiration_date = CURRENT_TIMESTAMP + INTERVAL '%s days'
-                WHERE id = %s
-                """,
-                (scanned_data.duration, scanned_data.pass_id)
-            )
-
-            connection.commit()
-
-        cursor.execute(
-            """
-            SELECT firstName
-            FROM Users
-            WHERE id = %s
-            """,
-            (scanned_data.user_id,)
-        )
-        user_result = cursor.fetchone()
-        user_name = user_result[0] if user_result else "User"
+        found, expired, user_name, gym_name = await cursor.fetchone()
+        await connection.commit()
+    except Exception as e:
+        await connection.rollback()
+        raise HTTPException(status_code=500, detail="Failed to fetch guest pass from QR code")
 
-        cursor.execute(
-            """
-            SELECT gym_name, city
-            FROM Gyms
-            WHERE id = %s
-            """,
-            (scanned_data.gym_id,)
-        )
-        gym_result = cursor.fetchone()
-        gym_name = gym_result[0] if gym_result else "Gym"
-        gym_city = gym_result[1] if gym_result else "City"
+    if not found:
+        raise HTTPException(status_code=404, detail="Pass not found")
+    if expired:
+        raise HTTPException(status_code=400, detail="Pass has expired")
+    if gym_name is None:
+        raise HTTPException(status_code=400, detail="Pass is not valid")
 
-        if is_valid:
-            usage_date = datetime.now(ZoneInfo("UTC"))
-            cursor.execute(
-                "INSERT INTO PassUsage (purchase_id, user_id, gym_id, usage_date, gym_name) VALUES (%s, %s, %s, %s, %s, %s)",
-                (scanned_data.pass_id, scanned_data.user_id, scanned_data.gym_id, usage_date, gym_name, gym_city)
-            )
-            connection.commit()
-            return {"message": f"Welcome {user_name} to {gym_name}, Enjoy your workout!"}
-        else:
-            raise HTTPException(status_code=400, detail="Pass is not valid")
-        
-    except Exception as e:
-        connection.rollback()
-        raise HTTPException(status_code=500, detail="Failed to fetch guest pass from QR code")    
+    return {"message": f"Welcome {user_name or 'User'} to {gym_name}, Enjoy your workout!"}
 
 @app.post("/users/{user_id}/favorites")
 async def add_favorite_gym(
     gym_id: int, 
     user = Depends(get_current_user),
-    db: tuple = Depends(get_db_connection)
+    db: tuple = Depends(get_async_db_connection)
 ):
     connection, cursor = db
     try:
-        user_id = user['sub']
-        cursor.execute(
+        user_id = user.user_id
+        await cursor.execute(
             """
             INSERT INTO UserFavorites (user_id, gym_id) 
             VALUES (%s, %s) ON CONFLICT DO NOTHING
             """, 
             (user_id, gym_id)
         )
-        connection.commit()
+        await connection.commit()
         return {"message": "Gym added to favorites successfully"}
     except Exception as e:
-        connection.rollback()
+        await connection.rollback()
         raise HTTPException(status_code=500, detail="Failed to add gym to favorites")
-    finally:
-        cursor.close()
-        connection.close()   
 
 @app.get("/users/favorites")
 async def get_favorite_gyms(
     user = Depends(get_current_user), 
-    db: tuple = Depends(get_db_connection)
+    page: PageParams = Depends(page_params),
+    db: tuple = Depends(get_async_db_connection)
 ):
     connection, cursor = db
+    after = keyset_values(page, int)
     try:
-        user_id = user['sub']
-        cursor.execute(
-            """
-            SELECT g.id, g.gym_name, g.city FROM Gyms g
-            JOIN UserFavorites uf ON uf.gym_id = g.id
-            WHERE uf.user_id = %s
-            """, 
-            (user_id,)
+        user_id = user.user_id
+        await queries.execute_async(
+            cursor,
+            queries.FAVORITES_AFTER if after else queries.FAVORITES_FIRST_PAGE,
+            (user_id, *(after or []), page.limit + 1)
+        )
+        favorites, next_cursor = split_page(await cursor.fetchall(), page, lambda favorite: [favorite[0]])
+        return json_response(
+            {"favorites": favorites}, headers={NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
         )
-        favorites = cursor.fetchall()
-        return {"favorites": favorites}
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to retrieve users favorites.")
-    finally:
-        cursor.close()
-        connection.close()
  
 @app.delete("/users/favorites/{gym_id}")
 async def remove_favorite_gym(
     gym_id: int, 
     user = Depends(get_current_user), 
-    db: tuple = Depends(get_db_connection)
+    db: tuple = Depends(get_async_db_connection)
 ):
     connection, cursor = db
     try:
-        user_id = user['sub']
-        cursor.execute("DELETE FROM UserFavorites WHERE user_id = %s AND gym_id = %s", (user_id, gym_id))
-        connection.commit()
+        user_id = user.user_id
+        await cursor.execute("DELETE FROM UserFavorites WHERE user_id = %s AND gym_id = %s", (user_id, gym_id))
+        await connection.commit()
         return {"message": "Gym removed from favorites successfully"}
     except Exception as e:
-        connection.rollback()
+        await connection.rollback()
         raise HTTPException(status_code=500, detail="Failed to delete gym from favorites.")
-    finally:
-        cursor.close()
-        connection.close()
 
 @app.get("/users/pass-usage")
 async def get_user_pass_usages(
-    user: dict = Depends(get_current_user),
-    db: tuple = Depends(get_db_connection)
+    user: Principal = Depends(get_current_user),
+    page: PageParams = Depends(page_params),
+    db: tuple = Depends(get_async_db_connection)
 ):
     connection, cursor = db    
+    after = keyset_values(page, datetime.fromisoformat, int)
     
     try:
         
-        user_id = int(user["sub"])
+        user_id = user.user_id
     
-        cursor.execute(
-            """
-            SELECT gym_id, usage_date, gym_name, gym_city
-            FROM PassUsage WHERE user_id = %s
+        # Most recent visits first; id breaks ties between identical timestamps
+        await cursor.execute(
+            f"""
+            SELECT gym_id, usage_date, gym_name, gym_city, id
+            FROM PassUsage WHERE user_id = %s {"AND (usage_date, id) < (%s, %s)" if after else ""}
+            ORDER BY usage_date DESC, id DESC
+            LIMIT %s
             """,
-            (user_id,)
+            (user_id, *(after or []), page.limit + 1)
+        )
+        pass_usages, next_cursor = split_page(
+            PassUsageRow.map(await cursor.fetchall()), page, lambda pass_use: [pass_use.usage_date.isoformat(), pass_use.id]
         )
-        pass_usages = cursor.fetchall()
 
-        return [{"gym_id": pass_use[0], "usage_date": pass_use[1], "gym_name": pass_use[2],
-                 "gym_city": pass_use[3]} 
-                 for pass_use in pass_usages]
+        return json_response(pass_usages, headers={NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None)
         
     except Exception as e:
-        connection.rollback()
-        raise HTTPException(status_code=500, detail="Failed to fetch guest passes")
-    finally:
-        cursor.close()
-        connection.close()
\ No newline at end of file
+        await connection.rollback()
+        raise HTTPException(status_code=500, detail="Failed to fetch guest passes")
\ No newline at end of file
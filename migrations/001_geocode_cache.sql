@@ -0,0 +1,7 @@
+-- Persistent geocoding results keyed by normalized address (see services/geocoding.py)
+CREATE TABLE IF NOT EXISTS geocode_cache (
+    address_key TEXT PRIMARY KEY,
+    latitude DOUBLE PRECISION NOT NULL,
+    longitude DOUBLE PRECISION NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
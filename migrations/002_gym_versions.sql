@@ -0,0 +1,40 @@
+-- Row version for gym detail ETags. Any change to a gym, its photos or its pass
+-- options bumps gyms.version (see GET /gyms/{gym_id} in main.py)
+ALTER TABLE gyms ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1;
+ALTER TABLE gyms ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE OR REPLACE FUNCTION bump_gym_version() RETURNS trigger AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS gyms_bump_version ON gyms;
+CREATE TRIGGER gyms_bump_version
+    BEFORE UPDATE ON gyms
+    FOR EACH ROW EXECUTE FUNCTION bump_gym_version();
+
+-- Touching the parent gym fires gyms_bump_version
+CREATE OR REPLACE FUNCTION touch_parent_gym() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE gyms SET updated_at = now() WHERE id = OLD.gym_id;
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.gym_id IS DISTINCT FROM OLD.gym_id) THEN
+        UPDATE gyms SET updated_at = now() WHERE id = NEW.gym_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS gymphotos_touch_gym ON GymPhotos;
+CREATE TRIGGER gymphotos_touch_gym
+    AFTER INSERT OR UPDATE OR DELETE ON GymPhotos
+    FOR EACH ROW EXECUTE FUNCTION touch_parent_gym();
+
+DROP TRIGGER IF EXISTS passoptions_touch_gym ON passoptions;
+CREATE TRIGGER passoptions_touch_gym
+    AFTER INSERT OR UPDATE OR DELETE ON passoptions
+    FOR EACH ROW EXECUTE FUNCTION touch_parent_gym();
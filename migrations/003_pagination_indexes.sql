@@ -0,0 +1,18 @@
+-- Indexes matching the keyset (cursor) ordering of the list endpoints, so a deep
+-- page is an index range scan just like the first one.
+-- CONCURRENTLY cannot run inside a transaction: apply with plain `psql -f`.
+
+-- GET /gyms/city/{city_name}: WHERE city = ? AND id > ? ORDER BY id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gyms_city_id_idx ON gyms (city, id);
+
+-- GET /users/pass-usage: WHERE user_id = ? AND (usage_date, id) < (?, ?) ORDER BY usage_date DESC, id DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS passusage_user_date_id_idx ON PassUsage (user_id, usage_date DESC, id DESC);
+
+-- GET /users/favorites: WHERE user_id = ? AND gym_id > ? ORDER BY gym_id
+-- is already served by the UserFavorites (user_id, gym_id) primary key.
+
+-- GET /guest-passes/user_id: WHERE user_id = ? AND is_valid AND id < ? ORDER BY id DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS guestpasspurchases_user_valid_id_idx
+    ON GuestPassPurchases (user_id, id DESC) WHERE is_valid;
+
+-- GET /auth/users pages on the users primary key
@@ -0,0 +1,6 @@
+-- Timestamps used by the date-range filters of the admin exports (routes/admin.py)
+ALTER TABLE users ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE GuestPassPurchases ADD COLUMN IF NOT EXISTS purchase_date TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS guestpasspurchases_purchase_date_idx ON GuestPassPurchases (purchase_date);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS passusage_usage_date_idx ON PassUsage (usage_date);
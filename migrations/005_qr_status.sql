@@ -0,0 +1,7 @@
+-- QR codes are generated after the purchase commits (services/qr_codes.py).
+-- Existing purchases already have their code, new ones are inserted as 'pending'.
+ALTER TABLE GuestPassPurchases ADD COLUMN IF NOT EXISTS qr_status TEXT NOT NULL DEFAULT 'ready';
+
+-- Startup requeue: WHERE qr_status = 'pending'
+CREATE INDEX CONCURRENTLY IF NOT EXISTS guestpasspurchases_qr_pending_idx
+    ON GuestPassPurchases (id) WHERE qr_status = 'pending';
@@ -0,0 +1,7 @@
+-- QR codes are rendered on request by GET /guest-passes/{id}/qr instead of being
+-- stored as PNGs in the qr-codes container, so point every pass at the endpoint.
+UPDATE GuestPassPurchases SET qr_code = '/guest-passes/' || id || '/qr';
+
+-- Only used by the background upload jobs this replaces
+DROP INDEX CONCURRENTLY IF EXISTS guestpasspurchases_qr_pending_idx;
+ALTER TABLE GuestPassPurchases DROP COLUMN IF EXISTS qr_status;
@@ -0,0 +1,3 @@
+-- Resized copies of uploaded photos (services/images.py): {"thumb": url, "medium": url, "full": url}
+ALTER TABLE GymPhotos ADD COLUMN IF NOT EXISTS variants JSONB;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS profile_photo_variants JSONB;
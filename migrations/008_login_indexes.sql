@@ -0,0 +1,5 @@
+-- Login resolves the user and their role in one query (services/roles.py):
+-- users by email, joined to Admins and Gym_Admins by user_id.
+-- users.email is already covered by the index of the users_email_key unique constraint.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS admins_user_id_idx ON Admins (user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS gym_admins_user_id_idx ON Gym_Admins (user_id);
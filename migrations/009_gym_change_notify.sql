@@ -0,0 +1,22 @@
+-- Every worker keeps an in-memory snapshot of gym locations for /getNearbyGyms
+-- (services/spatial_index.py). Each committed change to a row it holds is announced
+-- on the gym_changes channel with the gym id, so all workers update their copy at
+-- once instead of waiting for SPATIAL_INDEX_REFRESH_SECONDS.
+CREATE OR REPLACE FUNCTION notify_gym_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('gym_changes', OLD.id::text);
+    ELSE
+        PERFORM pg_notify('gym_changes', NEW.id::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the columns the snapshot holds: photo and pass option changes touch gyms.updated_at
+DROP TRIGGER IF EXISTS gyms_notify_change ON gyms;
+CREATE TRIGGER gyms_notify_change
+    AFTER INSERT OR DELETE OR UPDATE OF
+        gym_name, description, address1, address2, city, state, zipcode, longitude, latitude
+    ON gyms
+    FOR EACH ROW EXECUTE FUNCTION notify_gym_change();
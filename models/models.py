@@ -1,5 +1,5 @@
 from typing import List, Optional
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, root_validator, validator
 from decimal import Decimal
 
 
@@ -76,9 +76,10 @@ class GymCityResponse(BaseModel):
     coordinate: Coordinate
 
 class UserLocation(BaseModel):
-    latitude: float
-    longitude: float
-    radius_in_meters: float = 2000  # Default radius of 2000 meters or user specify
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    # Default radius of 2000 meters or user specify, at most 50 km
+    radius_in_meters: float = Field(2000, gt=0, le=50_000)
 
 class UpdateUserInfo(BaseModel):
     firstName: Optional[str]
@@ -86,7 +87,96 @@ class UpdateUserInfo(BaseModel):
     email: Optional[str]
 
 class ScannedQrCodeData(BaseModel):
-    pass_id: int
-    user_id: int
-    gym_id: int
-    duration: int
+    token: Optional[str]  # signed QR payload (services/qr_signing.py)
+    # Fields of the unsigned codes issued before signing was introduced
+    pass_id: Optional[int]
+    user_id: Optional[int]
+    gym_id: Optional[int]
+    duration: Optional[int]
+
+    @root_validator
+    def validate_code(cls, values):
+        if values.get("token") is None and None in (values.get(k) for k in ("pass_id", "user_id", "gym_id", "duration")):
+            raise ValueError("Either token or pass_id, user_id, gym_id and duration are required")
+        return values
+
+
+class Principal:
+    """
+        The authenticated caller, built once from a verified access token and
+        shared by every request that presents the same token.
+    """
+    __slots__ = ("user_id", "role", "gym_id", "first_name", "last_name", "expires_at")
+
+    def __init__(self, user_id: int, role: str, gym_id: Optional[int] = None,
+                 first_name: Optional[str] = None, last_name: Optional[str] = None,
+                 expires_at: Optional[float] = None):
+        self.user_id = user_id
+        self.role = role
+        self.gym_id = gym_id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_claims(cls, claims: dict):
+        return cls(
+            user_id=int(claims["sub"]),
+            role=claims["role"],
+            gym_id=claims.get("gym_id"),
+            first_name=claims.get("firstName"),
+            last_name=claims.get("lastName"),
+            expires_at=claims.get("exp"),
+        )
+
+    def __repr__(self):
+        return f"Principal(user_id={self.user_id!r}, role={self.role!r}, gym_id={self.gym_id!r})"
+
+
+class Row:
+    """
+        A database row mapped straight from a cursor, positionally in SELECT
+        column order, without a per-instance __dict__. Responses serialize it
+        through `as_dict` (utils/responses.py).
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def map(cls, rows):
+        return [cls(*row) for row in rows]
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.as_dict()!r})"
+
+
+class GymCityRow(Row):
+    __slots__ = ("id", "gym_name", "longitude", "latitude")
+
+    def as_dict(self):
+        return {"id": self.id, "gym_name": self.gym_name,
+                "coordinate": {"latitude": self.latitude, "longitude": self.longitude}}
+
+class PassOptionRow(Row):
+    __slots__ = ("id", "gym_id", "pass_name", "price", "duration", "description")
+
+class GymPhotoRow(Row):
+    __slots__ = ("id", "photo_url", "variants")
+
+class GuestPassRow(Row):
+    __slots__ = ("gym_id", "gym_name", "city", "pass_name", "duration_days", "description", "qr_code",
+                 "expiration", "is_valid", "latitude", "longitude", "purchase_id")
+
+class PassUsageRow(Row):
+    __slots__ = ("gym_id", "usage_date", "gym_name", "gym_city", "id")
+
+    def as_dict(self):
+        # id only orders the keyset, it is not part of the response
+        return {"gym_id": self.gym_id, "usage_date": self.usage_date, "gym_name": self.gym_name,
+                "gym_city": self.gym_city}
@@ -0,0 +1,143 @@
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+import asyncio
+import concurrent.futures
+import threading
+
+from routes.auth import get_current_user
+from services.exports import CONTENT_TYPES, EXPORTS, stream_export
+from services.gym_import import GymImport, iter_lines, parse_csv_rows, parse_ndjson_rows
+from services.cache import city_tag, response_cache
+from services.spatial_index import schedule_refresh
+from utils.settings import get_gym_import_batch_size
+
+router = APIRouter(
+    prefix='/admin',
+    tags=['admin']
+)
+
+# Request body chunks buffered between the event loop and the import thread
+IMPORT_QUEUE_SIZE = 16
+# How often the import thread checks whether the request is gone while it waits for a chunk,
+# and how long it waits in total before giving up on a client that stopped sending
+IMPORT_POLL_SECONDS = 1.0
+IMPORT_IDLE_SECONDS = 120.0
+
+
+class ImportAborted(Exception):
+    pass
+
+
+def _iter_queue(queue, loop, aborted):
+    # Runs on the import thread: pulls body chunks handed over by the event loop
+    while True:
+        pending = asyncio.run_coroutine_threadsafe(queue.get(), loop)
+        waited = 0.0
+        while True:
+            if aborted.is_set() or waited >= IMPORT_IDLE_SECONDS:
+                pending.cancel()
+                raise ImportAborted("The request body stopped arriving")
+            try:
+                chunk = pending.result(timeout=IMPORT_POLL_SECONDS)
+                break
+            except concurrent.futures.TimeoutError:
+                waited += IMPORT_POLL_SECONDS
+        if chunk is None:
+            return
+        yield chunk
+
+
+async def _put(queue, item, worker):
+    # Stop feeding if the import thread died, otherwise a full queue would block forever
+    put = asyncio.ensure_future(queue.put(item))
+    await asyncio.wait({put, worker}, return_when=asyncio.FIRST_COMPLETED)
+    if not put.done():
+        put.cancel()
+
+
+@router.post("/gyms/import")
+async def import_gyms(
+    request: Request,
+    user = Depends(get_current_user)
+):
+    """
+        Bulk-create gyms from a streamed body of rows shaped like GymCreateRequest.
+        Send `Content-Type: text/csv` (header row of field names) or `application/x-ndjson`.
+    """
+    if user.role not in ['admin']:
+        raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
+
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        parse_rows = parse_csv_rows
+    elif "ndjson" in content_type or "jsonl" in content_type:
+        parse_rows = parse_ndjson_rows
+    else:
+        raise HTTPException(status_code=415, detail="Send rows as text/csv or application/x-ndjson")
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=IMPORT_QUEUE_SIZE)
+    aborted = threading.Event()
+    gym_import = GymImport(get_gym_import_batch_size())
+    worker = asyncio.ensure_future(
+        run_in_threadpool(gym_import.run, parse_rows(iter_lines(_iter_queue(queue, loop, aborted))))
+    )
+
+    # Parsing, geocoding and COPY run on a worker thread while the body is still arriving
+    try:
+        async for chunk in request.stream():
+            if worker.done():
+                break
+            if chunk:
+                await _put(queue, chunk, worker)
+    except BaseException:
+        # Client disconnected or the request was cancelled: the thread stops at its next
+        # chunk and still loads the rows it read in full, but no one is left to answer
+        aborted.set()
+        worker.add_done_callback(lambda future: _after_import(gym_import))
+        raise
+    await _put(queue, None, worker)
+
+    try:
+        return await worker
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Failed to import gyms")
+    finally:
+        _after_import(gym_import)
+
+
+def _after_import(gym_import):
+    # Batches commit on their own, so whatever made it in must become visible even if the import failed later
+    if gym_import.imported:
+        # COPY does not hand back the new rows, rebuild the nearby-gyms snapshot instead
+        schedule_refresh()
+        response_cache.invalidate(*(city_tag(city) for city in gym_import.cities))
+
+
+@router.get("/exports/{export_name}")
+def export_rows(
+    export_name: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = Query(None, description="Only rows on or after this time"),
+    end: Optional[datetime] = Query(None, description="Only rows before this time"),
+    gym_id: Optional[int] = Query(None, description="Only rows for this gym (purchases and pass-usage)"),
+    user = Depends(get_current_user)
+):
+    """
+        Stream a full table export (users, purchases or pass-usage) as NDJSON or CSV.
+    """
+    if user.role not in ['admin']:
+        raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
+
+    if export_name not in EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unknown export, choose one of: {', '.join(EXPORTS)}")
+
+    filename = f"{export_name}-{datetime.utcnow():%Y%m%d%H%M%S}.{format}"
+    return StreamingResponse(
+        stream_export(export_name, format, start, end, gym_id),
+        media_type=CONTENT_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,5 +1,5 @@
 import uvicorn
-from fastapi import APIRouter, Depends, FastAPI, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, status, UploadFile, File
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.responses import JSONResponse
 from datetime import datetime, timedelta
@@ -10,28 +10,36 @@ from typing import List
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
+import asyncio
+import hashlib
+import logging
 import os
+import time
 import uuid
-from psycopg2 import IntegrityError
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
+from psycopg import IntegrityError
+from psycopg.types.json import Jsonb
 
 from models.models import *
 from services.database import *
-from utils.settings import get_blob_connection_string
+from services.blob_storage import PROFILE_PHOTOS_CONTAINER, blob_name_from_url
+from services.images import UnsupportedImage, delete_image, upload_variants
+from services.uploads import remove_file, stream_uploads
+from services.async_database import async_db_connection, get_async_db_connection
+from services import queries
+from services.roles import resolve_role
+from services.passwords import password_hasher
+from utils.lru_cache import LRUCache
+from utils.settings import get_token_cache_size
+from utils.pagination import NEXT_CURSOR_HEADER, PageParams, keyset_values, page_params, split_page
 
 load_dotenv()
+
+logger = logging.getLogger(__name__)
+
 SECRET_KEY = os.getenv("SECRET_KEY")  # Get the secret key
 ALGORITHM = os.getenv("ALGORITHM")  # Get the algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))  # Get the expiration time
 
-password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def hash_password(password: str):
-    return password_context.hash(password)
-
-def verify_password(plain_password, hashed_password):
-    return password_context.verify(plain_password, hashed_password)
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 async def create_access_token(data: dict):
@@ -41,7 +49,15 @@ async def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):  
+# Verified tokens, keyed by their sha256 digest, each kept until the token expires
+token_cache = LRUCache(get_token_cache_size())
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
+    key = hashlib.sha256(token.encode()).digest()
+    principal = token_cache.get(key)
+    if principal is not None:
+        return principal
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -49,11 +65,16 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     )  
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    
-    except JWTError:
+        principal = Principal.from_claims(payload)
+    except (JWTError, KeyError, ValueError):
         raise credentials_exception   
 
+    if principal.expires_at is not None:
+        ttl = principal.expires_at - time.time()
+        if ttl > 0:
+            token_cache.set(key, principal, ttl)
+    return principal
+
 router = APIRouter(
     prefix='/auth',
     tags=['auth']
@@ -62,43 +83,29 @@ router = APIRouter(
 @router.post("/login")
 async def login_for_access_token(
     user: LoginRequest, 
-    db: tuple = Depends(get_db_connection)
+    db: tuple = Depends(get_async_db_connection)
 ):
     connection, cursor = db
     try:
-        # Authenticate the user
-        cursor.execute("SELECT * FROM users WHERE email = %s", (user.email,))
-        user_data = cursor.fetchone()
+        # Authenticate the user; the role comes back with the same row
+        await queries.execute_async(cursor, queries.LOGIN_LOOKUP, (user.email,))
+        user_data = await cursor.fetchone()
         if not user_data:
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
-        stored_user = {
-            "id": user_data[0],
-            "firstName": user_data[1],
-            "lastName": user_data[2],
-            "email": user_data[3],
-            "password_hash": user_data[4],
-        }
+        user_id, first_name, last_name, password_hash, is_admin, gym_admin_of = user_data
 
-        if not verify_password(user.password, stored_user["password_hash"]):
+        # bcrypt runs on the password hashing pool, not on the event loop
+        valid, new_hash = await password_hasher.verify_and_update(user.password, password_hash)
+        if not valid:
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
-        user_id = stored_user["id"]
-        first_name = stored_user["firstName"]
-        last_name = stored_user["lastName"]
+        # Upgrade hashes made with an older cost factor now that we know the password
+        if new_hash:
+            await cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s", (new_hash, user_id))
+            await connection.commit()
 
-        # Determine the user's role and fetch gym_id if necessary
-        role = "user"
-        gym_id = None
-        cursor.execute("SELECT id FROM Admins WHERE user_id = %s", (user_id,))
-        if cursor.fetchone():
-            role = "admin"
-        else:
-            cursor.execute("SELECT gym_id FROM Gym_Admins WHERE user_id = %s", (user_id,))
-            gym_admin_data = cursor.fetchone()
-            if gym_admin_data:
-                role = "gym"
-                gym_id = gym_admin_data[0]
+        role, gym_id = resolve_role(is_admin, gym_admin_of)
 
         # Create access token
         token_data = {
@@ -117,12 +124,21 @@ async def login_for_access_token(
             return_data["gym_id"] = gym_id
 
         return return_data
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"An error occurred: {str(e)}")
+        logger.exception("Login failed")
         raise HTTPException(status_code=500, detail="Internal server error")
-    finally:
-        cursor.close()
-        connection.close()
+
+
+@router.get("/password-hashing/stats")
+async def password_hashing_stats(
+    user = Depends(get_current_user)
+):
+    if user.role not in ['admin']:
+        raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
+
+    return password_hasher.stats()
 
 
 @router.post("/logout")
@@ -136,12 +152,12 @@ async def logout():
 @router.post("/register")
 async def register(
     req: RegisterRequest,
-    db: tuple = Depends(get_db_connection)
+    db: tuple = Depends(get_async_db_connection)
 ):
     connection, cursor = db
-    hashed_password = hash_password(req.password)
+    hashed_password = await password_hasher.hash(req.password)
     try:
-        cursor.execute(
+        await cursor.execute(
             """
             INSERT INTO users (firstName, lastName, email, password_hash)
             VALUES (%s, %s, %s, %s)
@@ -149,9 +165,9 @@ async def register(
             """,
             (req.first_name, req.last_name, req.email, hashed_password),
         )
-        user_id = cursor.fetchone()[0]  # Get the inserted user ID
+        user_id = (await cursor.fetchone())[0]  # Get the inserted user ID
         
-        connection.commit()  
+        await connection.commit()  
 
         return ReturnIdResponse(id=user_id)
     
@@ -162,94 +178,118 @@ async def register(
         else:
             raise HTTPException(status_code=500, detail="Internal Server Error")
 
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
 
 @router.post("/users/{user_id}/profile-photo")
 async def upload_profile_photo(
     user_id: int,
-    profile_photo: UploadFile = File(...),
+    request: Request,
     user = Depends(get_current_user),
-    db: tuple = Depends(get_db_connection)
 ):
-    if user['role'] not in ['admin', 'user']:
+    if user.role not in ['admin', 'user']:
         raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
 
-    if user['role'] == 'user' and user['sub'] != user_id:
+    if user.role == 'user' and user.user_id != user_id:
         raise HTTPException(status_code=403, detail="Access denied: Cannot update other users info")
-    
-    connection, cursor = db
-    try:
-        # Check if user already has a profile photo
-        cursor.execute(
-            """
-            SELECT profile_photo FROM users WHERE id = %s
-            """,
-            (user_id,)
-        )
-        current_profile_photo_url = cursor.fetchone()[0]
 
-        blob_connection_string = get_blob_connection_string()
-        container_name = f"profile-photos"
-        blob_service_client = BlobServiceClient.from_connection_string(blob_connection_string)
-        container_client = blob_service_client.get_container_client(container_name)
+    # Generate a unique filename for the profile photo
+    def profile_photo_blob_name(filename):
+        return f"{user_id}_{uuid.uuid4().hex}{os.path.splitext(filename)[1]}"
 
-        # Delete the old profile photo from blob storage if it exists
-        if current_profile_photo_url:
-            blob_name = current_profile_photo_url.split("/")[-1]
-            blob_client = container_client.get_blob_client(blob_name)
-            blob_client.delete_blob()
-
-        # Generate a unique filename for the profile photo
-        unique_filename = f"{user_id}_{uuid.uuid4().hex}{os.path.splitext(profile_photo.filename)[1]}"
-        
-        # Check if the container exists, if not create one
-        if not container_client.exists():
-            container_client.create_container()
-
-        blob_client = container_client.get_blob_client(unique_filename)
-        blob_client.upload_blob(profile_photo.file)
-        profile_photo_url = f"https://travelfitstorage.blob.core.windows.net/{container_name}/{unique_filename}"
-        
-        # Update the user record with the profile photo URL
-        cursor.execute(
-            """
-            UPDATE users
-            SET profile_photo = %s
-            WHERE id = %s
-            """,
-            (profile_photo_url, user_id),
+    # The `profile_photo` file field is streamed straight into blob storage; no
+    # database connection is held while the body is being received
+    profile_photo = None
+    try:
+        async for upload in stream_uploads(request, PROFILE_PHOTOS_CONTAINER, profile_photo_blob_name):
+            if profile_photo is None and upload["field"] == "profile_photo":
+                profile_photo = upload
+            elif upload["status"] == "uploaded":
+                remove_file(upload["path"])
+                await delete_image(PROFILE_PHOTOS_CONTAINER, upload["url"])
+    except BaseException:
+        # The rest of the body never arrived: don't keep the photo that did
+        if profile_photo is not None and profile_photo["status"] == "uploaded":
+            remove_file(profile_photo["path"])
+            await asyncio.shield(delete_image(PROFILE_PHOTOS_CONTAINER, profile_photo["url"]))
+        raise
+
+    if profile_photo is None:
+        raise HTTPException(status_code=400, detail="A profile_photo file is required")
+    if profile_photo["status"] != "uploaded":
+        raise HTTPException(status_code=500, detail="Failed to upload profile photo")
+
+    profile_photo_url = profile_photo["url"]
+    try:
+        variants = await upload_variants(
+            PROFILE_PHOTOS_CONTAINER, blob_name_from_url(profile_photo_url, PROFILE_PHOTOS_CONTAINER), profile_photo["path"]
         )
-        
-        connection.commit()  # Commit the transaction
+    except Exception as e:
+        # The original is already stored, don't keep it without its variants
+        await asyncio.gather(delete_image(PROFILE_PHOTOS_CONTAINER, profile_photo_url), return_exceptions=True)
+        if isinstance(e, UnsupportedImage):
+            raise HTTPException(status_code=400, detail="Not a supported image")
+        logger.warning("Making variants of the profile photo of user %s failed: %s", user_id, e)
+        raise HTTPException(status_code=500, detail="Failed to upload profile photo")
+    finally:
+        remove_file(profile_photo["path"])
 
-        return {"message": "Profile photo uploaded successfully", "profile_photo_url": profile_photo_url}
+    current = None
+    try:
+        async with async_db_connection() as (connection, cursor):
+            # Swap the photo in one short transaction
+            await cursor.execute(
+                "SELECT profile_photo, profile_photo_variants FROM users WHERE id = %s FOR UPDATE",
+                (user_id,)
+            )
+            current = await cursor.fetchone()
+            if current is not None:
+                await cursor.execute(
+                    """
+                    UPDATE users
+                    SET profile_photo = %s, profile_photo_variants = %s
+                    WHERE id = %s
+                    """,
+                    (profile_photo_url, Jsonb(variants), user_id),
+                )
+                await connection.commit()
+    except Exception as e:
+        # Don't leave blobs behind that no row points to
+        await asyncio.gather(delete_image(PROFILE_PHOTOS_CONTAINER, profile_photo_url, variants), return_exceptions=True)
+        if isinstance(e, HTTPException):
+            raise
+        logger.warning("Saving the profile photo of user %s failed: %s", user_id, e)
+        raise HTTPException(status_code=500, detail="Failed to save profile photo")
+
+    if current is None:
+        await asyncio.gather(delete_image(PROFILE_PHOTOS_CONTAINER, profile_photo_url, variants), return_exceptions=True)
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # Delete the old profile photo and its variants from blob storage if it exists
+    current_profile_photo_url, current_variants = current
+    if current_profile_photo_url:
+        await delete_image(PROFILE_PHOTOS_CONTAINER, current_profile_photo_url, current_variants)
+
+    return {"message": "Profile photo uploaded successfully", "profile_photo_url": profile_photo_url,
+            "profile_photo_variants": variants}
     
-    finally:
-        cursor.close()
-        connection.close()
 
 @router.put("/users/{user_id}")
 async def update_user_info(
     user_id: int,
     user_info: UpdateUserInfo,
     user = Depends(get_current_user),
-    db: tuple = Depends(get_db_connection)
+    db: tuple = Depends(get_async_db_connection)
 ):
-    if user['role'] not in ['admin', 'user']:
+    if user.role not in ['admin', 'user']:
         raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
 
-    if user['role'] == 'user' and user['sub'] != user_id:
+    if user.role == 'user' and user.user_id != user_id:
         raise HTTPException(status_code=403, detail="Access denied: Cannot update other users info")
 
     connection, cursor = db
     try:
          # Check if the user exists
-        cursor.execute("SELECT id FROM users WHERE id = %s", (user_id,))
-        user = cursor.fetchone()
+        await cursor.execute("SELECT id FROM users WHERE id = %s", (user_id,))
+        user = await cursor.fetchone()
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
@@ -275,18 +315,15 @@ async def update_user_info(
         update_values.append(user_id)
 
         # Execute the UPDATE query
-        cursor.execute(update_query, update_values)
-        connection.commit()
+        await cursor.execute(update_query, update_values)
+        await connection.commit()
 
         return {"message": "User information updated successfully"}
 
     except Exception as e:
-        connection.rollback()
+        await connection.rollback()
         raise HTTPException(status_code=500, detail="Failed to update user information")
 
-    finally:
-        cursor.close()
-        connection.close()
 
 @router.get("/users/{user_id}")
 def get_user_info(
@@ -294,17 +331,17 @@ def get_user_info(
     user = Depends(get_current_user),
     db: tuple = Depends(get_db_connection)
 ):
-    if user['role'] not in ['admin', 'user']:
+    if user.role not in ['admin', 'user']:
         raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
 
-    if user['role'] == 'user' and user['sub'] != user_id:
+    if user.role == 'user' and user.user_id != user_id:
         raise HTTPException(status_code=403, detail="Access denied: Cannot view other users info")
 
     connection, cursor = db
     try:
         cursor.execute(
             """
-            SELECT firstName, lastName, email, profile_photo
+            SELECT firstName, lastName, email, profile_photo, profile_photo_variants
             FROM users
             WHERE id = %s
             """,
@@ -322,7 +359,8 @@ def get_user_info(
             "first_name": user[0],
             "last_name": user[1],
             "email": user[2],
-            "profile_photo": user[3] if user[3] is not None else None
+            "profile_photo": user[3] if user[3] is not None else None,
+            "profile_photo_variants": user[4]
         }
         
         return user_info
@@ -330,44 +368,42 @@ def get_user_info(
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to fetch user info")
 
-    finally:
-        cursor.close()
-        connection.close()
 
 @router.get("/users")
 async def all_users(
     user = Depends(get_current_user),
-    db: tuple = Depends(get_db_connection)
+    page: PageParams = Depends(page_params),
+    db: tuple = Depends(get_async_db_connection)
 ):
-    if user['role'] not in ['admin']:
+    if user.role not in ['admin']:
         raise HTTPException(status_code=403, detail="Access denied: Unauthorized role")
 
     connection, cursor = db
+    after = keyset_values(page, int)
     
-    try:
-        cursor.execute(
-            """
-            SELECT * FROM users
-            """
-        )
-        users = cursor.fetchall()
-
-        # Convert the result to a list of dictionaries
-        user_list = [
-            {
-                "id": user[0],
-                "firstName": user[1],
-                "lastName": user[2],
-                "email": user[3],
-                "password_hash": user[4]
-            }
-            for user in users
-        ]
-
-        return JSONResponse(content={"users": user_list}, status_code=200)
+    await cursor.execute(
+        f"""
+        SELECT id, firstName, lastName, email, password_hash
+        FROM users
+        {"WHERE id > %s" if after else ""}
+        ORDER BY id
+        LIMIT %s
+        """,
+        (*(after or []), page.limit + 1)
+    )
+    users, next_cursor = split_page(await cursor.fetchall(), page, lambda user: [user[0]])
+
+    # Convert the result to a list of dictionaries
+    user_list = [
+        {
+            "id": user[0],
+            "firstName": user[1],
+            "lastName": user[2],
+            "email": user[3],
+            "password_hash": user[4]
+        }
+        for user in users
+    ]
 
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return JSONResponse(content={"users": user_list}, status_code=200, headers=headers)
@@ -0,0 +1,84 @@
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from psycopg import AsyncCursor
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+import os
+
+from services.metrics import time_query
+from services.sql_trace import traced
+from utils.settings import get_async_db_pool_settings
+
+
+class TimedAsyncCursor(AsyncCursor):
+    """
+        Records every statement in the db_query_duration_seconds histogram
+        (services/metrics.py) and in the request's SQL trace (services/sql_trace.py).
+    """
+
+    async def execute(self, query, params=None, **kwargs):
+        with time_query("psycopg", query), traced(self, query):
+            return await super().execute(query, params, **kwargs)
+
+    async def executemany(self, query, params_seq, **kwargs):
+        with time_query("psycopg", query), traced(self, query):
+            return await super().executemany(query, params_seq, **kwargs)
+
+
+def get_conninfo():
+    return make_conninfo(
+        dbname=os.getenv("DATABASE_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        sslmode=os.getenv("DB_SSL"),
+    )
+
+
+_async_pool = None
+
+
+def get_async_pool():
+    global _async_pool
+    if _async_pool is None:
+        settings = get_async_db_pool_settings()
+        # Created closed; opened from the app startup hook once the event loop is running
+        _async_pool = AsyncConnectionPool(
+            get_conninfo(),
+            kwargs={"cursor_factory": TimedAsyncCursor},
+            min_size=settings["min_size"],
+            max_size=settings["max_size"],
+            max_lifetime=settings["max_lifetime"],
+            timeout=settings["timeout"],
+            open=False,
+        )
+    return _async_pool
+
+
+async def open_async_pool():
+    await get_async_pool().open()
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+
+
+@asynccontextmanager
+async def async_db_connection():
+    # The pool commits when the block exits cleanly and rolls back when it raises
+    try:
+        async with get_async_pool().connection() as connection:
+            async with connection.cursor() as cursor:
+                yield connection, cursor
+    except PoolTimeout:
+        raise HTTPException(status_code=503, detail="Database is busy, please try again")
+
+
+async def get_async_db_connection():
+    # Route dependency for `async def` handlers: awaitable cursor, no blocking of the event loop
+    async with async_db_connection() as db:
+        yield db
@@ -0,0 +1,136 @@
+from contextlib import contextmanager
+from urllib.parse import unquote, urlparse
+import logging
+import threading
+import time
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.storage.blob import ContentSettings
+from azure.storage.blob.aio import BlobServiceClient
+from fastapi import HTTPException
+
+from services.metrics import time_external_call
+from utils.settings import get_blob_connection_string
+
+logger = logging.getLogger(__name__)
+
+GYM_PHOTOS_CONTAINER = "gym-photos"
+PROFILE_PHOTOS_CONTAINER = "profile-photos"
+CONTAINERS = (GYM_PHOTOS_CONTAINER, PROFILE_PHOTOS_CONTAINER)
+
+
+def blob_name_from_url(url, container):
+    """ Blob name inside `container` for a URL we handed out (Azure or Azurite style). """
+    path = unquote(urlparse(url).path)
+    marker = f"/{container}/"
+    return path[path.index(marker) + len(marker):] if marker in path else path.rsplit("/", 1)[-1]
+
+
+class BlobStorage:
+    """
+        One async BlobServiceClient per process, so every request reuses the same
+        HTTP connection pool, with a client per container made once. Containers
+        are created (if missing) at startup instead of checking `exists()` on every
+        upload. Each call is timed per operation for `stats()`.
+    """
+
+    def __init__(self, connection_string, containers):
+        self.connection_string = connection_string
+        self.containers = containers
+        self._service = None
+        self._containers = {}
+        self._lock = threading.Lock()
+        self._timings = {}
+
+    async def open(self):
+        if self._service is not None:
+            return
+        if not self.connection_string:
+            logger.warning("BLOB_CONNECTION_STRING is not set, photo uploads are disabled")
+            return
+
+        self._service = BlobServiceClient.from_connection_string(self.connection_string)
+        for name in self.containers:
+            container = self._service.get_container_client(name)
+            try:
+                await container.create_container()
+            except ResourceExistsError:
+                pass
+            self._containers[name] = container
+
+    async def close(self):
+        service, self._service = self._service, None
+        self._containers = {}
+        if service is not None:
+            await service.close()
+
+    def container(self, name):
+        if self._service is None:
+            raise HTTPException(status_code=503, detail="Blob storage is not configured")
+        return self._containers[name]
+
+    async def upload(self, container, blob_name, data, overwrite=False, **kwargs):
+        """ Upload `data` (bytes, file object or async iterator) and return the blob URL. """
+        blob_client = self.container(container).get_blob_client(blob_name)
+        with self._timed("upload"):
+            await blob_client.upload_blob(data, overwrite=overwrite, **kwargs)
+        return blob_client.url
+
+    async def stage_block(self, container, blob_name, block_id, data):
+        blob_client = self.container(container).get_blob_client(blob_name)
+        with self._timed("stage_block"):
+            await blob_client.stage_block(block_id, data)
+
+    async def commit_blocks(self, container, blob_name, block_ids, content_type=None):
+        """
+            Commit staged blocks as the blob's content and return its URL. Like
+            `upload`, this refuses to replace an existing blob (ResourceExistsError).
+        """
+        blob_client = self.container(container).get_blob_client(blob_name)
+        with self._timed("commit_blocks"):
+            await blob_client.commit_block_list(
+                block_ids,
+                content_settings=ContentSettings(content_type=content_type),
+                etag="*",
+                match_condition=MatchConditions.IfMissing,
+            )
+        return blob_client.url
+
+    async def delete(self, container, blob_name, missing_ok=False):
+        """ Returns False when the blob did not exist. """
+        blob_client = self.container(container).get_blob_client(blob_name)
+        try:
+            with self._timed("delete"):
+                await blob_client.delete_blob()
+            return True
+        except ResourceNotFoundError:
+            if missing_ok:
+                return False
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {op: dict(timing) for op, timing in self._timings.items()}
+
+    @contextmanager
+    def _timed(self, op):
+        start = time.perf_counter()
+        failed = False
+        try:
+            with time_external_call("azure_blob", op):
+                yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                timing = self._timings.setdefault(op, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+                timing["count"] += 1
+                timing["errors"] += failed
+                timing["total_ms"] += elapsed_ms
+                timing["max_ms"] = max(timing["max_ms"], elapsed_ms)
+
+
+blob_storage = BlobStorage(get_blob_connection_string(), CONTAINERS)
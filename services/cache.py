@@ -0,0 +1,190 @@
+import json
+import logging
+import threading
+import time
+
+from utils.lru_cache import LRUCache
+from utils.responses import dumps
+from utils.settings import get_response_cache_settings
+
+logger = logging.getLogger(__name__)
+
+# After a backend error, reads skip the backend for this long instead of failing (and logging) per request
+BACKEND_RETRY_SECONDS = 5.0
+# A shared cache that answers slower than this is treated as down
+BACKEND_TIMEOUT_SECONDS = 0.5
+
+# Invalidation is version based: every tag has a counter, entries remember the counters
+# they were built under and are treated as misses once any of them has been bumped.
+
+
+class InProcessBackend:
+    """ Single-node backend: entries live in this worker's memory. """
+
+    def __init__(self, max_entries):
+        self._entries = LRUCache(max_entries)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, value, versions, ttl):
+        self._entries.set(key, (value, versions), ttl=ttl)
+
+    def tag_versions(self, tags):
+        with self._lock:
+            return {tag: self._versions.get(tag, 0) for tag in tags}
+
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+
+class RedisBackend:
+    """ Shared backend for a fleet: every worker sees the same entries and tag versions. """
+
+    def __init__(self, url, prefix="travelfit:cache:"):
+        import redis
+
+        self._client = redis.Redis.from_url(
+            url, socket_connect_timeout=BACKEND_TIMEOUT_SECONDS, socket_timeout=BACKEND_TIMEOUT_SECONDS
+        )
+        self._prefix = prefix
+
+    def get(self, key):
+        raw = self._client.get(self._prefix + key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        return entry["value"], entry["versions"]
+
+    def set(self, key, value, versions, ttl):
+        entry = dumps({"value": value, "versions": versions})
+        # Milliseconds: EX rounds sub-second TTLs down to 0, which Redis rejects
+        self._client.set(self._prefix + key, entry, px=max(1, int(ttl * 1000)) if ttl else None)
+
+    def tag_versions(self, tags):
+        tags = list(tags)
+        values = self._client.mget([self._prefix + "tag:" + tag for tag in tags]) if tags else []
+        return {tag: int(value or 0) for tag, value in zip(tags, values)}
+
+    def invalidate(self, tags):
+        pipeline = self._client.pipeline()
+        for tag in tags:
+            pipeline.incr(self._prefix + "tag:" + tag)
+        pipeline.execute()
+
+
+class ResponseCache:
+    """
+        Read-through cache for endpoint payloads. A backend outage degrades to
+        uncached reads instead of failing the request: after an error the backend
+        is left alone for BACKEND_RETRY_SECONDS, and an outage is logged once when
+        it starts and once when it ends.
+    """
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "errors": 0, "skipped": 0}
+        self._down_until = None
+
+    def get_or_load(self, key, tags, loader, ttl=None):
+        """
+            Return the cached value for `key`, or call `loader()` and cache its result
+            under `tags`. Tag versions are read before loading, so a write that lands
+            while we load leaves the new entry already stale.
+        """
+        if not self._available():
+            self._count("skipped")
+            return loader()
+        try:
+            versions = self.backend.tag_versions(tags)
+            entry = self.backend.get(key)
+        except Exception:
+            self._failed("read", key)
+            return loader()
+        self._recovered()
+
+        if entry is not None and entry[1] == versions:
+            self._count("hits")
+            return entry[0]
+
+        self._count("misses")
+        value = loader()
+        try:
+            self.backend.set(key, value, versions, self.ttl if ttl is None else ttl)
+        except Exception:
+            self._failed("write", key)
+        return value
+
+    def invalidate(self, *tags):
+        # Always attempted, even while the backend looks down: a lost invalidation means stale reads later
+        try:
+            self.backend.invalidate(tags)
+            self._count("invalidations", len(tags))
+        except Exception:
+            self._failed("invalidation", tags)
+            return
+        self._recovered()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        stats["backend"] = type(self.backend).__name__
+        return stats
+
+    def _available(self):
+        down_until = self._down_until
+        return down_until is None or time.monotonic() >= down_until
+
+    def _failed(self, action, key):
+        with self._lock:
+            self._stats["errors"] += 1
+            first = self._down_until is None
+            self._down_until = time.monotonic() + BACKEND_RETRY_SECONDS
+        if first:
+            logger.exception("Response cache %s failed for %s, bypassing the cache while it is down", action, key)
+        else:
+            logger.debug("Response cache %s failed for %s", action, key, exc_info=True)
+
+    def _recovered(self):
+        if self._down_until is None:
+            return
+        with self._lock:
+            recovered, self._down_until = self._down_until is not None, None
+        if recovered:
+            logger.warning("Response cache backend is reachable again")
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+
+def gym_tag(gym_id):
+    return f"gym:{gym_id}"
+
+def city_tag(city):
+    return f"city:{city}"
+
+
+def _create_response_cache():
+    settings = get_response_cache_settings()
+    if settings["backend"] == "redis":
+        backend = RedisBackend(settings["url"])
+    else:
+        if settings["workers"] > 1:
+            logger.warning(
+                "RESPONSE_CACHE_BACKEND=memory with WEB_CONCURRENCY=%d: writes only invalidate the worker "
+                "that handled them, other workers can serve stale entries for up to %ss",
+                settings["workers"], settings["ttl"]
+            )
+        backend = InProcessBackend(settings["max_entries"])
+    return ResponseCache(backend, settings["ttl"])
+
+response_cache = _create_response_cache()
@@ -1,86 +1,249 @@
+from contextlib import contextmanager
+from collections import deque
 from fastapi import Depends, HTTPException
 import psycopg2
+from psycopg2 import extensions
 import os
+import threading
+import time
 
+from services.metrics import time_query
+from services.sql_trace import traced
+from services.roles import USER_ROLE_BY_ID, resolve_role
+from utils.settings import get_db_pool_settings
 
-def get_db_connection():
-    try:
-        database_name = os.getenv("DATABASE_NAME")
-        user = os.getenv("DB_USER")
-        password = os.getenv("DB_PASSWORD")
-        host = os.getenv("DB_HOST")
-        port = os.getenv("DB_PORT")
-        ssl = os.getenv("DB_SSL")
 
-        connection = psycopg2.connect(
-            database=database_name, user=user, password=password, host=host, port=port, sslmode=ssl
-        )
+class PooledConnection(extensions.connection):
+    """ psycopg2 connection that remembers which registry statements it has prepared (services/queries.py). """
 
-        cursor = connection.cursor()
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
 
-        return connection, cursor
 
-    except Exception as e:
-        raise e
+class TimedCursor(extensions.cursor):
+    """
+        Records every statement in the db_query_duration_seconds histogram
+        (services/metrics.py) and in the request's SQL trace (services/sql_trace.py).
+    """
 
+    def execute(self, query, vars=None):
+        with time_query("psycopg2", query), traced(self, query):
+            return super().execute(query, vars)
 
-def get_user(user_id, db):
-    connection, cursor = db
-    try:
-        cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-        user_row = cursor.fetchone()
-        return user_row
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
+    def executemany(self, query, vars_list):
+        with time_query("psycopg2", query), traced(self, query):
+            return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        with time_query("psycopg2", sql), traced(self, sql):
+            return super().copy_expert(sql, file, size)
+
+
+def connect():
+    database_name = os.getenv("DATABASE_NAME")
+    user = os.getenv("DB_USER")
+    password = os.getenv("DB_PASSWORD")
+    host = os.getenv("DB_HOST")
+    port = os.getenv("DB_PORT")
+    ssl = os.getenv("DB_SSL")
+
+    return psycopg2.connect(
+        database=database_name, user=user, password=password, host=host, port=port, sslmode=ssl,
+        connection_factory=PooledConnection, cursor_factory=TimedCursor,
+    )
+
+
+class ConnectionPool:
+    """
+        Bounded pool of psycopg2 connections shared by the threads of one worker process.
+        Callers block (up to `timeout` seconds) when every connection is checked out.
+    """
+
+    def __init__(self, min_size, max_size, max_lifetime, timeout, health_check_interval):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = deque()  # (connection, created_at, last_used_at)
+        self._in_use = {}  # id(connection) -> created_at
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "timeouts": 0,
+            "connections_opened": 0,
+            "connections_discarded": 0,
+        }
+
+    def open(self):
+        # Warm up the minimum number of connections so the first requests skip the handshake
+        now = time.monotonic()
+        with self._lock:
+            missing = self.min_size - len(self._idle) - len(self._in_use)
+        for _ in range(missing):
+            connection = self._open_connection()
+            with self._lock:
+                self._idle.append((connection, now, now))
+
+    def getconn(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise HTTPException(status_code=503, detail="Database is busy, please try again")
+        waited = time.perf_counter() - start
+
+        try:
+            connection, created_at = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use[id(connection)] = created_at
+            self._stats["checkouts"] += 1
+            self._stats["total_wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+            if waited > 0.001:
+                self._stats["waits"] += 1
+        return connection
+
+    def putconn(self, connection):
+        try:
+            with self._lock:
+                created_at = self._in_use.pop(id(connection), None)
+
+            if not connection.closed:
+                status = connection.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    # Server connection was lost
+                    connection.close()
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    # Request left a transaction open or failed, reset before reuse
+                    connection.rollback()
+
+            now = time.monotonic()
+            if connection.closed or created_at is None or self._closed or self._expired(created_at, now):
+                self._discard(connection)
+            else:
+                with self._lock:
+                    self._idle.append((connection, created_at, now))
+        except psycopg2.Error:
+            self._discard(connection)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for connection, _, _ in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_use"] = len(self._in_use)
+            stats["idle"] = len(self._idle)
+        stats["max_size"] = self.max_size
+        stats["avg_wait_seconds"] = stats["total_wait_seconds"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        return stats
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                # LIFO keeps the warmest connections busy and lets surplus ones age out
+                entry = self._idle.pop() if self._idle else None
+
+            if entry is None:
+                return self._open_connection(), time.monotonic()
+
+            connection, created_at, last_used_at = entry
+            now = time.monotonic()
+            if connection.closed or self._expired(created_at, now):
+                self._discard(connection)
+                continue
+            if now - last_used_at > self.health_check_interval and not self._is_healthy(connection):
+                self._discard(connection)
+                continue
+            return connection, created_at
+
+    def _open_connection(self):
+        connection = connect()
+        with self._lock:
+            self._stats["connections_opened"] += 1
+        return connection
+
+    def _expired(self, created_at, now):
+        return now - created_at > self.max_lifetime
+
+    def _is_healthy(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, connection):
+        with self._lock:
+            self._stats["connections_discarded"] += 1
+        try:
             connection.close()
+        except psycopg2.Error:
+            pass
 
-def insert_gym_photo_into_database(gym_id: int, photo_url: str, db):
-    
-    connection, cursor = db
 
-    try:
-        cursor.execute(
-            """
-            INSERT INTO GymPhotos (gym_id, photo_url)
-            VALUES (%s, %s)
-            RETURNING id
-            """,
-            (gym_id, photo_url)
-        )
-        photo_id = cursor.fetchone()[0]
-        connection.commit()
-        return photo_id
-    except psycopg2.Error as e:
-        connection.rollback()
-        raise e
-    finally:
-        cursor.close()
-        connection.close()
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
 
-def get_photo_by_id(photo_id: int, db):
-    connection, cursor = db
-    try:
-        cursor.execute("SELECT * FROM GymPhotos WHERE id = %s", (photo_id,))
-        return cursor.fetchone()
-    except Exception as e:
-        raise e
-    finally:
-        cursor.close()
-        connection.close()
 
-def delete_gym_photo(photo_id: int, db):
-    connection, cursor = db
+def get_pool():
+    global _pool, _pool_pid
+    # Each worker process gets its own pool, connections must never be shared across a fork
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool(**get_db_pool_settings())
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.close()
+        _pool = None
+
+
+@contextmanager
+def db_connection():
+    pool = get_pool()
+    connection = pool.getconn()
+    cursor = connection.cursor()
     try:
-        cursor.execute("DELETE FROM GymPhotos WHERE id = %s", (photo_id,))
-        connection.commit()
-    except Exception as e:
-        connection.rollback()
-        raise e
+        yield connection, cursor
     finally:
         cursor.close()
-        connection.close()
+        pool.putconn(connection)
+
+
+def get_db_connection():
+    # Route dependency: the connection goes back to the pool once the request is done
+    with db_connection() as db:
+        yield db
+
 
 def is_user_admin(user_id: int, db) -> bool:
     """
@@ -88,13 +251,7 @@ def is_user_admin(user_id: int, db) -> bool:
         bool: True if the user is an admin, False otherwise.
     """
     connection, cursor = db
-    try:
-        cursor.execute("SELECT id FROM Admins WHERE user_id = %s", (user_id,))
-        admin = cursor.fetchone()
-        return admin is not None
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
-
+    # Same role lookup as login (services/roles.py), so both agree on who is an admin
+    cursor.execute(USER_ROLE_BY_ID, (user_id,))
+    user = cursor.fetchone()
+    return user is not None and resolve_role(user[4], user[5])[0] == "admin"
@@ -0,0 +1,80 @@
+import csv
+import io
+import json
+import uuid
+
+from services.database import db_connection
+
+# Rows pulled from the server-side cursor per round trip, and per chunk written to the client
+EXPORT_FETCH_SIZE = 2000
+
+EXPORTS = {
+    "users": {
+        "table": "users",
+        "columns": ["id", "firstName", "lastName", "email", "profile_photo", "created_at"],
+        "date_column": "created_at",
+        "gym_column": None,
+    },
+    "purchases": {
+        "table": "GuestPassPurchases",
+        "columns": ["id", "user_id", "gym_id", "pass_option_id", "purchase_date", "expiration_date", "is_valid"],
+        "date_column": "purchase_date",
+        "gym_column": "gym_id",
+    },
+    "pass-usage": {
+        "table": "PassUsage",
+        "columns": ["id", "purchase_id", "user_id", "gym_id", "gym_name", "gym_city", "usage_date"],
+        "date_column": "usage_date",
+        "gym_column": "gym_id",
+    },
+}
+
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def build_export_query(export, start=None, end=None, gym_id=None):
+    conditions, params = [], []
+    if start is not None:
+        conditions.append(f"{export['date_column']} >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append(f"{export['date_column']} < %s")
+        params.append(end)
+    if gym_id is not None and export["gym_column"]:
+        conditions.append(f"{export['gym_column']} = %s")
+        params.append(gym_id)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"SELECT {', '.join(export['columns'])} FROM {export['table']} {where} ORDER BY id", params
+
+
+def _ndjson_chunk(columns, rows):
+    return "".join(json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in rows)
+
+def _csv_chunk(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def stream_export(name, fmt, start=None, end=None, gym_id=None):
+    """
+        Yield an export as NDJSON or CSV text chunks. Rows come from a server-side
+        (named) cursor EXPORT_FETCH_SIZE at a time, so memory use does not grow
+        with the table.
+    """
+    export = EXPORTS[name]
+    query, params = build_export_query(export, start, end, gym_id)
+
+    with db_connection() as (connection, _):
+        with connection.cursor(name=f"export_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = EXPORT_FETCH_SIZE
+            cursor.execute(query, params)
+
+            if fmt == "csv":
+                yield _csv_chunk([export["columns"]])
+            while True:
+                rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                yield _ndjson_chunk(export["columns"], rows) if fmt == "ndjson" else _csv_chunk(rows)
@@ -0,0 +1,158 @@
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import execute_values
+import googlemaps
+import hashlib
+import re
+import threading
+
+from services.metrics import time_external_call
+from utils.lru_cache import LRUCache
+from utils.settings import get_geocoding_settings
+
+
+def format_address(address1, city, state, zipcode):
+    return f"{address1}, {city}, {state}, {zipcode}"
+
+def normalize_address(address: str) -> str:
+    """
+        Cache key for an address: case, punctuation and spacing differences
+        ("123 Main St." vs "123  main st") map to the same key.
+    """
+    address = re.sub(r"[^\w#]+", " ", address.lower())
+    return " ".join(address.split())
+
+
+class GoogleGeocodingProvider:
+    def __init__(self, api_key):
+        # One client per process, it keeps its HTTP session between calls
+        self._client = googlemaps.Client(key=api_key)
+
+    def geocode(self, address):
+        with time_external_call("google_maps", "geocode"):
+            geocode_result = self._client.geocode(address)
+        if not geocode_result:
+            return None
+        location = geocode_result[0]['geometry']['location']
+        return location['lat'], location['lng']
+
+
+class LocalGeocodingProvider:
+    """
+        Offline stand-in for tests and local development. Known addresses resolve to
+        the given coordinates, anything else to a stable point inside the continental US.
+    """
+
+    def __init__(self, known_addresses=None):
+        self.known = {normalize_address(address): coordinates for address, coordinates in (known_addresses or {}).items()}
+
+    def geocode(self, address):
+        key = normalize_address(address)
+        if key in self.known:
+            return self.known[key]
+        digest = hashlib.sha256(key.encode()).digest()
+        latitude = 25 + int.from_bytes(digest[:4], "big") / 2**32 * 24
+        longitude = -124 + int.from_bytes(digest[4:8], "big") / 2**32 * 57
+        return round(latitude, 6), round(longitude, 6)
+
+
+class GeocodingService:
+    """
+        Geocoding with two cache levels in front of the provider: an in-memory LRU
+        and the geocode_cache table. New results are written with the caller's
+        connection and persist when the caller commits; they only enter the LRU once
+        the caller passes them to `remember` after that commit, so a rolled back
+        transaction can't leave the LRU holding addresses the table never got.
+    """
+
+    def __init__(self, provider, cache_size, max_workers):
+        self.provider = provider
+        self._memory = LRUCache(cache_size)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="geocode")
+
+    def geocode(self, address, db):
+        """ (latitude, longitude) or None for one address, plus the new results as in `geocode_many`. """
+        found, new = self.geocode_many([address], db)
+        return found[address], new
+
+    def remember(self, new):
+        """ Cache results from `geocode_many` in memory once the transaction that wrote them committed. """
+        for key, coordinates in new.items():
+            self._memory.set(key, coordinates)
+
+    def geocode_many(self, addresses, db):
+        """
+            Geocode many addresses with one cache-table lookup and parallel provider calls.
+            Returns ({address: (latitude, longitude) or None}, new), `new` being the provider
+            results inserted into geocode_cache to hand to `remember` after committing.
+        """
+        connection, cursor = db
+        keys = {address: normalize_address(address) for address in addresses}
+        found = {}
+
+        missing = set()
+        for key in set(keys.values()):
+            coordinates = self._memory.get(key)
+            if coordinates is None:
+                missing.add(key)
+            else:
+                found[key] = coordinates
+
+        if missing:
+            cursor.execute(
+                "SELECT address_key, latitude, longitude FROM geocode_cache WHERE address_key = ANY(%s)",
+                (list(missing),)
+            )
+            for key, latitude, longitude in cursor.fetchall():
+                found[key] = (latitude, longitude)
+                self._memory.set(key, (latitude, longitude))
+                missing.discard(key)
+
+        if missing:
+            # Keep one original spelling per key to send to the provider
+            originals = {}
+            for address, key in keys.items():
+                if key in missing:
+                    originals.setdefault(key, address)
+
+            fresh = dict(zip(originals, self._executor.map(self.provider.geocode, originals.values())))
+            fresh = {key: coordinates for key, coordinates in fresh.items() if coordinates}
+            if fresh:
+                execute_values(
+                    cursor,
+                    """
+                    INSERT INTO geocode_cache (address_key, latitude, longitude)
+                    VALUES %s
+                    ON CONFLICT (address_key) DO NOTHING
+                    """,
+                    [(key, latitude, longitude) for key, (latitude, longitude) in fresh.items()]
+                )
+            found.update(fresh)
+        else:
+            fresh = {}
+
+        return {address: found.get(key) for address, key in keys.items()}, fresh
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder():
+    global _geocoder
+    if _geocoder is None:
+        with _geocoder_lock:
+            if _geocoder is None:
+                settings = get_geocoding_settings()
+                if settings["provider"] == "local":
+                    provider = LocalGeocodingProvider()
+                else:
+                    provider = GoogleGeocodingProvider(settings["api_key"])
+                _geocoder = GeocodingService(provider, settings["cache_size"], settings["max_workers"])
+    return _geocoder
+
+def set_geocoding_provider(provider):
+    """ Swap the provider (e.g. a LocalGeocodingProvider in tests); clears the in-memory cache. """
+    global _geocoder
+    settings = get_geocoding_settings()
+    with _geocoder_lock:
+        _geocoder = GeocodingService(provider, settings["cache_size"], settings["max_workers"])
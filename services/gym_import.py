@@ -0,0 +1,168 @@
+from pydantic import ValidationError
+import codecs
+import csv
+import io
+import json
+
+from models.models import GymCreateRequest
+from services.database import db_connection
+from services.geocoding import format_address, get_geocoder
+
+GYM_COPY_COLUMNS = (
+    "gym_name", "description", "address1", "address2", "city", "state", "zipcode",
+    "longitude", "latitude", "location", "amenities", "hours_of_operation",
+)
+MAX_REPORTED_ERRORS = 1000
+
+
+def iter_lines(chunks):
+    """ Split a stream of byte chunks into text lines (line endings kept) without buffering the whole body. """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+def parse_csv_rows(lines):
+    """
+        CSV rows with a header of GymCreateRequest field names. `amenities` is a
+        ';' separated list (or a JSON array) and `hours_of_operation` a JSON object.
+    """
+    reader = csv.DictReader(lines)
+    for row_number, row in enumerate(reader, start=1):
+        try:
+            amenities = (row.get("amenities") or "").strip()
+            if amenities.startswith("["):
+                row["amenities"] = json.loads(amenities)
+            else:
+                row["amenities"] = [amenity.strip() for amenity in amenities.split(";") if amenity.strip()]
+            hours = (row.get("hours_of_operation") or "").strip()
+            row["hours_of_operation"] = json.loads(hours) if hours else None
+            row = {key: value for key, value in row.items() if value != ""}
+        except ValueError as e:
+            yield row_number, None, f"Invalid JSON value: {e}"
+            continue
+        yield row_number, row, None
+
+def parse_ndjson_rows(lines):
+    for row_number, line in enumerate((line for line in lines if line.strip()), start=1):
+        try:
+            yield row_number, json.loads(line), None
+        except ValueError as e:
+            yield row_number, None, f"Invalid JSON: {e}"
+
+
+def to_pg_array(values):
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'"{value}"' for value in escaped) + "}"
+
+
+class GymImport:
+    """
+        Validates, geocodes and COPYs gym rows into `gyms` one batch at a time, so memory
+        stays bounded by the batch size. Each batch is committed on its own connection
+        checkout; a batch the database rejects is reported and skipped. A body that can't
+        be read to the end (bad encoding, broken CSV, client gone) stops the import after
+        the rows read so far, and is reported like a rejected row.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.cities = set()
+        self.completed = False
+
+    def run(self, rows):
+        batch = []
+        row_number = 0
+        try:
+            for row_number, row, error in rows:
+                if error:
+                    self._error(row_number, error)
+                    continue
+                try:
+                    batch.append((row_number, GymCreateRequest(**row)))
+                except (ValidationError, TypeError) as e:
+                    self._error(row_number, str(e).replace("\n", " "))
+                    continue
+                if len(batch) >= self.batch_size:
+                    self._load(batch)
+                    batch = []
+            self.completed = True
+        except Exception as e:
+            # Raised while reading or parsing the body, not by a row: nothing after it can be read
+            message = str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__
+            self._error(row_number + 1, f"Stopped reading the body: {message}")
+        if batch:
+            self._load(batch)
+
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+            "completed": self.completed,
+        }
+
+    def _load(self, batch):
+        addresses = {row_number: format_address(gym.address1, gym.city, gym.state, gym.zipcode) for row_number, gym in batch}
+
+        loaded = []
+        geocoded = False
+        try:
+            # Checked out for this batch only, not while the next rows are still arriving;
+            # an error rolls the batch back when the connection goes back to the pool
+            with db_connection() as db:
+                connection, cursor = db
+                coordinates, new_coordinates = get_geocoder().geocode_many(list(addresses.values()), db)
+                geocoded = True
+
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for row_number, gym in batch:
+                    location = coordinates[addresses[row_number]]
+                    if location is None:
+                        self._error(row_number, "Could not geocode address")
+                        continue
+                    latitude, longitude = location
+                    writer.writerow([
+                        gym.gym_name, gym.gym_description, gym.address1, gym.address2, gym.city, gym.state, gym.zipcode,
+                        longitude, latitude, f"SRID=4326;POINT({longitude} {latitude})",
+                        to_pg_array(gym.amenities or []),
+                        json.dumps(gym.hours_of_operation) if gym.hours_of_operation is not None else None,
+                    ])
+                    loaded.append((row_number, gym))
+                buffer.seek(0)
+
+                if loaded:
+                    cursor.copy_expert(
+                        f"COPY gyms ({', '.join(GYM_COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                        buffer
+                    )
+                connection.commit()
+            get_geocoder().remember(new_coordinates)
+        except Exception as e:
+            rejected = loaded if geocoded else batch
+            message = str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__
+            self.failed += len(rejected)
+            if rejected and len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append({
+                    "row": rejected[0][0],
+                    "error": f"Rows {rejected[0][0]}-{rejected[-1][0]} were rejected: {message}",
+                })
+            return
+
+        self.imported += len(loaded)
+        self.cities.update(gym.city for _, gym in loaded)
+
+    def _error(self, row_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": message})
@@ -0,0 +1,117 @@
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import io
+import os
+import threading
+
+from azure.storage.blob import ContentSettings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from services.blob_storage import blob_name_from_url, blob_storage
+from utils.settings import get_image_settings
+
+# Longest side in pixels of each stored variant; images are never upscaled
+VARIANT_SIZES = {"thumb": 256, "medium": 1024, "full": 2048}
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp", "webp"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+}
+
+
+class UnsupportedImage(ValueError):
+    pass
+
+
+def render_variants(source, fmt, quality):
+    """
+        Decode an uploaded image (a file path or bytes) and return {variant: encoded bytes}.
+        Runs in the image worker processes, so it has to stay a picklable module-level function.
+    """
+    try:
+        image = ImageOps.exif_transpose(Image.open(source if isinstance(source, str) else io.BytesIO(source)))
+
+        pil_format = VARIANT_FORMATS[fmt][0]
+        if pil_format == "JPEG":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+
+        variants = {}
+        for name, size in VARIANT_SIZES.items():
+            variant = image.copy()
+            variant.thumbnail((size, size), Image.LANCZOS)
+            buffer = io.BytesIO()
+            variant.save(buffer, format=pil_format, quality=quality)
+            variants[name] = buffer.getvalue()
+    # Truncated or corrupt files only fail once the pixels are decoded
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise UnsupportedImage(str(e))
+    return variants
+
+
+def variant_blob_name(blob_name, variant, fmt):
+    """ gym-1/front.jpg -> gym-1/variants/front.jpg_thumb.webp """
+    # The original extension stays in the name so front.jpg and front.png get distinct variants
+    directory, filename = os.path.split(blob_name)
+    return os.path.join(directory, "variants", f"{filename}_{variant}.{VARIANT_FORMATS[fmt][2]}").replace(os.sep, "/")
+
+
+class ImageProcessor:
+    """
+        Produces the thumbnail, medium and full variants of uploaded photos on a
+        process pool, so resizing and encoding never run on the API workers.
+    """
+
+    def __init__(self, max_workers, fmt, quality):
+        self.max_workers = max_workers
+        self.fmt = fmt
+        self.quality = quality
+        self.content_type = VARIANT_FORMATS[fmt][1]
+        self._executor = None
+        self._lock = threading.Lock()
+
+    async def variants(self, source):
+        """ {variant: bytes}; raises UnsupportedImage when `source` is not an image Pillow can read. """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), render_variants, source, self.fmt, self.quality)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+
+async def upload_variants(container, blob_name, source):
+    """
+        Store the variants of an image that is already uploaded as `blob_name`.
+        Returns {variant: url}; raises UnsupportedImage if `source` is not an image.
+    """
+    variants = await image_processor.variants(source)
+    content_settings = ContentSettings(content_type=image_processor.content_type)
+    urls = await asyncio.gather(*(
+        blob_storage.upload(
+            container, variant_blob_name(blob_name, variant, image_processor.fmt), variants[variant],
+            overwrite=True, content_settings=content_settings
+        )
+        for variant in variants
+    ))
+    return dict(zip(variants, urls))
+
+
+async def delete_image(container, url, variants=None):
+    """ Delete an image and its variants, ignoring blobs that are already gone. """
+    urls = [url, *(variants or {}).values()]
+    await asyncio.gather(*(
+        blob_storage.delete(container, blob_name_from_url(blob_url, container), missing_ok=True) for blob_url in urls
+    ))
+
+
+settings = get_image_settings()
+image_processor = ImageProcessor(settings["max_workers"], settings["format"], settings["quality"])
@@ -0,0 +1,144 @@
+from contextlib import contextmanager
+import hmac
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from starlette.responses import Response
+from starlette.routing import Match
+
+from utils.settings import get_metrics_settings
+
+# Label values stay bounded: routes are templates ("/gyms/{gym_id}"), queries are
+# labelled by their leading keyword, external calls by operation name.
+UNMATCHED_ROUTE = "unmatched"
+
+settings = get_metrics_settings()
+SQL_OPERATIONS = {"select", "insert", "update", "delete", "with", "execute", "prepare", "copy"}
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests currently being handled",
+    ["method", "route"], multiprocess_mode="livesum",
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Database statement latency",
+    ["driver", "operation", "outcome"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+EXTERNAL_CALL_DURATION = Histogram(
+    "external_call_duration_seconds", "Latency of calls to Azure Blob Storage and Google geocoding",
+    ["service", "operation", "outcome"],
+)
+
+
+def sql_operation(query):
+    """ Leading keyword of a statement, e.g. "select"; "other" for anything unusual or composed. """
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    if not isinstance(query, str):
+        return "other"
+    words = query.lstrip(" \t\r\n(").split(None, 1)
+    operation = words[0].lower() if words else ""
+    return operation if operation in SQL_OPERATIONS else "other"
+
+
+@contextmanager
+def time_query(driver, query):
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        DB_QUERY_DURATION.labels(driver, sql_operation(query), outcome).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def time_external_call(service, operation):
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        EXTERNAL_CALL_DURATION.labels(service, operation, outcome).observe(time.perf_counter() - start)
+
+
+def route_template(scope):
+    """ Path template of the route that will handle this request, without running the router. """
+    # Kept on the scope so the other middlewares don't match the routes again
+    if "route_template" in scope:
+        return scope["route_template"]
+    template = partial = None
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            template = route.path
+            break
+        if match == Match.PARTIAL and partial is None:
+            # Path matches but not the method: reported on the template with its 405
+            partial = route.path
+    scope["route_template"] = template or partial or UNMATCHED_ROUTE
+    return scope["route_template"]
+
+
+class MetricsMiddleware:
+    """
+        Pure ASGI middleware (no BaseHTTPMiddleware, so streamed responses are not
+        buffered) recording latency, status and in-flight count per route template.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_DURATION.labels(method, route, str(status["code"])).observe(time.perf_counter() - start)
+            in_progress.dec()
+
+
+def metrics_allowed(authorization):
+    """ Whether a scrape with this Authorization header may read the metrics. """
+    if not settings["enabled"]:
+        return False
+    if settings["token"] is None:
+        return True
+    scheme, _, token = (authorization or "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(token.encode(), settings["token"].encode())
+
+
+def metrics_response():
+    # With several workers each process writes to PROMETHEUS_MULTIPROC_DIR and a scrape merges them
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,101 @@
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+import asyncio
+import threading
+
+from utils.settings import get_password_hashing_settings
+
+settings = get_password_hashing_settings()
+
+# Hashes made with fewer rounds than the configured cost are flagged by
+# verify_and_update so they get upgraded on the next successful login
+password_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings["rounds"],
+    bcrypt__min_rounds=settings["rounds"],
+)
+
+
+def hash_password(password: str):
+    return password_context.hash(password)
+
+def verify_password(plain_password, hashed_password):
+    return password_context.verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+        Runs bcrypt on a dedicated thread pool so it never blocks the event loop.
+        bcrypt releases the GIL, so `max_workers` hashes really run in parallel;
+        anything beyond that waits in the queue, and once `max_queue` calls are
+        waiting new ones are rejected with a 503 instead of piling up.
+    """
+
+    def __init__(self, max_workers, max_queue):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._stats = {"completed": 0, "rejected": 0, "max_queue_depth": 0, "rehashed": 0}
+
+    async def hash(self, password):
+        return await self._submit(password_context.hash, password)
+
+    async def verify_and_update(self, password, hashed_password):
+        """
+            Returns (valid, new_hash). new_hash is set when the stored hash uses an
+            outdated cost factor and should be written back.
+        """
+        valid, new_hash = await self._submit(password_context.verify_and_update, password, hashed_password)
+        if new_hash:
+            with self._lock:
+                self._stats["rehashed"] += 1
+        return valid, new_hash
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queue_depth"] = self._queued
+            stats["running"] = self._running
+        stats["max_workers"] = self.max_workers
+        stats["max_queue"] = self.max_queue
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _submit(self, func, *args):
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise HTTPException(status_code=503, detail="Too many login attempts in progress, please try again")
+            self._queued += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queued)
+
+        future = self._executor.submit(self._run, func, args)
+        future.add_done_callback(self._forget_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def _forget_cancelled(self, future):
+        # A request that disconnects while still queued cancels its job before it starts
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def _run(self, func, args):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._stats["completed"] += 1
+
+
+password_hasher = PasswordHasher(settings["max_workers"], settings["max_queue"])
@@ -0,0 +1,97 @@
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import hashlib
+import io
+import threading
+
+import qrcode
+from qrcode.image.pil import PilImage
+from qrcode.image.svg import SvgPathImage
+
+from utils.lru_cache import LRUCache
+from utils.settings import get_qr_render_settings
+
+QR_BORDER = 4
+QR_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+def qr_code_url(purchase_id):
+    return f"/guest-passes/{purchase_id}/qr"
+
+def render_qr(data, fmt, size):
+    """
+        Render `data` as a PNG or SVG roughly `size` pixels wide. Runs in the
+        render worker processes, so it has to stay a picklable module-level function.
+    """
+    qr = qrcode.QRCode(border=QR_BORDER)
+    qr.add_data(data)
+    qr.make(fit=True)
+    qr.box_size = max(1, size // (qr.modules_count + 2 * QR_BORDER))
+
+    image = qr.make_image(image_factory=SvgPathImage if fmt == "svg" else PilImage)
+    buffer = io.BytesIO()
+    if fmt == "svg":
+        image.save(buffer)
+    else:
+        image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class QRRenderer:
+    """
+        Renders pass QR codes on demand. The image only depends on the payload,
+        format and size, so rendered bytes are kept in a bounded LRU keyed on those
+        and served with a matching ETag. Rendering runs in a process pool so PNG
+        encoding does not hold the GIL of the API workers.
+    """
+
+    def __init__(self, max_workers, cache_entries):
+        self.max_workers = max_workers
+        self._cache = LRUCache(cache_entries)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "renders": 0}
+
+    @staticmethod
+    def etag(data, fmt, size):
+        digest = hashlib.sha256(f"{data}|{fmt}|{size}".encode()).hexdigest()[:32]
+        return f'"qr-{digest}"'
+
+    async def render(self, data, fmt, size):
+        key = (data, fmt, size)
+        image = self._cache.get(key)
+        if image is not None:
+            with self._lock:
+                self._stats["hits"] += 1
+            return image
+
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(self._get_executor(), render_qr, data, fmt, size)
+        self._cache.set(key, image)
+        with self._lock:
+            self._stats["renders"] += 1
+        return image
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["cached"] = len(self._cache)
+        stats["max_workers"] = self.max_workers
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self):
+        # Worker processes are only started once the first QR code is requested
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+
+settings = get_qr_render_settings()
+qr_renderer = QRRenderer(settings["max_workers"], settings["cache_entries"])
@@ -0,0 +1,66 @@
+import base64
+import hashlib
+import hmac
+import time
+
+from fastapi import HTTPException
+
+from utils.settings import get_qr_signing_settings
+
+TOKEN_VERSION = "1"
+SIGNATURE_BYTES = 16
+
+settings = get_qr_signing_settings()
+
+
+def _signature(key, message):
+    digest = hmac.new(key, message.encode(), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def token_expiry(now=None):
+    """
+        Tokens expire at the end of the next `ttl` window rather than `ttl` after
+        rendering, so every render inside a window yields the same token and the
+        rendered image stays cacheable until the window rolls over.
+    """
+    now = int(time.time() if now is None else now)
+    ttl = settings["ttl"]
+    return (now // ttl + 2) * ttl
+
+
+def sign_pass_token(purchase_id, user_id, gym_id, duration_days, expires_at=None):
+    """
+        Compact signed QR payload:
+        `1.<kid>.<pass_id>.<user_id>.<gym_id>.<duration>.<expires_at>.<hmac>`
+    """
+    expires_at = token_expiry() if expires_at is None else expires_at
+    kid = settings["active_kid"]
+    message = f"{TOKEN_VERSION}.{kid}.{purchase_id}.{user_id}.{gym_id}.{duration_days}.{expires_at}"
+    return f"{message}.{_signature(settings['keys'][kid], message)}"
+
+
+def verify_pass_token(token):
+    """
+        Authenticate a scanned token without touching the database. Returns
+        (pass_id, user_id, gym_id, duration_days); raises 401 for tokens that are
+        malformed or forged and 400 once they have expired.
+    """
+    message, _, signature = token.strip().rpartition(".")
+    parts = message.split(".")
+    if len(parts) != 7 or parts[0] != TOKEN_VERSION:
+        raise HTTPException(status_code=401, detail="Invalid pass code")
+
+    key = settings["keys"].get(parts[1])
+    if key is None or not hmac.compare_digest(signature, _signature(key, message)):
+        raise HTTPException(status_code=401, detail="Invalid pass code")
+
+    try:
+        pass_id, user_id, gym_id, duration_days, expires_at = (int(part) for part in parts[2:])
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid pass code")
+
+    if expires_at <= time.time():
+        raise HTTPException(status_code=400, detail="Pass code has expired, refresh the pass to get a new one")
+
+    return pass_id, user_id, gym_id, duration_days
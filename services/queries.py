@@ -0,0 +1,194 @@
+import re
+import threading
+
+from psycopg2 import errors, extensions
+
+from services.roles import USER_ROLE_BY_EMAIL
+from utils.settings import get_prepared_statements_enabled
+
+PREPARED_STATEMENTS = get_prepared_statements_enabled()
+
+_PLACEHOLDER = re.compile(r"%%|%(?:\((\w+)\))?s")
+
+
+class Statement:
+    """
+        A hot query declared once in this registry. Executed through `execute` /
+        `execute_async` it is prepared once per pooled connection, so Postgres
+        parses and plans it once instead of on every request.
+    """
+    __slots__ = ("name", "sql", "server_sql", "execute_sql", "executions", "prepares")
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        self.executions = 0
+        self.prepares = 0
+
+        # psycopg placeholders become $n for PREPARE; EXECUTE passes the same
+        # parameters positionally, named ones in order of first use
+        params = []
+
+        def number(match):
+            if match.group(0) == "%%":
+                return "%"
+            key = match.group(1)
+            if key is None or key not in params:
+                params.append(key)
+                return f"${len(params)}"
+            return f"${params.index(key) + 1}"
+
+        self.server_sql = _PLACEHOLDER.sub(number, sql)
+        arguments = ", ".join("%s" if key is None else f"%({key})s" for key in params)
+        self.execute_sql = f"EXECUTE {name} ({arguments})" if params else f"EXECUTE {name}"
+
+
+_registry = {}
+_lock = threading.Lock()
+
+
+def statement(name, sql):
+    if name in _registry:
+        raise ValueError(f"Statement {name} is already registered")
+    _registry[name] = Statement(name, sql)
+    return _registry[name]
+
+
+def execute(cursor, statement, params=()):
+    """ Run a registered statement on a psycopg2 cursor. """
+    prepared = getattr(cursor.connection, "prepared", None)
+    if not PREPARED_STATEMENTS or prepared is None:
+        cursor.execute(statement.sql, params)
+        _count(statement)
+        return
+
+    # Nothing to lose by rolling back if this statement opens the transaction
+    first_in_transaction = cursor.connection.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+    if statement.name not in prepared:
+        _prepare(cursor, statement, prepared)
+    try:
+        cursor.execute(statement.execute_sql, params)
+    except errors.InvalidSqlStatementName:
+        # The session lost its prepared statements (e.g. DISCARD ALL from a pooler in front of
+        # Postgres); the failed EXECUTE aborted the transaction, so retry only if it held nothing else
+        prepared.clear()
+        if not first_in_transaction:
+            raise
+        cursor.connection.rollback()
+        _prepare(cursor, statement, prepared)
+        cursor.execute(statement.execute_sql, params)
+    _count(statement)
+
+
+def _prepare(cursor, statement, prepared):
+    # Prepared statements live for the whole session, even if this transaction rolls back
+    cursor.execute(f"PREPARE {statement.name} AS {statement.server_sql}")
+    prepared.add(statement.name)
+    _count(statement, prepared=True)
+
+
+async def execute_async(cursor, statement, params=()):
+    """ Run a registered statement on a psycopg 3 async cursor, which keeps its own per-connection cache. """
+    await cursor.execute(statement.sql, params, prepare=PREPARED_STATEMENTS)
+    _count(statement)
+
+
+def stats():
+    with _lock:
+        return {
+            name: {"executions": statement.executions, "prepares": statement.prepares}
+            for name, statement in _registry.items()
+        }
+
+
+def _count(statement, prepared=False):
+    with _lock:
+        if prepared:
+            statement.prepares += 1
+        else:
+            statement.executions += 1
+
+
+# Gym, photos and pass options in one round trip
+GYM_DETAIL = statement("gym_detail", """
+    SELECT g.id, g.gym_name, g.description, g.address1, g.address2, g.city, g.state, g.zipcode,
+        g.amenities, g.hours_of_operation, g.version,
+        COALESCE(
+            (SELECT json_agg(p.photo_url ORDER BY p.id) FROM GymPhotos p WHERE p.gym_id = g.id),
+            '[]'
+        ),
+        COALESCE(
+            (SELECT json_agg(json_build_object(
+                'id', p.id, 'photo_url', p.photo_url, 'variants', p.variants
+            ) ORDER BY p.id) FROM GymPhotos p WHERE p.gym_id = g.id),
+            '[]'
+        ),
+        COALESCE(
+            (SELECT json_agg(json_build_object(
+                'id', po.id, 'gym_id', po.gym_id, 'pass_name', po.pass_name, 'price', po.price,
+                'duration', po.duration_days, 'description', po.description
+            ) ORDER BY po.id) FROM passoptions po WHERE po.gym_id = g.id),
+            '[]'
+        )
+    FROM gyms g
+    WHERE g.id = %s
+""")
+
+PASS_OPTIONS_BY_GYM = statement("pass_options_by_gym", """
+    SELECT id, gym_id, pass_name, price, duration_days, description
+    FROM passoptions
+    WHERE gym_id = %s
+""")
+
+# First page and following pages of a user's favorites (keyset on gym id)
+FAVORITES_FIRST_PAGE = statement("favorites_first_page", """
+    SELECT g.id, g.gym_name, g.city FROM Gyms g
+    JOIN UserFavorites uf ON uf.gym_id = g.id
+    WHERE uf.user_id = %s
+    ORDER BY uf.gym_id
+    LIMIT %s
+""")
+
+FAVORITES_AFTER = statement("favorites_after", """
+    SELECT g.id, g.gym_name, g.city FROM Gyms g
+    JOIN UserFavorites uf ON uf.gym_id = g.id
+    WHERE uf.user_id = %s AND uf.gym_id > %s
+    ORDER BY uf.gym_id
+    LIMIT %s
+""")
+
+LOGIN_LOOKUP = statement("login_lookup", USER_ROLE_BY_EMAIL)
+
+# Validates the pass, starts its expiration clock on the first scan, records the visit and
+# returns the welcome names in one round trip. The row always comes back:
+# (pass exists, first name, gym name), with the names NULL when nothing was recorded.
+VERIFY_PASS = statement("verify_pass", """
+    WITH pass AS (
+        SELECT
+            id,
+            user_id = %(user_id)s AND gym_id = %(gym_id)s AND expiration_date <= CURRENT_TIMESTAMP AS expired
+        FROM guestpasspurchases WHERE id = %(pass_id)s
+    ), activated AS (
+        -- Unsigned codes pass a NULL duration and get the one of the pass option
+        UPDATE guestpasspurchases gp
+        SET expiration_date = COALESCE(
+            gp.expiration_date,
+            CURRENT_TIMESTAMP + make_interval(days => COALESCE(%(duration)s::int, po.duration_days))
+        )
+        FROM passoptions po
+        WHERE po.id = gp.pass_option_id
+            AND gp.id = %(pass_id)s AND gp.user_id = %(user_id)s AND gp.gym_id = %(gym_id)s AND gp.is_valid
+            AND (gp.expiration_date IS NULL OR gp.expiration_date > CURRENT_TIMESTAMP)
+        RETURNING gp.id, gp.user_id, gp.gym_id
+    ), usage AS (
+        INSERT INTO PassUsage (purchase_id, user_id, gym_id, usage_date, gym_name, gym_city)
+        SELECT a.id, a.user_id, a.gym_id, CURRENT_TIMESTAMP, g.gym_name, g.city
+        FROM activated a JOIN Gyms g ON g.id = a.gym_id
+        RETURNING user_id, gym_name
+    )
+    SELECT
+        EXISTS (SELECT 1 FROM pass),
+        COALESCE((SELECT expired FROM pass), false),
+        (SELECT u.firstName FROM usage JOIN Users u ON u.id = usage.user_id),
+        (SELECT gym_name FROM usage)
+""")
@@ -0,0 +1,23 @@
+# Login columns of a user together with what decides their role, in one round trip.
+# Admin rows win over gym admin rows, so one user maps to one role.
+USER_ROLE_QUERY = """
+    SELECT u.id, u.firstName, u.lastName, u.password_hash, a.id IS NOT NULL, ga.gym_id
+    FROM users u
+    LEFT JOIN Admins a ON a.user_id = u.id
+    LEFT JOIN Gym_Admins ga ON ga.user_id = u.id
+    WHERE {condition}
+    ORDER BY a.id NULLS LAST, ga.gym_id
+    LIMIT 1
+"""
+
+USER_ROLE_BY_EMAIL = USER_ROLE_QUERY.format(condition="u.email = %s")
+USER_ROLE_BY_ID = USER_ROLE_QUERY.format(condition="u.id = %s")
+
+
+def resolve_role(is_admin, gym_id):
+    """ (role, gym_id) for a USER_ROLE_QUERY row; gym_id is only set for gym admins. """
+    if is_admin:
+        return "admin", None
+    if gym_id is not None:
+        return "gym", gym_id
+    return "user", None
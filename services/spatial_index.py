@@ -0,0 +1,333 @@
+from math import atan, atan2, cos, floor, radians, sin, sqrt, tan
+import logging
+import select
+import threading
+import time
+
+from services.database import connect, db_connection
+from utils.settings import get_spatial_index_settings
+
+logger = logging.getLogger(__name__)
+
+# WGS84, the ellipsoid PostGIS uses for geography distances
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+MEAN_EARTH_RADIUS = 6371008.8
+
+# Conservative meters per degree, so the cell window never misses a gym inside the radius
+MIN_METERS_PER_DEGREE_LAT = 110574.0
+MIN_METERS_PER_DEGREE_LON_AT_EQUATOR = 111319.0
+
+# Columns returned by /getNearbyGyms, distance in meters is appended to each row
+NEARBY_GYM_COLUMNS = "id, gym_name, description, address1, address2, city, state, zipcode, longitude, latitude"
+LONGITUDE, LATITUDE = 8, 9
+
+# Announces the id of every committed gym change (migrations/009_gym_change_notify.sql)
+GYM_CHANGES_CHANNEL = "gym_changes"
+# Above this many changed gyms in one wakeup a full reload is cheaper than fetching them by id
+MAX_CHANGES_APPLIED = 500
+LISTEN_POLL_SECONDS = 5.0
+LISTEN_RETRY_SECONDS = 5.0
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    phi1, phi2 = radians(lat1), radians(lat2)
+    a = sin((phi2 - phi1) / 2) ** 2 + cos(phi1) * cos(phi2) * sin(radians(lon2 - lon1) / 2) ** 2
+    return 2 * MEAN_EARTH_RADIUS * atan2(sqrt(a), sqrt(1 - a))
+
+def geodesic_distance(lat1, lon1, lat2, lon2):
+    """ Distance in meters on the WGS84 ellipsoid (Vincenty's inverse formula). """
+    if lat1 == lat2 and lon1 == lon2:
+        return 0.0
+
+    L = radians(lon2 - lon1)
+    U1 = atan((1 - WGS84_F) * tan(radians(lat1)))
+    U2 = atan((1 - WGS84_F) * tan(radians(lat2)))
+    sin_u1, cos_u1 = sin(U1), cos(U1)
+    sin_u2, cos_u2 = sin(U2), cos(U2)
+
+    lam = L
+    for _ in range(100):
+        sin_lam, cos_lam = sin(lam), cos(lam)
+        sin_sigma = sqrt((cos_u2 * sin_lam) ** 2 + (cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam) ** 2)
+        if sin_sigma == 0:
+            return 0.0
+        cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+        sigma = atan2(sin_sigma, cos_sigma)
+        sin_alpha = cos_u1 * cos_u2 * sin_lam / sin_sigma
+        cos2_alpha = 1 - sin_alpha ** 2
+        cos_2sigma_m = cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha if cos2_alpha else 0.0
+        C = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+        previous = lam
+        lam = L + (1 - C) * WGS84_F * sin_alpha * (
+            sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+        )
+        if abs(lam - previous) < 1e-12:
+            break
+    else:
+        # Nearly antipodal points do not converge, far outside any search radius anyway
+        return haversine_distance(lat1, lon1, lat2, lon2)
+
+    u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = B * sin_sigma * (
+        cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+            - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+        )
+    )
+    return WGS84_B * A * (sigma - delta_sigma)
+
+
+class SpatialIndex:
+    """
+        In-memory grid of gym rows bucketed by latitude/longitude cell. Radius queries
+        only look at the cells overlapping the search window and return the same rows,
+        in the same order, as the PostGIS ST_DWithin query.
+    """
+
+    def __init__(self, cell_degrees):
+        self.cell_degrees = cell_degrees
+        self._columns = int(round(360 / cell_degrees))
+        self._lock = threading.Lock()
+        self._gyms = {}  # gym_id -> row
+        self._cells = {}  # (cell_row, cell_column) -> {gym_id: row}
+        self._pending = None  # gym_id -> row or None, changes made while a load reads the table
+        self.loaded_at = None
+
+    @property
+    def ready(self):
+        return self.loaded_at is not None
+
+    def begin_load(self):
+        """
+            Call before reading the rows passed to `load`: upserts and removes made from
+            then on are replayed over the new snapshot instead of being overwritten by it.
+        """
+        with self._lock:
+            self._pending = {}
+
+    def load(self, rows):
+        gyms, cells = {}, {}
+        for row in rows:
+            if row[LATITUDE] is None or row[LONGITUDE] is None:
+                continue
+            gyms[row[0]] = row
+            cells.setdefault(self._cell(row[LATITUDE], row[LONGITUDE]), {})[row[0]] = row
+        with self._lock:
+            self._gyms, self._cells = gyms, cells
+            for gym_id, row in (self._pending or {}).items():
+                self._remove(gym_id)
+                if row is not None:
+                    self._add(row)
+            self._pending = None
+            self.loaded_at = time.monotonic()
+
+    def load_failed(self):
+        with self._lock:
+            self._pending = None
+
+    def upsert(self, row):
+        with self._lock:
+            self._remove(row[0])
+            self._add(row)
+            if self._pending is not None:
+                self._pending[row[0]] = row
+
+    def remove(self, gym_id):
+        with self._lock:
+            self._remove(gym_id)
+            if self._pending is not None:
+                self._pending[gym_id] = None
+
+    def nearby(self, latitude, longitude, radius_in_meters):
+        """ Gyms within `radius_in_meters`, closest first, each row followed by its distance in meters. """
+        delta_lat = radius_in_meters / MIN_METERS_PER_DEGREE_LAT
+        low_row = self._row(max(-90.0, latitude - delta_lat))
+        high_row = self._row(min(90.0, latitude + delta_lat))
+
+        widest = cos(radians(min(90.0, max(abs(latitude - delta_lat), abs(latitude + delta_lat)))))
+        if latitude + delta_lat >= 90 or latitude - delta_lat <= -90 or widest < 1e-6:
+            columns = range(self._columns)
+        else:
+            delta_lon = radius_in_meters / (MIN_METERS_PER_DEGREE_LON_AT_EQUATOR * widest)
+            if delta_lon >= 180:
+                columns = range(self._columns)
+            else:
+                first = self._column(longitude - delta_lon)
+                span = int(floor(2 * delta_lon / self.cell_degrees)) + 2
+                columns = [(first + offset) % self._columns for offset in range(min(span, self._columns))]
+
+        with self._lock:
+            if (high_row - low_row + 1) * len(columns) > len(self._cells):
+                # The window has more cells than hold any gym, walk the populated ones instead
+                wanted = set(columns)
+                candidates = [
+                    row
+                    for (cell_row, cell_column), cell in self._cells.items()
+                    if low_row <= cell_row <= high_row and cell_column in wanted
+                    for row in cell.values()
+                ]
+            else:
+                candidates = [
+                    row
+                    for cell_row in range(low_row, high_row + 1)
+                    for cell_column in columns
+                    for row in self._cells.get((cell_row, cell_column), {}).values()
+                ]
+
+        results = []
+        # The sphere is within 0.6% of the ellipsoid, anything further out can be skipped cheaply
+        coarse_limit = radius_in_meters * 1.006 + 1
+        for row in candidates:
+            if haversine_distance(latitude, longitude, row[LATITUDE], row[LONGITUDE]) > coarse_limit:
+                continue
+            distance = geodesic_distance(latitude, longitude, row[LATITUDE], row[LONGITUDE])
+            if distance <= radius_in_meters:
+                results.append((distance, row))
+
+        results.sort(key=lambda result: (result[0], result[1][0]))
+        return [list(row) + [distance] for distance, row in results]
+
+    def __len__(self):
+        return len(self._gyms)
+
+    def _add(self, row):
+        if row[LATITUDE] is None or row[LONGITUDE] is None:
+            return
+        self._gyms[row[0]] = row
+        self._cells.setdefault(self._cell(row[LATITUDE], row[LONGITUDE]), {})[row[0]] = row
+
+    def _remove(self, gym_id):
+        row = self._gyms.pop(gym_id, None)
+        if row is not None:
+            cell = self._cells.get(self._cell(row[LATITUDE], row[LONGITUDE]))
+            if cell is not None:
+                cell.pop(gym_id, None)
+
+    def _row(self, latitude):
+        return int(floor((latitude + 90) / self.cell_degrees))
+
+    def _column(self, longitude):
+        return int(floor((longitude + 180) / self.cell_degrees)) % self._columns
+
+    def _cell(self, latitude, longitude):
+        return self._row(latitude), self._column(longitude)
+
+
+_index = None
+_refreshing = threading.Lock()
+
+
+def get_spatial_index():
+    global _index
+    if _index is None:
+        _index = SpatialIndex(get_spatial_index_settings()["cell_degrees"])
+    return _index
+
+def load_gym_rows():
+    with db_connection() as (connection, cursor):
+        cursor.execute(f"SELECT {NEARBY_GYM_COLUMNS} FROM gyms")
+        return cursor.fetchall()
+
+def refresh_spatial_index():
+    """ Rebuild the snapshot from the gyms table. Concurrent calls are skipped. """
+    if not _refreshing.acquire(blocking=False):
+        return
+    index = get_spatial_index()
+    try:
+        index.begin_load()
+        index.load(load_gym_rows())
+    except Exception as e:
+        index.load_failed()
+        logger.exception("Failed to refresh the gym spatial index")
+    finally:
+        _refreshing.release()
+
+def schedule_refresh():
+    # Every request on a stale snapshot asks for a refresh, only start a thread if none is running
+    if _refreshing.locked():
+        return
+    threading.Thread(target=refresh_spatial_index, name="spatial-index-refresh", daemon=True).start()
+
+def apply_gym_changes(gym_ids):
+    """ Bring the given gyms up to date in the snapshot: re-read them, drop the ones that are gone. """
+    if len(gym_ids) > MAX_CHANGES_APPLIED:
+        refresh_spatial_index()
+        return
+    with db_connection() as (connection, cursor):
+        cursor.execute(f"SELECT {NEARBY_GYM_COLUMNS} FROM gyms WHERE id = ANY(%s)", (list(gym_ids),))
+        rows = cursor.fetchall()
+    index = get_spatial_index()
+    for row in rows:
+        index.upsert(row)
+    for gym_id in gym_ids - {row[0] for row in rows}:
+        index.remove(gym_id)
+
+
+def _listen_for_changes(stop):
+    # One dedicated connection per worker, outside the pool: it sits in LISTEN for the worker's lifetime
+    while not stop.is_set():
+        connection = None
+        try:
+            connection = connect()
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {GYM_CHANGES_CHANNEL}")
+            # Changes made while nobody was listening are only in the table
+            refresh_spatial_index()
+            while not stop.is_set():
+                if select.select([connection], [], [], LISTEN_POLL_SECONDS) == ([], [], []):
+                    continue
+                connection.poll()
+                gym_ids = {int(notify.payload) for notify in connection.notifies}
+                connection.notifies.clear()
+                if gym_ids:
+                    apply_gym_changes(gym_ids)
+        except Exception as e:
+            logger.warning("Gym change listener failed, retrying in %ss: %s", LISTEN_RETRY_SECONDS, e)
+            stop.wait(LISTEN_RETRY_SECONDS)
+        finally:
+            if connection is not None:
+                connection.close()
+
+
+_listener_stop = None
+
+
+def start_change_listener():
+    """ Load the snapshot and keep it in step with changes committed by any worker. """
+    global _listener_stop
+    if not get_spatial_index_settings()["enabled"] or _listener_stop is not None:
+        return
+    _listener_stop = threading.Event()
+    threading.Thread(
+        target=_listen_for_changes, args=(_listener_stop,), name="spatial-index-listener", daemon=True
+    ).start()
+
+def stop_change_listener():
+    global _listener_stop
+    if _listener_stop is not None:
+        _listener_stop.set()
+        _listener_stop = None
+
+def nearby_from_index(latitude, longitude, radius_in_meters):
+    """
+        Serve a radius query from the snapshot, or None when the index is disabled or not
+        loaded yet. Changes from other workers arrive through the gym_changes listener;
+        snapshots older than the refresh interval are still rebuilt in the background in
+        case a notification was missed.
+    """
+    settings = get_spatial_index_settings()
+    if not settings["enabled"]:
+        return None
+
+    index = get_spatial_index()
+    if not index.ready:
+        schedule_refresh()
+        return None
+    if time.monotonic() - index.loaded_at > settings["refresh_seconds"]:
+        schedule_refresh()
+    return index.nearby(latitude, longitude, radius_in_meters)
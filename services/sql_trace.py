@@ -0,0 +1,137 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+import logging
+import re
+import time
+
+from services.metrics import route_template
+from utils.settings import get_sql_trace_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_sql_trace_settings()
+
+TRACE_HEADER = "X-SQL-Trace"
+MAX_LOGGED_SQL = 500
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+# "(?, ?), (?, ?), (?, ?)" from a multi-row VALUES list, with or without spaces
+_REPEATED_TUPLES = re.compile(r"(\(\?(?:, ?\?)*\))(?:, ?\(\?(?:, ?\?)*\))+")
+# "IN (?, ?, ?)" built from a list of ids
+_IN_LIST = re.compile(r"\bIN ?\(\?(?:, ?\?)*\)", re.IGNORECASE)
+
+_trace = ContextVar("sql_trace", default=None)
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(query):
+    """
+        Statement shape used to group queries: literals and placeholders become ?,
+        whitespace is collapsed, multi-row VALUES lists fold into one tuple and
+        IN lists into "IN (...)".
+    """
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    query = _WHITESPACE.sub(" ", query).strip()
+    query = _STRING.sub("?", query)
+    query = _PLACEHOLDER.sub("?", query)
+    query = _NUMBER.sub("?", query)
+    query = _IN_LIST.sub("IN (...)", query)
+    return _REPEATED_TUPLES.sub(r"\1, ...", query)
+
+
+class RequestTrace:
+    """ Statements run while handling one request: (shape, duration in seconds, row count). """
+    __slots__ = ("route", "statements")
+
+    def __init__(self, route):
+        self.route = route
+        self.statements = []
+
+    def repeated(self):
+        """ The statement shape run most often and how often, or (None, 0). """
+        if not self.statements:
+            return None, 0
+        shape, count = Counter(shape for shape, _, _ in self.statements).most_common(1)[0]
+        return shape, count
+
+    def summary(self):
+        durations = [duration for _, duration, _ in self.statements]
+        rows = sum(max(row_count, 0) for _, _, row_count in self.statements)
+        summary = (f"queries={len(durations)}; total_ms={sum(durations) * 1000:.2f}; "
+                   f"max_ms={max(durations, default=0) * 1000:.2f}; rows={rows}")
+        shape, count = self.repeated()
+        if count >= settings["repeat_threshold"]:
+            summary += f"; repeated={count}x {shape[:200]}"
+        return summary
+
+
+def _query_text(cursor, query):
+    if isinstance(query, (str, bytes)):
+        return query
+    # sql.Composed / sql.SQL from either driver
+    try:
+        return query.as_string(cursor)
+    except Exception:
+        return type(query).__name__
+
+
+@contextmanager
+def traced(cursor, query):
+    """ Record a statement run on `cursor` in the current request's trace and log it if it is slow. """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        trace = _trace.get()
+        if trace is not None or elapsed * 1000 >= settings["slow_query_ms"]:
+            shape = normalize_sql(_query_text(cursor, query))
+            row_count = cursor.rowcount if cursor.rowcount is not None else -1
+            if trace is not None:
+                trace.statements.append((shape, elapsed, row_count))
+            if elapsed * 1000 >= settings["slow_query_ms"]:
+                logger.warning(
+                    "Slow query (%.1f ms, %d rows) on %s: %s",
+                    elapsed * 1000, row_count, trace.route if trace is not None else "-", shape[:MAX_LOGGED_SQL]
+                )
+
+
+class SQLTraceMiddleware:
+    """
+        Collects the statements of every request (see `traced`), warns when one
+        request runs the same statement shape `SQL_REPEAT_THRESHOLD` times or
+        more (a likely N+1) and, with DEBUG=true, sends a summary in the
+        X-SQL-Trace response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(f"{scope['method']} {route_template(scope)}")
+        token = _trace.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and settings["header"]:
+                # Statements run while a streamed body is being sent are not included
+                value = trace.summary().encode("latin-1", "replace")
+                message = {**message, "headers": [*message.get("headers", []), (TRACE_HEADER.lower().encode(), value)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _trace.reset(token)
+            shape, count = trace.repeated()
+            if count >= settings["repeat_threshold"]:
+                logger.warning("Possible N+1 on %s: %d runs of %s", trace.route, count, shape[:MAX_LOGGED_SQL])
@@ -0,0 +1,210 @@
+import base64
+import logging
+import os
+import tempfile
+
+from azure.core.exceptions import ResourceExistsError
+from fastapi import HTTPException
+from multipart.multipart import MultipartParser, parse_options_header
+
+from services.blob_storage import blob_storage
+from utils.settings import get_upload_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_upload_settings()
+
+
+def _too_large(limit):
+    return HTTPException(status_code=413, detail=f"Upload is larger than the {limit} byte limit")
+
+
+async def iter_file_parts(request, max_request_bytes):
+    """
+        Parse a multipart/form-data body while it is still arriving. Yields
+        ("start", field, filename, content_type), ("data", bytes) and ("end",)
+        for every file field; plain form fields are skipped. Bodies larger than
+        `max_request_bytes` are rejected with a 413, up front when the client
+        sends a Content-Length.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_request_bytes:
+        raise _too_large(max_request_bytes)
+
+    # The parser reports through sync callbacks; collect what they see and hand it
+    # out after every chunk so the consumer can await between chunks
+    events = []
+    headers = {}
+    header_field, header_value = bytearray(), bytearray()
+    part = {"is_file": False}
+
+    def on_part_begin():
+        headers.clear()
+        part["is_file"] = False
+
+    def on_header_field(data, start, end):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        _, options = parse_options_header(headers.get(b"content-disposition", b""))
+        part["is_file"] = b"filename" in options
+        if part["is_file"]:
+            events.append((
+                "start",
+                options.get(b"name", b"").decode("utf-8", "replace"),
+                # Never let a client-supplied name walk out of its blob directory
+                os.path.basename(options[b"filename"].decode("utf-8", "replace").replace("\\", "/")),
+                headers.get(b"content-type", b"application/octet-stream").decode("latin-1"),
+            ))
+
+    def on_part_data(data, start, end):
+        if part["is_file"]:
+            events.append(("data", bytes(data[start:end])))
+
+    def on_part_end():
+        if part["is_file"]:
+            events.append(("end",))
+
+    parser = MultipartParser(params[b"boundary"], callbacks={
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_request_bytes:
+            raise _too_large(max_request_bytes)
+        parser.write(chunk)
+        for event in events:
+            yield event
+        events.clear()
+    parser.finalize()
+    for event in events:
+        yield event
+
+
+class BlockBlobUpload:
+    """
+        Streams one file into a block blob. Incoming bytes collect in a buffer of
+        `block_size`; every time it fills it is staged as a block while the rest
+        of the body is still arriving, and the block list is committed at the end.
+        Blocks of an upload that is never committed are discarded by the storage
+        service. A copy is spooled to a temp file for post-processing (`path`).
+    """
+
+    def __init__(self, container, blob_name, content_type, max_bytes, block_size):
+        self.container = container
+        self.blob_name = blob_name
+        self.content_type = content_type
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.size = 0
+        self._buffer = bytearray()
+        self._block_ids = []
+        self._spool = tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(blob_name)[1])
+        self.path = self._spool.name
+
+    async def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise _too_large(self.max_bytes)
+        self._spool.write(data)
+        self._buffer.extend(data)
+        while len(self._buffer) >= self.block_size:
+            await self._stage(bytes(self._buffer[:self.block_size]))
+            del self._buffer[:self.block_size]
+
+    async def commit(self):
+        self._spool.close()
+        if self._buffer or not self._block_ids:
+            await self._stage(bytes(self._buffer))
+            self._buffer.clear()
+        return await blob_storage.commit_blocks(self.container, self.blob_name, self._block_ids, self.content_type)
+
+    def discard(self):
+        self._spool.close()
+        remove_file(self.path)
+
+    async def _stage(self, data):
+        # Block ids must all have the same length within a blob
+        block_id = base64.b64encode(f"{len(self._block_ids):08d}".encode()).decode()
+        await blob_storage.stage_block(self.container, self.blob_name, block_id, data)
+        self._block_ids.append(block_id)
+
+
+def remove_file(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+async def stream_uploads(request, container, blob_name, max_file_bytes=None, max_request_bytes=None):
+    """
+        Stream every file in a multipart request straight into blob storage as it
+        arrives. `blob_name(filename)` names the blob. Yields one result per file
+        once it is committed: {"field", "filename", "status": "uploaded", "url", "path"}
+        or {"field", "filename", "status": "failed", "error"}. `path` is a local copy
+        the caller must remove with `remove_file`. Size limits raise a 413.
+    """
+    max_file_bytes = max_file_bytes or settings["max_file_bytes"]
+    max_request_bytes = max_request_bytes or settings["max_request_bytes"]
+    upload = result = None
+
+    try:
+        async for event in iter_file_parts(request, max_request_bytes):
+            if event[0] == "start":
+                _, field, filename, content_type = event
+                result = {"field": field, "filename": filename}
+                upload = BlockBlobUpload(container, blob_name(filename), content_type, max_file_bytes, settings["block_size"])
+            elif upload is None:
+                continue
+            elif event[0] == "data":
+                try:
+                    await upload.write(event[1])
+                except HTTPException:
+                    raise
+                except Exception as e:
+                    # Drop the rest of this file but keep reading the others
+                    yield _failed(upload, result, e)
+                    upload = None
+            else:
+                try:
+                    url = await upload.commit()
+                except Exception as e:
+                    yield _failed(upload, result, e)
+                else:
+                    result.update(status="uploaded", url=url, path=upload.path)
+                    yield result
+                upload = None
+    finally:
+        if upload is not None:
+            upload.discard()
+
+
+def _failed(upload, result, error):
+    upload.discard()
+    if isinstance(error, ResourceExistsError):
+        message = "A file with this name already exists"
+    else:
+        logger.warning("Uploading %s failed: %s", upload.blob_name, error)
+        message = "Upload failed"
+    result.update(status="failed", error=message)
+    return result
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app is not an installed package: run from the repository root, like uvicorn main:app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
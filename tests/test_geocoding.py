@@ -0,0 +1,214 @@
+"""
+    GeocodingService through the LocalGeocodingProvider stand-in, with geocode_cache
+    played by an in-memory table that only keeps inserts once the transaction commits.
+"""
+from contextlib import contextmanager
+
+import pytest
+
+import services.geocoding as geocoding
+import services.gym_import as gym_import
+from services.geocoding import GeocodingService, LocalGeocodingProvider, normalize_address, set_geocoding_provider
+
+HOME = "123 Main St., Fullerton, CA, 92831"
+HOME_COORDINATES = (33.8704, -117.9242)
+
+
+class CountingProvider(LocalGeocodingProvider):
+    def __init__(self, known_addresses=None):
+        super().__init__(known_addresses)
+        self.calls = []
+
+    def geocode(self, address):
+        self.calls.append(address)
+        return super().geocode(address)
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.selects = 0
+        self.rows = []
+
+    def execute(self, query, params=None):
+        assert "FROM geocode_cache WHERE address_key = ANY" in query
+        self.selects += 1
+        visible = {**self.database.table, **self.database.pending}
+        self.rows = [(key, *visible[key]) for key in params[0] if key in visible]
+
+    def fetchall(self):
+        return self.rows
+
+    def copy_expert(self, query, buffer):
+        if self.database.fail_copy:
+            raise RuntimeError("duplicate key value violates unique constraint")
+
+
+class FakeDatabase:
+    """ The geocode_cache table and one connection to it. """
+
+    def __init__(self):
+        self.table = {}
+        self.pending = {}
+        self.fail_copy = False
+        self.cursor = FakeCursor(self)
+
+    def commit(self):
+        self.table.update(self.pending)
+        self.pending = {}
+
+    def rollback(self):
+        self.pending = {}
+
+    @property
+    def db(self):
+        return self, self.cursor
+
+
+def fake_execute_values(cursor, query, rows):
+    assert "ON CONFLICT (address_key) DO NOTHING" in query
+    for key, latitude, longitude in rows:
+        if key not in cursor.database.table:
+            cursor.database.pending.setdefault(key, (latitude, longitude))
+
+
+@pytest.fixture(autouse=True)
+def table_inserts(monkeypatch):
+    monkeypatch.setattr(geocoding, "execute_values", fake_execute_values)
+
+
+@pytest.fixture
+def database():
+    return FakeDatabase()
+
+
+@pytest.fixture
+def provider():
+    return CountingProvider({HOME: HOME_COORDINATES})
+
+
+@pytest.fixture
+def service(provider):
+    return GeocodingService(provider, cache_size=100, max_workers=4)
+
+
+def test_local_provider_known_and_unknown_addresses():
+    provider = LocalGeocodingProvider({HOME: HOME_COORDINATES})
+    assert provider.geocode("123 main st,  fullerton, ca 92831") == HOME_COORDINATES
+
+    latitude, longitude = provider.geocode("1 Nowhere Rd, Springfield, IL, 62701")
+    assert 25 <= latitude <= 49 and -124 <= longitude <= -67
+    assert provider.geocode("1 nowhere rd springfield il 62701") == (latitude, longitude)
+    assert provider.geocode("2 Nowhere Rd, Springfield, IL, 62701") != (latitude, longitude)
+
+
+def test_new_results_are_written_but_not_remembered_before_commit(service, provider, database):
+    coordinates, new = service.geocode(HOME, database.db)
+    assert coordinates == HOME_COORDINATES
+    assert new == {normalize_address(HOME): HOME_COORDINATES}
+    assert database.pending == new
+    assert service._memory.get(normalize_address(HOME)) is None
+
+
+def test_rolled_back_results_are_geocoded_again(service, provider, database):
+    _, new = service.geocode(HOME, database.db)
+    database.rollback()
+
+    coordinates, new = service.geocode(HOME, database.db)
+    assert coordinates == HOME_COORDINATES
+    assert new
+    assert len(provider.calls) == 2
+
+
+def test_committed_results_are_served_from_memory(service, provider, database):
+    _, new = service.geocode(HOME, database.db)
+    database.commit()
+    service.remember(new)
+    selects = database.cursor.selects
+
+    coordinates, new = service.geocode("123 MAIN ST, Fullerton, CA, 92831", database.db)
+    assert coordinates == HOME_COORDINATES
+    assert new == {}
+    assert len(provider.calls) == 1
+    assert database.cursor.selects == selects
+
+
+def test_table_hits_are_remembered(service, provider, database):
+    database.table[normalize_address(HOME)] = HOME_COORDINATES
+
+    coordinates, new = service.geocode(HOME, database.db)
+    assert coordinates == HOME_COORDINATES
+    assert new == {}
+    assert provider.calls == []
+    assert service._memory.get(normalize_address(HOME)) == HOME_COORDINATES
+
+
+def test_geocode_many_shares_one_lookup_per_key(service, provider, database):
+    addresses = [HOME, "123 main st fullerton ca 92831", "9 Elm St, Austin, TX, 78701", "10 Elm St, Austin, TX, 78701"]
+    found, new = service.geocode_many(addresses, database.db)
+
+    assert set(found) == set(addresses)
+    assert found[addresses[0]] == found[addresses[1]] == HOME_COORDINATES
+    assert found[addresses[2]] != found[addresses[3]]
+    assert len(provider.calls) == 3
+    assert database.cursor.selects == 1
+    assert set(new) == {normalize_address(address) for address in addresses}
+
+
+def test_unresolved_addresses_are_not_cached(database):
+    class NoResults:
+        def geocode(self, address):
+            return None
+
+    service = GeocodingService(NoResults(), cache_size=100, max_workers=1)
+    coordinates, new = service.geocode(HOME, database.db)
+    assert coordinates is None
+    assert new == {}
+    assert database.pending == {}
+
+
+@pytest.fixture
+def geocoder(provider):
+    set_geocoding_provider(provider)
+    yield geocoding.get_geocoder()
+    # Leave the next test a fresh service, built from the settings
+    geocoding._geocoder = None
+
+
+@pytest.fixture
+def import_database(monkeypatch, database):
+    @contextmanager
+    def db_connection():
+        try:
+            yield database.db
+        finally:
+            # Like putconn: anything not committed is rolled back
+            database.rollback()
+
+    monkeypatch.setattr(gym_import, "db_connection", db_connection)
+    return database
+
+
+def gym_rows(*addresses):
+    for row_number, (address1, city) in enumerate(addresses, start=1):
+        yield row_number, {
+            "gym_name": f"Gym {row_number}", "gym_description": "", "address1": address1,
+            "city": city, "state": "CA", "zipcode": "92831",
+        }, None
+
+
+def test_import_remembers_coordinates_after_the_batch_commits(geocoder, provider, import_database):
+    result = gym_import.GymImport(batch_size=10).run(gym_rows(("123 Main St.", "Fullerton"), ("5 Oak Ave", "Fullerton")))
+    assert result["imported"] == 2
+    assert len(import_database.table) == 2
+    for key in import_database.table:
+        assert geocoder._memory.get(key) == import_database.table[key]
+
+
+def test_import_rejected_batch_leaves_no_coordinates_behind(geocoder, provider, import_database):
+    import_database.fail_copy = True
+    result = gym_import.GymImport(batch_size=10).run(gym_rows(("123 Main St.", "Fullerton")))
+    assert result["imported"] == 0
+    assert result["failed"] == 1
+    assert import_database.table == {}
+    assert geocoder._memory.get(normalize_address(HOME)) is None
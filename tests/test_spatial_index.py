@@ -0,0 +1,196 @@
+"""
+    SpatialIndex.nearby against reference computations: a brute-force scan with the
+    same geodesic, haversine bounds and, when a database is configured, PostGIS.
+"""
+import os
+import random
+
+import pytest
+
+from services.spatial_index import LATITUDE, LONGITUDE, SpatialIndex, geodesic_distance, haversine_distance
+
+CELL_DEGREES = 0.05
+RADII = [250, 1000, 2000, 5000, 20000, 50000]
+# The sphere is within 0.6% of the WGS84 ellipsoid over these distances
+SPHERE_TOLERANCE = 0.006
+
+# (latitude, longitude, spread in degrees) of the areas gyms are scattered around
+AREAS = {
+    "los-angeles": (34.0522, -118.2437, 0.3),
+    "equator": (0.0, 0.0, 0.5),
+    "antimeridian": (-17.7134, 179.95, 0.2),
+    "north-pole": (89.95, 0.0, 0.05),
+    "south-pole": (-89.95, 45.0, 0.05),
+}
+
+
+def gym(gym_id, latitude, longitude):
+    return (gym_id, f"Gym {gym_id}", None, None, None, None, None, None, longitude, latitude)
+
+
+def wrap(longitude):
+    return (longitude + 180) % 360 - 180
+
+
+def scatter(rng, area, count, first_id=1):
+    latitude, longitude, spread = AREAS[area]
+    return [
+        gym(gym_id, max(-90.0, min(90.0, latitude + rng.uniform(-spread, spread))), wrap(longitude + rng.uniform(-spread, spread)))
+        for gym_id in range(first_id, first_id + count)
+    ]
+
+
+def brute_force(rows, latitude, longitude, radius):
+    results = []
+    for row in rows:
+        distance = geodesic_distance(latitude, longitude, row[LATITUDE], row[LONGITUDE])
+        if distance <= radius:
+            results.append((distance, row[0]))
+    return sorted(results)
+
+
+def queries(rng, rows, count):
+    for _ in range(count):
+        row = rng.choice(rows)
+        yield (
+            max(-90.0, min(90.0, row[LATITUDE] + rng.uniform(-0.05, 0.05))),
+            wrap(row[LONGITUDE] + rng.uniform(-0.05, 0.05)),
+            rng.choice(RADII),
+        )
+
+
+@pytest.mark.parametrize("area", sorted(AREAS))
+def test_nearby_matches_brute_force(area):
+    rng = random.Random(area)
+    rows = scatter(rng, area, 400)
+    index = SpatialIndex(CELL_DEGREES)
+    index.load(rows)
+
+    for latitude, longitude, radius in queries(rng, rows, 150):
+        answer = index.nearby(latitude, longitude, radius)
+        assert [(row[-1], row[0]) for row in answer] == brute_force(rows, latitude, longitude, radius)
+
+
+@pytest.mark.parametrize("area", sorted(AREAS))
+def test_nearby_within_haversine_bounds(area):
+    rng = random.Random(area)
+    rows = scatter(rng, area, 400)
+    index = SpatialIndex(CELL_DEGREES)
+    index.load(rows)
+
+    for latitude, longitude, radius in queries(rng, rows, 150):
+        answer = index.nearby(latitude, longitude, radius)
+        returned = {row[0] for row in answer}
+        for row in answer:
+            distance = haversine_distance(latitude, longitude, row[LATITUDE], row[LONGITUDE])
+            assert distance <= radius * (1 + SPHERE_TOLERANCE) + 1
+            assert row[-1] == pytest.approx(distance, rel=SPHERE_TOLERANCE, abs=1)
+        for row in rows:
+            if row[0] not in returned:
+                assert haversine_distance(latitude, longitude, row[LATITUDE], row[LONGITUDE]) >= radius * (1 - SPHERE_TOLERANCE) - 1
+
+
+def test_empty_index():
+    index = SpatialIndex(CELL_DEGREES)
+    index.load([])
+    assert index.ready
+    assert index.nearby(34.05, -118.24, 50000) == []
+    assert index.nearby(90.0, 0.0, 50000) == []
+
+
+def test_nearby_across_antimeridian():
+    index = SpatialIndex(CELL_DEGREES)
+    index.load([gym(1, 10.0, 179.999), gym(2, 10.0, -179.999), gym(3, 10.0, 179.0)])
+    assert [row[0] for row in index.nearby(10.0, -179.9995, 1000)] == [2, 1]
+
+
+def test_nearby_around_poles():
+    index = SpatialIndex(CELL_DEGREES)
+    index.load([gym(1, 89.99, 0.0), gym(2, 89.99, 180.0), gym(3, -89.99, 90.0), gym(4, 89.0, 0.0)])
+    # Both gyms are ~1.1 km from the north pole on opposite meridians
+    assert sorted(row[0] for row in index.nearby(90.0, 0.0, 2000)) == [1, 2]
+    assert [row[0] for row in index.nearby(-90.0, -45.0, 2000)] == [3]
+
+
+def test_rows_without_coordinates_are_skipped():
+    index = SpatialIndex(CELL_DEGREES)
+    index.load([gym(1, 10.0, 10.0), gym(2, None, None)])
+    index.upsert(gym(3, None, None))
+    assert len(index) == 1
+    assert [row[0] for row in index.nearby(10.0, 10.0, 1000)] == [1]
+
+
+def test_upsert_moves_and_remove_drops():
+    index = SpatialIndex(CELL_DEGREES)
+    index.load([gym(1, 10.0, 10.0), gym(2, 10.0, 10.001)])
+    index.upsert(gym(1, 20.0, 20.0))
+    index.remove(2)
+    assert index.nearby(10.0, 10.0, 1000) == []
+    assert [row[0] for row in index.nearby(20.0, 20.0, 1000)] == [1]
+
+
+def test_changes_made_during_a_load_survive_it():
+    index = SpatialIndex(CELL_DEGREES)
+    stale = [gym(1, 10.0, 10.0), gym(2, 10.0, 10.001)]
+    index.load(stale)
+    index.begin_load()
+    # Written after the rows below were read from the table
+    index.upsert(gym(3, 10.0, 10.002))
+    index.remove(2)
+    index.load(stale)
+    assert sorted(row[0] for row in index.nearby(10.0, 10.0, 1000)) == [1, 3]
+
+
+def test_large_radius_in_a_sparse_index():
+    index = SpatialIndex(CELL_DEGREES)
+    rows = [gym(1, 10.0, 10.0), gym(2, 10.3, 10.3), gym(3, 40.0, 40.0)]
+    index.load(rows)
+    answer = index.nearby(10.0, 10.0, 50000)
+    assert [(row[-1], row[0]) for row in answer] == brute_force(rows, 10.0, 10.0, 50000)
+    assert [row[0] for row in answer] == [1, 2]
+
+
+def postgis_connection():
+    if not os.getenv("DATABASE_NAME"):
+        pytest.skip("DATABASE_NAME is not set, no PostGIS to compare with")
+    from services.database import connect
+    try:
+        connection = connect()
+    except Exception as e:
+        pytest.skip(f"PostGIS is not reachable: {e}")
+    connection.autocommit = True
+    return connection
+
+
+@pytest.mark.parametrize("area", sorted(AREAS))
+def test_nearby_matches_postgis(area):
+    connection = postgis_connection()
+    rng = random.Random(area)
+    rows = scatter(rng, area, 200)
+    index = SpatialIndex(CELL_DEGREES)
+    index.load(rows)
+
+    try:
+        with connection.cursor() as cursor:
+            for latitude, longitude, radius in queries(rng, rows, 30):
+                # No table needed: the same points go in as arrays
+                cursor.execute(
+                    """
+                    SELECT id, ST_Distance(point, origin)
+                    FROM unnest(%s::int[], %s::float8[], %s::float8[]) AS g(id, lon, lat),
+                        LATERAL (SELECT ST_SetSRID(ST_MakePoint(lon, lat), 4326)::geography AS point) p,
+                        LATERAL (SELECT ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography AS origin) o
+                    WHERE ST_DWithin(point, origin, %s)
+                    """,
+                    ([row[0] for row in rows], [row[LONGITUDE] for row in rows], [row[LATITUDE] for row in rows],
+                     longitude, latitude, radius)
+                )
+                expected = {gym_id: distance for gym_id, distance in cursor.fetchall()}
+                answer = {row[0]: row[-1] for row in index.nearby(latitude, longitude, radius)}
+                # Gyms within a centimeter of the radius may fall either side between two geodesic implementations
+                boundary = {gym_id for gym_id, distance in {**expected, **answer}.items() if abs(distance - radius) < 0.01}
+                assert set(answer) - boundary == set(expected) - boundary
+                for gym_id in set(answer) & set(expected):
+                    assert answer[gym_id] == pytest.approx(expected[gym_id], abs=0.01)
+    finally:
+        connection.close()
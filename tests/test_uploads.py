@@ -0,0 +1,165 @@
+"""
+    Staged-block uploads (services/uploads.py) against Azurite. Skipped unless Azurite's
+    blob service is listening; AZURITE_CONNECTION_STRING points the tests elsewhere.
+"""
+import asyncio
+import os
+import socket
+import uuid
+from urllib.parse import urlparse
+
+import pytest
+from fastapi import HTTPException
+
+import services.uploads as uploads
+from services.blob_storage import BlobStorage
+
+CONNECTION_STRING = os.getenv("AZURITE_CONNECTION_STRING", "UseDevelopmentStorage=true")
+CONTAINER = "upload-tests"
+BOUNDARY = "test-boundary-7MA4YWxkTrZu0gW"
+BLOCK_SIZE = 1024
+
+
+def blob_endpoint():
+    options = dict(part.split("=", 1) for part in CONNECTION_STRING.split(";") if "=" in part)
+    if "BlobEndpoint" in options:
+        url = urlparse(options["BlobEndpoint"])
+        return url.hostname, url.port or (443 if url.scheme == "https" else 80)
+    return "127.0.0.1", 10000
+
+
+def azurite_running():
+    try:
+        with socket.create_connection(blob_endpoint(), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+
+pytestmark = pytest.mark.skipif(not azurite_running(), reason="Azurite is not running")
+
+
+class FakeRequest:
+    """ The parts of a Starlette request that `iter_file_parts` reads: headers and the body stream. """
+
+    def __init__(self, body, chunk_size=700, content_length=True):
+        self.headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+        if content_length:
+            self.headers["content-length"] = str(len(body))
+        self.body = body
+        self.chunk_size = chunk_size
+
+    async def stream(self):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+
+def multipart_body(*files, fields=()):
+    body = b""
+    for name, value in fields:
+        body += (
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode() + value + b"\r\n"
+        )
+    for filename, content in files:
+        body += (
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+            f"Content-Type: image/jpeg\r\n\r\n".encode() + content + b"\r\n"
+        )
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    storage = BlobStorage(CONNECTION_STRING, (CONTAINER,))
+    monkeypatch.setattr(uploads, "blob_storage", storage)
+    monkeypatch.setitem(uploads.settings, "block_size", BLOCK_SIZE)
+    return storage
+
+
+@pytest.fixture
+def spooled(monkeypatch):
+    """ Temp file paths of every upload started, to check none are left behind. """
+    paths = []
+
+    class RecordedUpload(uploads.BlockBlobUpload):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            paths.append(self.path)
+
+    monkeypatch.setattr(uploads, "BlockBlobUpload", RecordedUpload)
+    return paths
+
+
+def run(storage, request, prefix, **limits):
+    """ Results of `stream_uploads` plus each uploaded blob's content; removes the blobs after. """
+    async def upload():
+        await storage.open()
+        results = []
+        contents = {}
+        try:
+            async for result in uploads.stream_uploads(request, CONTAINER, lambda filename: f"{prefix}/{filename}", **limits):
+                results.append(result)
+                if result["status"] == "uploaded":
+                    blob = storage.container(CONTAINER).get_blob_client(f"{prefix}/{result['filename']}")
+                    contents[result["filename"]] = await (await blob.download_blob()).readall()
+            return results, contents
+        finally:
+            async for blob in storage.container(CONTAINER).list_blobs(name_starts_with=f"{prefix}/"):
+                await storage.delete(CONTAINER, blob.name, missing_ok=True)
+            await storage.close()
+
+    return asyncio.run(upload())
+
+
+def test_multi_block_upload_round_trips(storage):
+    content = os.urandom(BLOCK_SIZE * 3 + 123)
+    results, contents = run(storage, FakeRequest(multipart_body(("photo.jpg", content))), uuid.uuid4().hex)
+
+    [result] = results
+    assert result["status"] == "uploaded"
+    assert result["url"].endswith("/photo.jpg")
+    assert contents["photo.jpg"] == content
+    with open(result["path"], "rb") as spool:
+        assert spool.read() == content
+    uploads.remove_file(result["path"])
+    assert storage.stats()["stage_block"]["count"] == 4
+
+
+def test_every_file_of_a_request_is_uploaded(storage):
+    files = [("a.jpg", os.urandom(BLOCK_SIZE * 2)), ("b.jpg", b"x"), ("c.jpg", os.urandom(10))]
+    body = multipart_body(*files, fields=[("caption", b"ignored")])
+    results, contents = run(storage, FakeRequest(body, chunk_size=97), uuid.uuid4().hex)
+
+    assert [(result["filename"], result["status"]) for result in results] == [(name, "uploaded") for name, _ in files]
+    assert contents == dict(files)
+    for result in results:
+        uploads.remove_file(result["path"])
+
+
+def test_file_over_the_limit_is_rejected_and_cleaned_up(storage, spooled):
+    body = multipart_body(("big.jpg", os.urandom(BLOCK_SIZE * 4)))
+    with pytest.raises(HTTPException) as error:
+        run(storage, FakeRequest(body), uuid.uuid4().hex, max_file_bytes=BLOCK_SIZE * 2)
+
+    assert error.value.status_code == 413
+    assert spooled and not any(os.path.exists(path) for path in spooled)
+
+
+def test_request_over_the_limit_is_rejected(storage):
+    body = multipart_body(("big.jpg", os.urandom(BLOCK_SIZE * 4)))
+    for request in (FakeRequest(body), FakeRequest(body, content_length=False)):
+        with pytest.raises(HTTPException) as error:
+            run(storage, request, uuid.uuid4().hex, max_request_bytes=BLOCK_SIZE * 2)
+        assert error.value.status_code == 413
+
+
+def test_existing_blob_is_not_replaced(storage, spooled):
+    prefix = uuid.uuid4().hex
+    body = multipart_body(("same.jpg", b"first"), ("same.jpg", b"second"))
+    results, contents = run(storage, FakeRequest(body), prefix)
+
+    assert [result["status"] for result in results] == ["uploaded", "failed"]
+    assert results[1]["error"] == "A file with this name already exists"
+    assert contents == {"same.jpg": b"first"}
+    uploads.remove_file(results[0]["path"])
+    assert not any(os.path.exists(path) for path in spooled)
@@ -0,0 +1,11 @@
+def _opaque_tag(tag):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+def etag_matches(if_none_match, etag):
+    """ If-None-Match check (weak comparison, as RFC 9110 requires for GET). """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(_opaque_tag(tag) == _opaque_tag(etag) for tag in if_none_match.split(","))
@@ -0,0 +1,60 @@
+from dataclasses import dataclass
+from fastapi import HTTPException, Query
+from typing import Optional
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Header carrying the cursor of the next page; absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+@dataclass
+class PageParams:
+    after: Optional[list]
+    limit: int
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def page_params(
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+):
+    return PageParams(after=decode_cursor(cursor) if cursor else None, limit=limit)
+
+
+def split_page(rows, page, key):
+    """
+        Queries fetch `page.limit + 1` rows; the extra row only tells us there is a next page.
+        Returns (rows for this page, cursor for the next page or None).
+    """
+    if len(rows) <= page.limit:
+        return rows, None
+    rows = rows[:page.limit]
+    return rows, encode_cursor(key(rows[-1]))
+
+def keyset_values(page, *types):
+    """ Cursor values converted to `types` (one per sort column), or None on the first page. """
+    if page.after is None:
+        return None
+    if len(page.after) != len(types):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        return [convert(value) for convert, value in zip(types, page.after)]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
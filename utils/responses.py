@@ -0,0 +1,42 @@
+from decimal import Decimal
+
+from fastapi.responses import ORJSONResponse as _ORJSONResponse
+from pydantic import parse_obj_as
+import orjson
+
+from utils.settings import get_debug
+
+DEBUG = get_debug()
+
+
+def _default(obj):
+    # Same output as FastAPI's jsonable_encoder: whole Decimals as ints, others as floats
+    if isinstance(obj, Decimal):
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if hasattr(obj, "as_dict"):
+        return obj.as_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content):
+    """ orjson with support for Decimal and row types (models.models.Row). """
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(_ORJSONResponse):
+    """ Default response class: serializes rows, Decimals and datetimes without jsonable_encoder. """
+
+    def render(self, content):
+        return dumps(content)
+
+
+def json_response(content, model=None, status_code=200, headers=None):
+    """
+        Return this from a route to skip FastAPI's response_model validation and
+        jsonable_encoder pass. With DEBUG=true the body is still checked against
+        `model` (e.g. List[PassOptionResponse]), raising if it no longer matches.
+    """
+    response = ORJSONResponse(content, status_code=status_code, headers=headers)
+    if DEBUG and model is not None:
+        parse_obj_as(model, orjson.loads(response.body))
+    return response
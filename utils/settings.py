@@ -1,6 +1,158 @@
+import hashlib
+import hmac
 import os
+from dotenv import load_dotenv
+
+# Services read their settings at import time, before routes/auth.py loads .env
+load_dotenv()
 
 def get_blob_connection_string():
     blob_connection_string = os.getenv("BLOB_CONNECTION_STRING")
     return blob_connection_string
 
+
+def _db_pool_max_sizes():
+    # Pool sizes are per worker process. The server-wide DB_MAX_CONNECTIONS budget is split
+    # evenly across WEB_CONCURRENCY workers, less the connection the spatial index listener
+    # holds, then between the sync and the async pool; a size that is set takes its share first
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    budget = int(os.getenv("DB_MAX_CONNECTIONS", "20")) // workers
+    if os.getenv("SPATIAL_INDEX_ENABLED", "true").lower() == "true":
+        budget -= 1
+    sync_size = os.getenv("DB_POOL_MAX_SIZE")
+    async_size = os.getenv("DB_ASYNC_POOL_MAX_SIZE")
+    if sync_size is None and async_size is None:
+        # Most routes are async, they get the larger half
+        sync_size = budget // 2
+        async_size = budget - sync_size
+    elif sync_size is None:
+        sync_size = budget - int(async_size)
+    elif async_size is None:
+        async_size = budget - int(sync_size)
+    return max(1, int(sync_size)), max(1, int(async_size))
+
+def get_db_pool_settings():
+    max_size = _db_pool_max_sizes()[0]
+    return {
+        "min_size": min(int(os.getenv("DB_POOL_MIN_SIZE", "1")), max_size),
+        "max_size": max_size,
+        "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+        "timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "health_check_interval": float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30")),
+    }
+
+def get_async_db_pool_settings():
+    # Same lifetime and timeout as the sync pool, its own share of the connection budget
+    settings = get_db_pool_settings()
+    max_size = _db_pool_max_sizes()[1]
+    settings.update(min_size=min(int(os.getenv("DB_POOL_MIN_SIZE", "1")), max_size), max_size=max_size)
+    return settings
+
+def get_password_hashing_settings():
+    return {
+        "rounds": int(os.getenv("BCRYPT_ROUNDS", "12")),
+        "max_workers": int(os.getenv("PASSWORD_HASH_CONCURRENCY", str(os.cpu_count() or 1))),
+        "max_queue": int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "256")),
+    }
+
+def get_geocoding_settings():
+    return {
+        "provider": os.getenv("GEOCODING_PROVIDER", "google"),
+        "api_key": os.getenv("GOOGLE_API_KEY"),
+        "cache_size": int(os.getenv("GEOCODING_CACHE_SIZE", "10000")),
+        "max_workers": int(os.getenv("GEOCODING_CONCURRENCY", "8")),
+    }
+
+def get_gym_import_batch_size():
+    return int(os.getenv("GYM_IMPORT_BATCH_SIZE", "500"))
+
+def get_spatial_index_settings():
+    return {
+        "enabled": os.getenv("SPATIAL_INDEX_ENABLED", "true").lower() == "true",
+        "refresh_seconds": float(os.getenv("SPATIAL_INDEX_REFRESH_SECONDS", "300")),
+        "cell_degrees": float(os.getenv("SPATIAL_INDEX_CELL_DEGREES", "0.05")),
+    }
+
+def get_response_cache_settings():
+    # Invalidations only reach every worker through a shared backend
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    return {
+        "backend": os.getenv("RESPONSE_CACHE_BACKEND", "redis" if workers > 1 else "memory"),
+        "workers": workers,
+        "url": os.getenv("RESPONSE_CACHE_URL", "redis://localhost:6379/0"),
+        "ttl": float(os.getenv("RESPONSE_CACHE_TTL", "60")),
+        "max_entries": int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000")),
+    }
+
+def get_qr_render_settings():
+    return {
+        "max_workers": int(os.getenv("QR_RENDER_PROCESSES", "2")),
+        "cache_entries": int(os.getenv("QR_CACHE_MAX_ENTRIES", "2048")),
+    }
+
+def get_qr_signing_settings():
+    # QR_SIGNING_KEYS="kid:secret,kid:secret" - the first key signs, all of them verify
+    keys = {}
+    for entry in os.getenv("QR_SIGNING_KEYS", "").split(","):
+        if entry.strip():
+            kid, _, secret = entry.strip().partition(":")
+            keys[kid] = secret.encode()
+    if not keys:
+        # Not the JWT key itself: a key derived from it and used for nothing else
+        secret_key = os.getenv("SECRET_KEY", "").encode()
+        keys["d"] = hmac.new(secret_key, b"qr-pass", hashlib.sha256).digest() if secret_key else b""
+    empty = [kid for kid, secret in keys.items() if not secret]
+    if empty:
+        # An empty HMAC key would let anyone mint valid passes
+        raise RuntimeError(f"Empty QR signing key {empty[0]!r}: set QR_SIGNING_KEYS or SECRET_KEY")
+    return {
+        "keys": keys,
+        "active_kid": next(iter(keys)),
+        "ttl": int(os.getenv("QR_TOKEN_TTL_SECONDS", "86400")),
+        "accept_unsigned": os.getenv("QR_ACCEPT_UNSIGNED", "false").lower() == "true",
+    }
+
+def get_photo_upload_concurrency():
+    return int(os.getenv("PHOTO_UPLOAD_CONCURRENCY", "4"))
+
+def get_image_settings():
+    return {
+        "max_workers": int(os.getenv("IMAGE_PROCESSES", "2")),
+        "format": os.getenv("IMAGE_VARIANT_FORMAT", "webp").lower(),
+        "quality": int(os.getenv("IMAGE_VARIANT_QUALITY", "80")),
+    }
+
+def get_upload_settings():
+    return {
+        "max_file_bytes": int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(10 * 1024 * 1024))),
+        "max_request_bytes": int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(50 * 1024 * 1024))),
+        "block_size": int(os.getenv("UPLOAD_BLOCK_SIZE", str(4 * 1024 * 1024))),
+    }
+
+def get_token_cache_size():
+    return int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+def get_prepared_statements_enabled():
+    # Turn off behind a transaction-pooling proxy (e.g. PgBouncer) that doesn't keep sessions
+    return os.getenv("DB_PREPARED_STATEMENTS", "true").lower() == "true"
+
+def get_debug():
+    # Validates responses against their response models, too slow for production
+    return os.getenv("DEBUG", "false").lower() == "true"
+
+def get_metrics_settings():
+    # GET /metrics is off unless asked for; a token, when set, turns it on and is required as a bearer token
+    token = os.getenv("METRICS_TOKEN") or None
+    return {
+        "enabled": os.getenv("METRICS_ENABLED", "true" if token else "false").lower() == "true",
+        "token": token,
+    }
+
+def get_sql_trace_settings():
+    return {
+        # Statements slower than this are logged with the route that ran them
+        "slow_query_ms": float(os.getenv("SLOW_QUERY_MS", "200")),
+        # Runs of one statement shape in a single request that are reported as a likely N+1
+        "repeat_threshold": int(os.getenv("SQL_REPEAT_THRESHOLD", "5")),
+        "header": get_debug(),
+    }